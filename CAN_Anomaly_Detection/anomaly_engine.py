@@ -1,28 +1,193 @@
-from autoencoder import CANAutoencoderEngine
-from heuristic_rules import HeuristicEngine
+import io
+import os
+from dataclasses import dataclass
+
+import numpy as np
+
+from findings import NO_FINDINGS, RULE_BIT_RISE
+from frames import FrameBlock, payload_lengths
+from heuristic_rules import MAX_PAYLOAD, HeuristicEngine
+from scorer import create_scorer
+
+
+@dataclass(slots=True)
+class EvaluationResult:
+    ai: bool             # AI reconstruction loss above threshold
+    loss: float          # autoencoder reconstruction loss (MSE)
+    heur: object         # heuristic findings (findings.Findings)
+    byte_errors: object = None  # per-byte squared reconstruction error, np.ndarray[8]
+    risk: float = 0.0    # decayed risk of the ID after this frame (fusion.FusionStage), 0 without fusion
+
+    @property
+    def anomalous(self):
+        return self.ai or bool(self.heur)
 
 
 class AnomalyEngine:
-    def __init__(self, use_ai=True, use_heuristic=True):
+    def __init__(self, use_ai=True, use_heuristic=True, scorer="torch", features=None, scorer_options=None):
         self.use_ai = use_ai
         self.use_heuristic = use_heuristic
-        self.ai = CANAutoencoderEngine()
+        self.scorer = scorer  # AI backend, see scorer.SCORERS
+        self.features = features  # features.FeaturePipeline of a new model, None for the default
+        self.scorer_options = scorer_options or {}  # e.g. partition, model_cache
+        self._ai = None
         self.heuristic = HeuristicEngine()
+        self.online = None  # online.OnlineAdapter, see enable_online()
+        self.fusion = None  # fusion.FusionStage, see enable_fusion()
+
+    @property
+    def ai(self):
+        """The AI scorer, created on first use (heuristic-only runs never import its backend)"""
+        if self._ai is None:
+            self._ai = create_scorer(self.scorer, features=self.features, **self.scorer_options)
+        return self._ai
+
+    @ai.setter
+    def ai(self, scorer):
+        self._ai = scorer
 
     def train_ai(self, messages):
         if self.use_ai:
-            self.ai.train(messages)
+            return self.ai.train(messages)
+        return None
 
-    def evaluate(self, msg):
-        result = {
-            "ai": False,
-            "heur": [],
-        }
+    def train(self, messages):
+        """One streaming pass over normal traffic: autoencoder training and cycle-time learning"""
+        if not self.use_ai:
+            self.heuristic.learn_stream(messages)
+            return None
+        on_block = self.heuristic.learn_batch if self.use_heuristic else None
+        return self.ai.train(messages, on_block=on_block)
+
+    def enable_online(self, **options):
+        """Start online learning on frames judged normal (options: see online.OnlineAdapter).
+
+        Call before forking: forks share the adapter and its weight updates.
+        """
+        from online import OnlineAdapter  # imports torch
+
+        self.online = OnlineAdapter(self.ai, **options).start()
+        self.ai.online = self.online
+        return self.online
+
+    def disable_online(self):
+        if self.online is not None:
+            self.online.stop()
+            self.online = None
+
+    def enable_fusion(self, **options):
+        """Combine AI and heuristic verdicts into per-ID risk and incidents (options: see fusion.FusionStage).
+
+        Call before forking: forks feed the same stage, so it sees every ID.
+        """
+        from fusion import FusionStage
 
+        self.fusion = FusionStage(**options)
+        return self.fusion
+
+    @staticmethod
+    def heuristic_state_path(path):
+        return os.path.splitext(path)[0] + ".heur.npz"
+
+    def save_model(self, path="model.pth"):
+        """Autoencoder checkpoint at `path`, learned heuristic state next to it"""
+        if self.use_ai:
+            self.ai.save_model(path)
+        self.heuristic.save_state(self.heuristic_state_path(path))
+
+    def load_model(self, path="model.pth"):
         if self.use_ai:
-            result["ai"] = self.ai.is_anomalous(msg)
+            self.ai.load_model(path)
+        heuristic_path = self.heuristic_state_path(path)
+        if os.path.exists(heuristic_path):
+            self.heuristic.load_state(heuristic_path)
+
+    def fork(self):
+        """Engine for another detector thread: shares the autoencoder, has its own heuristic and feature state"""
+        engine = AnomalyEngine(self.use_ai, self.use_heuristic, self.scorer, self.features, self.scorer_options)
+        engine.ai = self._ai.fork() if self._ai is not None else None
+        engine.online = self.online
+        engine.fusion = self.fusion
+        state = io.BytesIO()
+        self.heuristic.save_state(state)
+        state.seek(0)
+        engine.heuristic.load_state(state)
+        return engine
+
+    def evaluate(self, msg):
+        if self.online is not None or self.fusion is not None:
+            # Online learning and risk fusion work on blocks: the same path as evaluate_batch()
+            return self.evaluate_batch([msg])[0]
+        ai = False
+        loss = 0.0
+        byte_errors = None
+        if self.use_ai and self.ai.trained:
+            loss, byte_errors = self.ai.score(msg)
+            ai = loss > self.ai.threshold_for(msg.arbitration_id)
+
+        heur = self.heuristic.check(msg) if self.use_heuristic else NO_FINDINGS
+        return EvaluationResult(ai, loss, heur, byte_errors)
+
+    def poll(self, now):
+        """Findings that are not tied to a frame (IDs that went silent), see HeuristicEngine.poll"""
+        if not self.use_heuristic:
+            return NO_FINDINGS
+        findings = self.heuristic.poll(now)
+        if self.fusion is not None and findings:
+            self.fusion.update_findings(now, findings)
+        return findings
+
+    def evaluate_batch(self, messages):
+        """Batch variant of evaluate(): one AI forward pass for the whole list"""
+        if not isinstance(messages, (list, tuple)):
+            messages = list(messages)
+
+        block = FrameBlock.from_messages(messages)
+        if self.use_ai and self.ai.trained:
+            x, losses, byte_errors = self.ai.score_block(block)
+            thresholds = self.ai.thresholds_for(block.arbitration_id)
+            anomalous = losses > thresholds
+            flags = anomalous.tolist()
+        else:
+            losses = np.zeros(len(messages), dtype=np.float32)
+            thresholds = None
+            anomalous = np.zeros(len(messages), dtype=bool)
+            byte_errors = None
+            flags = [False] * len(messages)
+        loss_values = losses.tolist()
 
         if self.use_heuristic:
-            result["heur"] = self.heuristic.check(msg)
+            # Real payload lengths (remote frames have none) and, with CAN FD, all 64 bytes,
+            # so the rules see the same payloads as check()
+            lengths = payload_lengths(messages)
+            wide = len(messages) and lengths.max() > block.data.shape[1]
+            heuristics = self.heuristic.check_batch(
+                FrameBlock.from_messages(messages, MAX_PAYLOAD) if wide else block, lengths)
+        else:
+            heuristics = [NO_FINDINGS] * len(messages)
+
+        if self.online is not None and self.use_ai and self.ai.trained:
+            # Bit rises are flagged on almost every frame of normal traffic; only the other
+            # rules (timing, DM1 faults) keep a frame out of the training rows
+            normal = ~anomalous
+            if self.use_heuristic:
+                rows, rules = heuristics.columns()[:2]
+                normal[rows[rules != RULE_BIT_RISE]] = False
+            self.online.observe(x[normal])
+
+        if self.fusion is not None:
+            ratio = losses / thresholds if thresholds is not None else losses
+            risk = self.fusion.update(block, anomalous, ratio, heuristics).tolist()
+        else:
+            risk = [0.0] * len(messages)
 
-        return result
+        results = []
+        for i, heur in enumerate(heuristics):
+            results.append(EvaluationResult(
+                flags[i],
+                loss_values[i],
+                heur,
+                byte_errors[i] if byte_errors is not None else None,
+                risk[i],
+            ))
+        return results
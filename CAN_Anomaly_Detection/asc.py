@@ -0,0 +1,30 @@
+import io
+from itertools import islice
+
+import can
+
+
+def read_header(f):
+    """Header lines that ASCReader needs (date, base) to parse a piece from the middle of the file"""
+    lines = []
+    for line in islice(f, 64):
+        text = line.strip().lower()
+        if text.startswith(("date", "base")):
+            lines.append(line)
+    lines.append("no internal events logged\n")
+    return "".join(lines)
+
+
+def read_range(path, start, stop):
+    """Frames of the lines that start in bytes [start, stop) of an ASC file"""
+    with open(path, encoding="utf-8", errors="replace") as f:
+        header = read_header(f)
+    with open(path, "rb") as f:
+        if start > 0:
+            f.seek(start - 1)
+            f.readline()  # the line crossing `start` belongs to the previous range
+        chunk = f.read(max(stop - f.tell(), 0))
+        if chunk and not chunk.endswith(b"\n"):
+            chunk += f.readline()
+    text = header + chunk.decode("utf-8", errors="replace")
+    yield from can.ASCReader(io.StringIO(text))
@@ -1,8 +1,23 @@
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import torch
 import torch.nn as nn
 import torch.optim as optim
 import numpy as np
 
+from features import FeaturePipeline
+from frames import iter_blocks
+from metrics import peak_rss_mb
+from model_registry import ModelRegistry, group_rows, models_path, partition_keys
+from numpy_scorer import WEIGHT_NAMES, weights_path
+from scorer import ReconstructionScorer
+
 class CANAutoencoder(nn.Module):
     def __init__(self, input_size=10, hidden_size=16):
         super(CANAutoencoder, self).__init__()
@@ -22,48 +37,272 @@ class CANAutoencoder(nn.Module):
         decoded = self.decoder(encoded)
         return decoded
 
-class CANAutoencoderEngine:
-    def __init__(self, threshold=0.1, device='cpu'):
-        self.device = device
-        self.model = CANAutoencoder().to(self.device)
-        self.threshold = threshold
-        self.trained = False
+def _linear_layers(model):
+    return model.encoder[0], model.encoder[2], model.decoder[0], model.decoder[2]
 
-    def preprocess(self, msg):
-        vec = [msg.arbitration_id / 2048.0, msg.dlc / 8.0] + [b / 255.0 for b in msg.data] + [0.0] * (8 - len(msg.data))
-        return torch.tensor(vec[:10], dtype=torch.float32).to(self.device)
 
-    def train(self, messages, epochs=10, lr=0.001):
-        self.model.train()
-        optimizer = optim.Adam(self.model.parameters(), lr=lr)
-        loss_fn = nn.MSELoss()
-        data = torch.stack([self.preprocess(msg) for msg in messages])
-        for epoch in range(epochs):
-            output = self.model(data)
-            loss = loss_fn(output, data)
+def model_weights(model):
+    """Layer weights and biases of a CANAutoencoder as NumPy arrays, named as in the .npz export"""
+    arrays = []
+    for layer in _linear_layers(model):
+        arrays += [layer.weight.detach().cpu().numpy(), layer.bias.detach().cpu().numpy()]
+    return dict(zip(WEIGHT_NAMES, arrays))
+
+
+def load_weights(model, weights):
+    """Inverse of model_weights()"""
+    arrays = [torch.from_numpy(np.asarray(weights[name], dtype=np.float32)) for name in WEIGHT_NAMES]
+    with torch.no_grad():
+        for i, layer in enumerate(_linear_layers(model)):
+            layer.weight.copy_(arrays[2 * i])
+            layer.bias.copy_(arrays[2 * i + 1])
+    return model
+
+
+def fit(model, data, epochs, lr, batch_size, rng, pause=0.0, optimizer=None, device=None):
+    """Shuffled mini-batch passes over the feature rows `data`; returns the last loss.
+
+    `pause` seconds of sleep after every step leave the GIL (and the core) to other threads.
+    An `optimizer` passed in keeps its state across calls (streaming training chunk by chunk).
+    """
+    optimizer = optimizer or optim.Adam(model.parameters(), lr=lr)
+    loss_fn = nn.MSELoss()
+    loss = None
+    model.train()
+    for epoch in range(epochs):
+        order = rng.permutation(len(data))
+        for i in range(0, len(order), batch_size):
+            batch = torch.from_numpy(data[order[i:i + batch_size]])
+            if device is not None:
+                batch = batch.to(device)
+            loss = loss_fn(model(batch), batch)
             optimizer.zero_grad()
             loss.backward()
             optimizer.step()
-        self.trained = True
+            if pause:
+                time.sleep(pause)
+    model.eval()
+    return loss
+
+
+def train_partition(task):
+    """Worker: the shared model fine-tuned on the sampled feature rows of one key"""
+    key, data, state, epochs, lr, batch_size, seed = task
+    model = CANAutoencoder(input_size=data.shape[1])
+    model.load_state_dict(state)
+    fit(model, data, epochs, lr, batch_size, np.random.default_rng([seed, key]))
+    return key, model_weights(model)
+
+
+def _init_partition_worker():
+    torch.set_num_threads(1)  # one process per core already
+
+
+class PartitionSamples:
+    """Reservoir sample of at most `capacity` feature rows (and their IDs) per model key"""
+
+    def __init__(self, partition, n_features, capacity):
+        self.partition = partition
+        self.capacity = capacity
+        self.dtype = np.dtype([("x", np.float32, (n_features,)), ("id", np.int64)])
+        self.samples = {}  # key → [rows, filled, seen]
+
+    def add(self, ids, x, rng):
+        rows = np.empty(len(x), dtype=self.dtype)
+        rows["x"] = x
+        rows["id"] = ids
+        for key, index in group_rows(partition_keys(self.partition, ids)):
+            entry = self.samples.get(key)
+            if entry is None:
+                entry = self.samples[key] = [np.empty(self.capacity, dtype=self.dtype), 0, 0]
+            reservoir, filled, seen = entry
+            entry[1] = CANAutoencoderEngine._update_reservoir(reservoir, filled, seen, rows[index], rng)
+            entry[2] = seen + len(index)
+
+    def items(self):
+        for key, (reservoir, filled, seen) in self.samples.items():
+            yield key, reservoir[:filled]
+
+
+class CANAutoencoderEngine(ReconstructionScorer):
+    """Torch backend: trains and runs CANAutoencoder"""
+
+    def __init__(self, threshold=0.1, device='cpu', per_id_thresholds=True, sigma=4.0, min_samples=30,
+                 features=None, partition=None, model_cache=256):
+        super().__init__(threshold, per_id_thresholds, sigma, min_samples, features, partition, model_cache)
+        self.device = device
+        self._build_model()
 
-    def is_anomalous(self, msg):
-        if not self.trained:
-            return False
+    def _build_model(self):
+        self.model = CANAutoencoder(input_size=self.n_features).to(self.device)
         self.model.eval()
-        with torch.no_grad():
-            x = self.preprocess(msg)
-            output = self.model(x)
-            loss = nn.functional.mse_loss(output, x)
-            return loss.item() > self.threshold
+
+    def preprocess(self, msg):
+        return self.preprocess_batch([msg])[0]
+
+    def preprocess_batch(self, frames):
+        return torch.from_numpy(self.features(frames)).to(self.device)
+
+    def train(self, messages, epochs=10, lr=0.001, batch_size=256, chunk_size=16384,
+              reservoir_size=16384, seed=0, on_block=None, samples_per_model=2048, model_epochs=20,
+              model_batch_size=32, workers=None, models_dir=None):
+        """Streaming mini-batch training over any iterable of frames, e.g. CANReader.read().
+
+        The log is consumed in chunks of `chunk_size` frames. Each chunk is trained for
+        `epochs` shuffled passes together with a reservoir sample of everything seen so
+        far, so memory stays bounded by chunk_size + reservoir_size feature rows.
+        After its epochs every chunk is scored once to update the per-ID loss statistics.
+        `on_block(block)` is called for every chunk, so other learners can share the pass.
+
+        With a partition, the same pass also keeps a reservoir of `samples_per_model`
+        rows per ID/PGN. Afterwards a copy of the shared model is fine-tuned for every
+        key with at least min_samples rows (`model_epochs` passes), in `workers`
+        processes, and written to `models_dir` (a temporary directory until save_model()).
+        Returns throughput and peak RSS statistics.
+        """
+        rng = np.random.default_rng(seed)
+        optimizer = optim.Adam(self.model.parameters(), lr=lr)
+        reservoir = np.empty((reservoir_size, self.n_features), dtype=np.float32)
+        samples = PartitionSamples(self.partition, self.n_features, samples_per_model) if self.partition else None
+        self.models = None
+        self._reset_id_stats()
+        self.pipeline.reset()
+        filled = 0
+        seen = 0
+        steps = 0
+        loss = None
+
+        start = time.perf_counter()
+        for block in iter_blocks(messages, chunk_size):
+            if on_block is not None:
+                on_block(block)
+            x = self.features(block)
+            data = np.concatenate((x, reservoir[:filled]))
+            loss = fit(self.model, data, epochs, lr, batch_size, rng, optimizer=optimizer, device=self.device)
+            steps += epochs * -(-len(data) // batch_size)
+            self._update_id_stats(block.arbitration_id, self._losses(x))
+            filled = self._update_reservoir(reservoir, filled, seen, x, rng)
+            if samples is not None:
+                samples.add(block.arbitration_id, x, rng)
+            seen += len(x)
+        if samples is not None:
+            self._train_partitions(samples, model_epochs, lr, model_batch_size, seed, workers, models_dir)
+        self._refresh_id_thresholds()
+        self.trained = seen > 0 or self.trained
+
+        elapsed = time.perf_counter() - start
+        self.train_stats = {
+            "frames": seen,
+            "steps": steps,
+            "seconds": elapsed,
+            "frames_per_s": seen / elapsed if elapsed > 0 else 0.0,
+            "loss": loss.item() if loss is not None else None,
+            "models": len(self.models) if self.models is not None else 0,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        return self.train_stats
+
+    def _train_partitions(self, samples, epochs, lr, batch_size, seed, workers, models_dir):
+        """Specialised models for the sampled keys, then per-ID loss statistics from them"""
+        self.models = ModelRegistry(models_dir or tempfile.mkdtemp(prefix="can_models_"),
+                                    self.partition, self.model_cache)
+        state = {name: value.cpu() for name, value in self.model.state_dict().items()}
+        tasks = [(key, np.ascontiguousarray(rows["x"]), state, epochs, lr, batch_size, seed)
+                 for key, rows in samples.items() if len(rows) >= self.min_samples]
+        workers = workers or os.cpu_count()
+        if workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_partition_worker,
+                                     mp_context=multiprocessing.get_context("spawn")) as executor:
+                for key, weights in executor.map(train_partition, tasks, chunksize=max(1, len(tasks) // (4 * workers))):
+                    self.models.save(key, weights)
+        else:
+            for key, weights in map(train_partition, tasks):
+                self.models.save(key, weights)
+
+        # Thresholds must come from the losses of the model that will score the ID
+        self._reset_id_stats()
+        for key, rows in samples.items():
+            self._update_id_stats(rows["id"], self._errors(rows["id"], rows["x"]).mean(axis=1))
+
+    @staticmethod
+    def _update_reservoir(reservoir, filled, seen, rows, rng):
+        """Vectorised reservoir sampling (algorithm R) of `rows` into `reservoir`"""
+        capacity = len(reservoir)
+        free = min(capacity - filled, len(rows))
+        reservoir[filled:filled + free] = rows[:free]
+        rest = rows[free:]
+        if len(rest):
+            positions = seen + free + np.arange(len(rest))
+            slots = (rng.random(len(rest)) * (positions + 1)).astype(np.int64)
+            keep = slots < capacity
+            reservoir[slots[keep]] = rest[keep]
+        return filled + free
+
+    def _squared_errors(self, x):
+        model = self.model  # may be swapped by online learning between batches
+        with torch.inference_mode():
+            xt = torch.from_numpy(x).to(self.device)
+            return ((model(xt) - xt) ** 2).cpu().numpy()
+
+    def prepare_weights(self, weights):
+        model = load_weights(CANAutoencoder(input_size=self.n_features), weights).to(self.device)
+        model.eval()
+        return model
+
+    def _install(self, prepared):
+        self.model = prepared
+
+    def weights(self):
+        """Layer weights and biases as NumPy arrays, named as in the .npz export"""
+        return model_weights(self.model)
+
+    def export_npz(self, path):
+        """Weights-only copy of the model for the NumPy backend (no pickle, no torch needed to load)"""
+        np.savez(path, threshold=self.threshold, sigma=self.sigma, features=json.dumps(self.pipeline.config()),
+                 partition=self._saved_partition(), **self.weights(), **self.id_state())
+
+    def export_onnx(self, path):
+        """Network as ONNX: input "features" (n, n_features), output "reconstruction". Needs the onnx package."""
+        torch.onnx.export(self.model, torch.zeros(1, self.n_features), path,
+                          input_names=["features"], output_names=["reconstruction"],
+                          dynamic_axes={"features": {0: "n"}, "reconstruction": {0: "n"}})
+
+    def _saved_partition(self):
+        return self.partition if self.models is not None else ""
 
     def save_model(self, path="model.pth"):
-        torch.save({
+        """Torch checkpoint at `path`, its weights-only .npz export and the specialised models next to it"""
+        checkpoint = {
             "model_state": self.model.state_dict(),
-            "threshold": self.threshold
-        }, path)
+            "threshold": self.threshold,
+            "sigma": self.sigma,
+            "features": self.pipeline.config(),
+            "partition": self._saved_partition(),
+        }
+        checkpoint.update({name: torch.from_numpy(values) for name, values in self.id_state().items()})
+        torch.save(checkpoint, path)
+        self.export_npz(weights_path(path))
+        if self.models is not None:
+            self._copy_models(models_path(path))
+
+    def _copy_models(self, directory):
+        if os.path.abspath(directory) == os.path.abspath(self.models.directory):
+            return
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            if name.endswith(".npz"):  # models of an earlier save
+                os.remove(os.path.join(directory, name))
+        for key in self.models.keys:
+            shutil.copyfile(self.models.path(key), os.path.join(directory, os.path.basename(self.models.path(key))))
 
     def load_model(self, path="model.pth"):
         checkpoint = torch.load(path, map_location=self.device)
+        self.pipeline = FeaturePipeline.from_config(checkpoint.get("features"))
+        self._build_model()
         self.model.load_state_dict(checkpoint["model_state"])
         self.threshold = checkpoint.get("threshold", 0.05)
-        self.trained = True
\ No newline at end of file
+        self.sigma = checkpoint.get("sigma", self.sigma)
+        self.load_id_state({name: checkpoint[name].numpy() for name in self.id_state() if name in checkpoint})
+        self._open_models(path, checkpoint.get("partition"))
+        self.model.eval()
+        self.trained = True
@@ -0,0 +1,511 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import can
+import numpy as np
+
+import blf
+from anomaly_engine import AnomalyEngine
+from can_input import CANReader
+from features import DEFAULT_DEFINITIONS, load_definitions
+from frame_store import convert
+from frames import FrameBlock, payload_lengths
+from heuristic_rules import MAX_PAYLOAD, HeuristicEngine
+from metrics import LatencyWindow, peak_rss_mb, rss_mb
+from pipeline import BLOCK, DetectionPipeline
+from traffic import ATTACKS, add_attack, generate
+
+# A handful of cyclic J1939 frames (EEC1, ET1, CCVS, ...) sent by a few source addresses
+SYNTHETIC_IDS = [0x0CF00400, 0x18FEEE00, 0x18FEF100, 0x18FEF200, 0x18FEE900, 0x18FEF500, 0x18FECA03]
+
+
+def synthetic_frames(count, seed=0):
+    """Generate `count` J1939-like frames at ~4000 frames/s (500 kbit/s bus load)"""
+    rng = random.Random(seed)
+    counters = {arb_id: 0 for arb_id in SYNTHETIC_IDS}
+    timestamp = 0.0
+    frames = []
+    for _ in range(count):
+        arb_id = rng.choice(SYNTHETIC_IDS)
+        counters[arb_id] = (counters[arb_id] + 1) & 0xFF
+        data = bytes([counters[arb_id], 0x7D, rng.randrange(0x40, 0x48), 0x00, 0xFF, 0xFF, 0xFF, 0xFF])
+        timestamp += 0.00025
+        frames.append(can.Message(timestamp=timestamp, arbitration_id=arb_id, data=data, is_extended_id=True))
+    return frames
+
+
+def bench_batch_sizes(frames, batch_sizes, use_heuristic):
+    engine = AnomalyEngine(use_ai=True, use_heuristic=use_heuristic)
+    engine.train_ai(frames[:10000])
+
+    print(f"{'batch':>8} {'score_batch fr/s':>18} {'evaluate_batch fr/s':>21}")
+    for size in batch_sizes:
+        start = time.perf_counter()
+        for i in range(0, len(frames), size):
+            engine.ai.score_batch(frames[i:i + size])
+        score_rate = len(frames) / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for i in range(0, len(frames), size):
+            engine.evaluate_batch(frames[i:i + size])
+        evaluate_rate = len(frames) / (time.perf_counter() - start)
+
+        print(f"{size:>8} {score_rate:>18.0f} {evaluate_rate:>21.0f}")
+
+    start = time.perf_counter()
+    for msg in frames:
+        engine.evaluate(msg)
+    print(f"{'evaluate':>8} {len(frames) / (time.perf_counter() - start):>40.0f}")
+
+
+def bench_backends(frames, batch_sizes, model_path):
+    """score_batch throughput of the torch and NumPy backends on the same weights"""
+    engines = {name: AnomalyEngine(use_heuristic=False, scorer=name) for name in ("torch", "numpy")}
+    engines["torch"].train_ai(frames[:10000])
+    engines["torch"].save_model(model_path)
+    engines["numpy"].load_model(model_path)
+
+    losses = [engine.ai.score_batch(frames[:10000])[0] for engine in engines.values()]
+    print(f"maks. względna różnica strat: {abs(losses[0] - losses[1]).max() / max(losses[0].max(), 1e-12):.2e}")
+    print(f"{'batch':>8}" + "".join(f"{name + ' fr/s':>16}" for name in engines))
+    for size in batch_sizes:
+        count = min(len(frames), 2000 * size)
+        rates = []
+        for engine in engines.values():
+            start = time.perf_counter()
+            for i in range(0, count, size):
+                engine.ai.score_batch(frames[i:i + size])
+            rates.append(count / (time.perf_counter() - start))
+        print(f"{size:>8}" + "".join(f"{rate:>16.0f}" for rate in rates))
+
+
+def synthetic_stream(count, seed=0, chunk=10000):
+    """Like synthetic_frames(), but generated lazily so the whole log never sits in memory"""
+    for offset in range(0, count, chunk):
+        frames = synthetic_frames(min(chunk, count - offset), seed + offset)
+        for msg in frames:
+            msg.timestamp += offset * 0.00025
+        yield from frames
+
+
+def bench_training(count, epochs, chunk_size):
+    engine = AnomalyEngine(use_ai=True, use_heuristic=False)
+    stats = engine.ai.train(synthetic_stream(count), epochs=epochs, chunk_size=chunk_size)
+    print(f"frames={stats['frames']} steps={stats['steps']} "
+          f"{stats['frames_per_s']:.0f} fr/s, loss={stats['loss']:.5f}, "
+          f"peak RSS={stats['peak_rss_mb'] or 0:.0f} MB")
+
+
+def bench_heuristics(frames, block_size):
+    # Findings buffers big enough to format everything at the end
+    capacity = 16 * len(frames)
+
+    start = time.perf_counter()
+    engine = HeuristicEngine(findings_capacity=capacity)
+    expected = [engine.check(msg) for msg in frames]
+    per_frame = time.perf_counter() - start
+
+    chunks = [frames[i:i + block_size] for i in range(0, len(frames), block_size)]
+    blocks = [(FrameBlock.from_messages(chunk, MAX_PAYLOAD), payload_lengths(chunk)) for chunk in chunks]
+    start = time.perf_counter()
+    engine = HeuristicEngine(findings_capacity=capacity)
+    batches = [engine.check_batch(block, lengths) for block, lengths in blocks]
+    batch = time.perf_counter() - start
+
+    print(f"per-frame: {len(frames) / per_frame:>12.0f} fr/s")
+    print(f"batch:     {len(frames) / batch:>12.0f} fr/s  ({per_frame / batch:.1f}x, bloki po {block_size})")
+    same = [r.format() for b in batches for r in b] == [e.format() for e in expected]
+    print("wyniki identyczne" if same else "RÓŻNE WYNIKI!")
+
+
+# Fresh interpreter: import, build the engine, score one frame, report peak RSS and whether torch got loaded
+STARTUP_SCENARIOS = {
+    "heurystyki": "AnomalyEngine(use_ai=False)",
+    "torch": "AnomalyEngine(scorer='torch')",
+    "numpy": "AnomalyEngine(scorer='numpy')",
+}
+STARTUP_SCRIPT = """
+import sys, can
+import blf
+from anomaly_engine import AnomalyEngine
+from metrics import peak_rss_mb
+engine = {engine}
+engine.evaluate_batch([can.Message(arbitration_id=0x100, data=bytes(8))])
+print(peak_rss_mb(), "torch" in sys.modules)
+"""
+
+
+def bench_startup(repeats):
+    here = os.path.dirname(os.path.abspath(__file__))
+    print(f"{'tryb':>12} {'start [s]':>10} {'RSS [MB]':>10} {'torch':>6}")
+    for name, engine in STARTUP_SCENARIOS.items():
+        script = STARTUP_SCRIPT.format(engine=engine)
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            result = subprocess.run([sys.executable, "-c", script], cwd=here, capture_output=True, text=True)
+            times.append(time.perf_counter() - start)
+            if result.returncode != 0:
+                print(f"{name:>12} błąd: {result.stderr.strip().splitlines()[-1]}")
+                break
+        else:
+            rss, torch_loaded = result.stdout.split()
+            print(f"{name:>12} {statistics.median(times):>10.2f} {float(rss):>10.0f} {torch_loaded:>6}")
+
+
+# Detector configurations of the replay benchmark: (use_ai, use_heuristic)
+REPLAY_ENGINES = {"heuristic": (False, True), "ai": (True, False), "both": (True, True)}
+REPLAY_PATHS = ("memory", "virtual", "blf", "asc", "frames")
+
+
+class MemoryReader:
+    """Frames from a list, i.e. the detection pipeline without any input overhead"""
+
+    def __init__(self, messages):
+        self.messages = messages
+
+    def read(self):
+        return iter(self.messages)
+
+
+def replay_traffic(args):
+    """(training part, test part with attacks) of one synthetic recording"""
+    definitions = load_definitions(args.definitions)
+    traffic = generate(definitions, args.train_duration + args.duration, args.ids, seed=args.seed)
+    # Attacks are spread evenly over the test part, each on a random ID
+    spacing = args.duration / (len(args.attacks) + 1)
+    for k, kind in enumerate(args.attacks):
+        start = args.train_duration + (k + 1) * spacing - args.attack_duration / 2
+        traffic = add_attack(traffic, kind, start, args.attack_duration, seed=args.seed + k + 1)
+    cut = int(np.searchsorted(traffic.timestamp, args.train_duration))
+    return traffic.part(0, cut), traffic.part(cut)
+
+
+def ordinal_keys(ids):
+    """(ID << 32) | n for the n-th frame of every ID: identifies a frame across readers that keep per-ID order"""
+    ids = np.asarray(ids, dtype=np.uint64)
+    order = np.argsort(ids, kind="stable")
+    sorted_ids = ids[order]
+    first = np.ones(len(ids), dtype=bool)
+    first[1:] = sorted_ids[1:] != sorted_ids[:-1]
+    starts = np.flatnonzero(first)
+    ordinal = np.empty(len(ids), dtype=np.uint64)
+    ordinal[order] = np.arange(len(ids)) - np.repeat(starts, np.diff(np.append(starts, len(ids))))
+    return (ids << np.uint64(32)) | ordinal
+
+
+def detection_scores(test, ids, flags):
+    """Precision/recall of the anomaly flags of the scored frames against the attack labels"""
+    expected = ordinal_keys(test.arbitration_id)
+    order = np.argsort(expected)
+    keys = ordinal_keys(ids)
+    pos = np.minimum(np.searchsorted(expected, keys, sorter=order), len(order) - 1)
+    matched = expected[order[pos]] == keys
+    label = np.zeros(len(keys), dtype=np.uint8)
+    label[matched] = test.label[order[pos[matched]]]
+
+    attack = label > 0
+    tp = int(np.count_nonzero(flags & attack))
+    fp = int(np.count_nonzero(flags & ~attack))
+    fn = int(np.count_nonzero(test.label > 0)) - tp
+    scores = {"tp": tp, "fp": fp, "fn": fn, "lost": len(test) - int(np.count_nonzero(matched)),
+              "precision": tp / (tp + fp) if tp + fp else None, "recall": tp / (tp + fn) if tp + fn else None}
+    scores["recall_by_attack"] = {
+        kind: float(np.count_nonzero(flags & (label == code)) / np.count_nonzero(test.label == code))
+        for kind, code in ATTACKS.items() if np.count_nonzero(test.label == code)
+    }
+    return scores
+
+
+def send_virtual(messages, channel, speed, done):
+    """Put the frames on a python-can virtual bus; `speed` 1 is real time, 0 as fast as possible"""
+    with can.Bus(interface="virtual", channel=channel, preserve_timestamps=True) as bus:
+        start = time.perf_counter()
+        first = messages[0].timestamp if messages else 0.0
+        for msg in messages:
+            if speed:
+                delay = (msg.timestamp - first) / speed - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            bus.send(msg)
+        done.wait()
+        # Wake the reader blocked in recv(), so it sees the pipeline stop
+        bus.send(can.Message(arbitration_id=0, is_extended_id=True))
+
+
+def replay_readers(path, test, messages, files, args):
+    if path == "memory":
+        return [MemoryReader(messages)], None
+    if path == "virtual":
+        channel = f"benchmark-{os.getpid()}-{time.monotonic_ns()}"
+        reader = CANReader(source="interface", interface="virtual", channel=channel,
+                           bus_options={"preserve_timestamps": True})
+        done = threading.Event()
+        sender = threading.Thread(target=send_virtual, args=(messages, channel, args.speed, done), daemon=True)
+        return [reader], (sender, done)
+    if path not in files:
+        log = os.path.join(files["dir"], "test.asc" if path == "asc" else "test.blf")
+        if not os.path.exists(log):
+            test.save(log)
+        files[path] = convert(log, os.path.join(files["dir"], "test.frames")) if path == "frames" else log
+    return [CANReader(source="file", filepath=files[path])], None
+
+
+def replay_run(engine, path, test, messages, files, args):
+    """One pass of the test traffic through the DetectionPipeline; returns the run's measurements"""
+    readers, sender = replay_readers(path, test, messages, files, args)
+    pipeline = DetectionPipeline(engine, readers, batch_size=args.batch_size, workers=args.workers,
+                                 frame_policy=BLOCK, result_policy=BLOCK)
+    pipeline.latency = LatencyWindow(max(len(test), 1))  # keep every sample, not only the most recent ones
+    ids = []
+    flags = []
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    pipeline.start()
+    if sender is not None:
+        sender[0].start()
+    while pipeline.running or not pipeline.results.finished:
+        for batch, results in pipeline.results.get_batch(pipeline.results.capacity, timeout=0.1):
+            if batch is None:
+                continue  # IDs that went silent: no frame to score
+            ids.extend(msg.arbitration_id for msg in batch)
+            flags.extend(result.anomalous for result in results)
+        if sender is not None and pipeline.processed >= len(test) and not sender[1].is_set():
+            # Everything sent was scored; the reader blocks on the bus until the sender wakes it
+            pipeline.stop()
+            sender[1].set()
+    seconds = time.perf_counter() - start
+    if sender is not None:
+        sender[0].join()
+        readers[0].bus.shutdown()
+
+    p50, p99 = pipeline.latency.percentiles((50, 99))
+    return {
+        "frames": len(ids),
+        "seconds": seconds,
+        "frames_per_s": len(ids) / seconds,
+        "latency_ms": {"p50": p50 * 1000, "p99": p99 * 1000},
+        "rss_mb": rss_mb(),
+        "rss_growth_mb": None if rss_before is None else rss_mb() - rss_before,
+        "peak_rss_mb": peak_rss_mb(),
+        "detection": detection_scores(test, np.array(ids, dtype=np.uint32), np.array(flags, dtype=bool)),
+    }
+
+
+def git_commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def compare_replay(previous, current):
+    """Throughput and p99 of the runs present in both result files"""
+    old = {(run["engine"], run["path"]): run for run in previous["runs"]}
+    print(f"{'silnik':>10} {'wejście':>8} {'fr/s przed':>12} {'fr/s teraz':>12} {'p99 przed':>10} {'p99 teraz':>10}")
+    for run in current["runs"]:
+        before = old.get((run["engine"], run["path"]))
+        if before is not None:
+            print(f"{run['engine']:>10} {run['path']:>8} {before['frames_per_s']:>12.0f} {run['frames_per_s']:>12.0f} "
+                  f"{before['latency_ms']['p99']:>10.2f} {run['latency_ms']['p99']:>10.2f}")
+
+
+def bench_replay(args):
+    train_part, test = replay_traffic(args)
+    messages = list(test.messages())
+    print(f"ruch: {len(train_part.periods)} ID, uczenie {len(train_part)} ramek, test {len(test)} ramek "
+          f"(atakowanych {int(np.count_nonzero(test.label))})", file=sys.stderr)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model = args.model
+        if model is None:
+            print("Uczenie...", file=sys.stderr)
+            model = os.path.join(tmp, "model.pth")
+            trainer = AnomalyEngine(use_ai=args.engines != ["heuristic"])
+            trainer.train(train_part.messages())
+            trainer.save_model(model)
+
+        files = {"dir": tmp}
+        runs = []
+        for name in args.engines:
+            use_ai, use_heuristic = REPLAY_ENGINES[name]
+            for path in args.paths:
+                engine = AnomalyEngine(use_ai=use_ai, use_heuristic=use_heuristic, scorer=args.scorer)
+                engine.load_model(model)
+                run = {"engine": name, "path": path, **replay_run(engine, path, test, messages, files, args)}
+                runs.append(run)
+                detection = run["detection"]
+                print(f"{name:>10} {path:>8}: {run['frames_per_s']:>9.0f} fr/s, "
+                      f"p50 {run['latency_ms']['p50']:.2f} ms, p99 {run['latency_ms']['p99']:.2f} ms, "
+                      f"RSS {run['rss_mb'] or 0:.0f} MB, precyzja {detection['precision'] or 0:.3f}, "
+                      f"czułość {detection['recall'] or 0:.3f}", file=sys.stderr)
+
+    result = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("command", "out", "compare")},
+        "traffic": {"ids": len(test.periods), "train_frames": len(train_part), "test_frames": len(test),
+                    "attack_frames": int(np.count_nonzero(test.label))},
+        "runs": runs,
+    }
+    out = args.out or f"replay_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"Wyniki zapisane do {out}", file=sys.stderr)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare_replay(json.load(f), result)
+
+
+def write_blf(path, size_mb, seed=0):
+    """Synthetic J1939 BLF of about `size_mb` MB (traffic of 60 s repeated with shifted timestamps)"""
+    traffic = generate(load_definitions(DEFAULT_DEFINITIONS), 60.0, seed=seed)
+    messages = list(traffic.messages())
+    with can.BLFWriter(path) as writer:
+        offset = 0.0
+        while True:
+            for msg in messages:
+                msg.timestamp += offset
+                writer.on_message_received(msg)
+                msg.timestamp -= offset
+            offset += 60.0
+            writer.file.flush()
+            if os.path.getsize(path) >= size_mb * 1024 * 1024:
+                return
+
+
+# name → function(path) returning the number of frames read
+BLF_READERS = {
+    "can.BLFReader": lambda path: sum(1 for _ in can.BLFReader(path)),
+    "CANReader.read": lambda path: sum(1 for _ in CANReader(source="file", filepath=path).read()),
+    "blf.read_batches": lambda path: sum(len(batch) for batch in blf.read_batches(path)),
+    "blf.read_blocks": lambda path: sum(len(block) for block in blf.read_blocks(path)),
+    "blf.read_blocks/proc": lambda path: sum(len(block) for block in blf.read_blocks(path, processes=os.cpu_count())),
+}
+
+
+def bench_blf(args):
+    path = args.log
+    if path is None:
+        path = os.path.join(tempfile.gettempdir(), f"benchmark_{args.size_mb}mb.blf")
+        if not os.path.exists(path):
+            print(f"Zapis {path}...", file=sys.stderr)
+            write_blf(path, args.size_mb)
+    size_mb = os.path.getsize(path) / (1024 * 1024)
+    print(f"{path}: {size_mb:.0f} MB")
+    print(f"{'czytnik':>22} {'ramek':>12} {'czas [s]':>10} {'fr/s':>12} {'MB/s':>8} {'RSS [MB]':>9}")
+    runs = []
+    for name in args.readers:
+        start = time.perf_counter()
+        frames = BLF_READERS[name](path)
+        seconds = time.perf_counter() - start
+        runs.append({"reader": name, "frames": frames, "seconds": seconds, "frames_per_s": frames / seconds,
+                     "mb_per_s": size_mb / seconds, "rss_mb": rss_mb()})
+        print(f"{name:>22} {frames:>12} {seconds:>10.2f} {frames / seconds:>12.0f} {size_mb / seconds:>8.1f} "
+              f"{rss_mb() or 0:>9.0f}")
+    if len({run["frames"] for run in runs}) > 1:
+        print("RÓŻNA LICZBA RAMEK!")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": git_commit(), "file": path,
+                       "size_mb": size_mb, "cpus": os.cpu_count(), "runs": runs}, f, indent=2)
+
+
+def load_log(path, limit):
+    frames = []
+    for msg in CANReader(source="file", filepath=path).read():
+        frames.append(msg)
+        if len(frames) >= limit:
+            break
+    return frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark wydajności detektora anomalii CAN")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("inference", help="ramki/s dla różnych rozmiarów paczek")
+    p.add_argument("--frames", type=int, default=20000)
+    p.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 64, 1024])
+    p.add_argument("--heuristic", action="store_true", help="włącz reguły heurystyczne")
+
+    p = sub.add_parser("training", help="strumieniowe uczenie: przepustowość i szczytowe RSS")
+    p.add_argument("--frames", type=int, default=1000000)
+    p.add_argument("--epochs", type=int, default=10)
+    p.add_argument("--chunk-size", type=int, default=16384)
+
+    p = sub.add_parser("heuristics", help="HeuristicEngine: check() vs check_batch()")
+    p.add_argument("--log", help="nagrany plik .blf/.asc (domyślnie ruch syntetyczny)")
+    p.add_argument("--frames", type=int, default=200000)
+    p.add_argument("--block-size", type=int, default=4096)
+
+    p = sub.add_parser("backends", help="backend torch vs NumPy na tych samych wagach")
+    p.add_argument("--frames", type=int, default=100000)
+    p.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 64, 1024])
+    p.add_argument("--model", default="benchmark_model.pth", help="gdzie zapisać model testowy")
+
+    p = sub.add_parser("startup", help="czas startu i RSS: same heurystyki vs backend AI")
+    p.add_argument("--repeats", type=int, default=5)
+
+    p = sub.add_parser("replay", help="syntetyczny ruch J1939 (z atakami) przez potok detekcji: "
+                                      "przepustowość, opóźnienie, pamięć, precyzja/czułość; wyniki do JSON")
+    p.add_argument("--definitions", default=DEFAULT_DEFINITIONS, help="def_CAN_Bus.py lub .dbc")
+    p.add_argument("--ids", type=int, default=40, help="ile ID z definicji nadaje")
+    p.add_argument("--duration", type=float, default=20.0, help="długość ruchu testowego [s]")
+    p.add_argument("--train-duration", type=float, default=30.0, help="długość ruchu do uczenia [s]")
+    p.add_argument("--attacks", nargs="*", choices=sorted(ATTACKS), default=sorted(ATTACKS))
+    p.add_argument("--attack-duration", type=float, default=1.0)
+    p.add_argument("--engines", nargs="+", choices=list(REPLAY_ENGINES), default=list(REPLAY_ENGINES))
+    p.add_argument("--paths", nargs="+", choices=REPLAY_PATHS, default=["memory", "virtual", "blf"],
+                   help="wejście: lista w pamięci, magistrala virtual python-can albo pliki")
+    p.add_argument("--speed", type=float, default=0.0,
+                   help="tempo nadawania na magistralę virtual: 1 = czas rzeczywisty, 0 = najszybciej")
+    p.add_argument("--scorer", choices=("torch", "numpy"), default="torch")
+    p.add_argument("--model", help="gotowy model .pth zamiast uczenia na ruchu syntetycznym")
+    p.add_argument("--batch-size", type=int, default=256)
+    p.add_argument("--workers", type=int, default=1)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--out", help="plik wyników .json (domyślnie replay_<data>.json)")
+    p.add_argument("--compare", help="poprzedni plik wyników do porównania")
+
+    p = sub.add_parser("blf", help="czytanie BLF: can.BLFReader vs odczyt z dekompresją w tle i parsowaniem blokowym")
+    p.add_argument("--log", help="plik .blf (domyślnie wygenerowany plik syntetyczny)")
+    p.add_argument("--size-mb", type=int, default=1024, help="rozmiar pliku syntetycznego")
+    p.add_argument("--readers", nargs="+", choices=list(BLF_READERS), default=list(BLF_READERS))
+    p.add_argument("--out", help="zapisz wyniki do .json")
+
+    args = parser.parse_args()
+    if args.command == "blf":
+        bench_blf(args)
+    elif args.command == "replay":
+        bench_replay(args)
+    elif args.command == "heuristics":
+        frames = load_log(args.log, args.frames) if args.log else synthetic_frames(args.frames)
+        bench_heuristics(frames, args.block_size)
+    elif args.command == "inference":
+        bench_batch_sizes(synthetic_frames(args.frames), args.batch_sizes, args.heuristic)
+    elif args.command == "backends":
+        bench_backends(synthetic_frames(args.frames), args.batch_sizes, args.model)
+    elif args.command == "startup":
+        bench_startup(args.repeats)
+    elif args.command == "training":
+        bench_training(args.frames, args.epochs, args.chunk_size)
+
+
+if __name__ == '__main__':
+    main()
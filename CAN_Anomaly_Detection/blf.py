@@ -0,0 +1,491 @@
+import queue
+import threading
+import zlib
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import can
+import numpy as np
+from can.io import blf as can_blf
+from can.util import dlc2len
+
+from frames import PAYLOAD_WIDTH, FrameBlock
+
+# Object layouts come from python-can's BLF reader
+FILE_HEADER = can_blf.FILE_HEADER_STRUCT
+OBJ_HEADER = can_blf.OBJ_HEADER_BASE_STRUCT
+OBJ_HEADER_V1 = can_blf.OBJ_HEADER_V1_STRUCT
+OBJ_HEADER_V2 = can_blf.OBJ_HEADER_V2_STRUCT
+CONTAINER_HEADER = can_blf.LOG_CONTAINER_STRUCT
+CAN_MSG = can_blf.CAN_MSG_STRUCT
+CAN_FD_MSG = can_blf.CAN_FD_MSG_STRUCT
+CAN_FD_MSG_64 = can_blf.CAN_FD_MSG_64_STRUCT
+CAN_ERROR_EXT = can_blf.CAN_ERROR_EXT_STRUCT
+
+SIGNATURE = b"LOBJ"
+CAN_MSG_EXT = can_blf.CAN_MSG_EXT
+
+
+class BLFFormatError(ValueError):
+    pass
+
+
+def read_file_header(f):
+    """(header size, start timestamp) of an open BLF file"""
+    header = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+    if header[0] != b"LOGG":
+        raise BLFFormatError("To nie jest plik BLF.")
+    return header[1], can_blf.systemtime_to_timestamp(header[14:22])
+
+
+def scan_containers(path):
+    """File offsets of all log containers; only object headers are read, nothing is decompressed"""
+    offsets = []
+    with open(path, "rb") as f:
+        header_size, _ = read_file_header(f)
+        pos = header_size
+        f.seek(pos)
+        while True:
+            data = f.read(OBJ_HEADER.size)
+            if len(data) < OBJ_HEADER.size:
+                break
+            signature, _, _, obj_size, obj_type = OBJ_HEADER.unpack(data)
+            if signature != SIGNATURE:
+                raise BLFFormatError(f"Uszkodzony plik BLF (offset {pos}).")
+            if obj_type == can_blf.LOG_CONTAINER:
+                offsets.append(pos)
+            pos += obj_size + obj_size % 4
+            f.seek(pos)
+    return np.array(offsets, dtype=np.int64)
+
+
+def decompress(method, payload):
+    if method == can_blf.ZLIB_DEFLATE:
+        return zlib.decompress(payload)
+    if method == can_blf.NO_COMPRESSION:
+        return payload
+    raise BLFFormatError(f"Nieznana metoda kompresji BLF: {method}")
+
+
+def read_container(f, offset):
+    """Uncompressed content of the log container at `offset`"""
+    f.seek(offset)
+    _, _, _, obj_size, _ = OBJ_HEADER.unpack(f.read(OBJ_HEADER.size))
+    data = f.read(obj_size - OBJ_HEADER.size)
+    method, _ = CONTAINER_HEADER.unpack_from(data)
+    return decompress(method, data[CONTAINER_HEADER.size:])
+
+
+def raw_containers(f):
+    """(compression method, payload) of every log container, front to back.
+
+    Only reads, never seeks, so `f` may also be a decompressing stream (.blf.gz).
+    """
+    header_size, _ = read_file_header(f)
+    f.read(header_size - FILE_HEADER.size)
+    pos = header_size
+    while True:
+        data = f.read(OBJ_HEADER.size)
+        if len(data) < OBJ_HEADER.size:
+            return
+        signature, _, _, obj_size, obj_type = OBJ_HEADER.unpack(data)
+        if signature != SIGNATURE:
+            raise BLFFormatError(f"Uszkodzony plik BLF (offset {pos}).")
+        body = f.read(obj_size - OBJ_HEADER.size)
+        if obj_type == can_blf.LOG_CONTAINER:
+            method, _ = CONTAINER_HEADER.unpack_from(body)
+            yield method, body[CONTAINER_HEADER.size:]
+        f.read(obj_size % 4)
+        pos += obj_size + obj_size % 4
+
+
+def open_file(path):
+    return open(path, "rb")
+
+
+def _put(items, item, stop):
+    """Queue.put that gives up when `stop` is set; False if it did"""
+    while not stop.is_set():
+        try:
+            items.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _decompress_ahead(path, items, stop, processes, opener):
+    executor = ProcessPoolExecutor(processes) if processes else None
+    try:
+        with opener(path) as f:
+            for method, payload in raw_containers(f):
+                # zlib releases the GIL, so a thread already decompresses in parallel with parsing
+                item = executor.submit(decompress, method, payload) if executor else decompress(method, payload)
+                if not _put(items, item, stop):
+                    return
+        _put(items, None, stop)
+    except Exception as e:
+        _put(items, e, stop)
+    finally:
+        if executor is not None:
+            # Queued futures are still waited for, unless the consumer went away
+            executor.shutdown(cancel_futures=stop.is_set())
+
+
+def iter_containers(path, prefetch=8, processes=0, opener=open_file):
+    """Uncompressed content of every log container, in file order.
+
+    A background thread reads and decompresses up to `prefetch` containers ahead
+    of the consumer; with `processes` > 0 the decompression is spread over that
+    many worker processes instead. `opener(path)` returns the binary stream to
+    read (e.g. log_formats.open_binary for compressed files).
+    """
+    items = queue.Queue(prefetch)
+    stop = threading.Event()
+    thread = threading.Thread(target=_decompress_ahead, args=(path, items, stop, processes, opener),
+                              name="blf-decompress", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item.result() if isinstance(item, Future) else item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _object_at(data, pos):
+    """obj_size if a plausible object header starts at `pos`, else 0"""
+    if pos + OBJ_HEADER.size > len(data) or data[pos:pos + 4] != SIGNATURE:
+        return 0
+    _, header_size, header_version, obj_size, _ = OBJ_HEADER.unpack_from(data, pos)
+    if header_version not in (1, 2) or not OBJ_HEADER.size < header_size <= obj_size:
+        return 0
+    return obj_size
+
+
+def find_object(data, pos=0):
+    """Offset of the first object header at or after `pos` (resync inside a container).
+
+    A container may begin with the tail of an object from the previous one. A
+    "LOBJ" candidate is accepted only if the next object follows where its size
+    says (or lies beyond the data), so payload bytes that spell "LOBJ" are skipped.
+    """
+    while True:
+        pos = data.find(SIGNATURE, pos)
+        if pos < 0:
+            return len(data)
+        size = _object_at(data, pos)
+        if size:
+            following = pos + size
+            if following + 8 > len(data) or data.find(SIGNATURE, following, following + 8) >= 0:
+                return pos
+        pos += 1
+
+
+def parse_objects(data, pos, start_timestamp, messages, limit=None, ids=None):
+    """Append the CAN frames of all complete objects starting in [pos, limit) to `messages`.
+
+    With `ids` (a set), frames of other IDs are skipped before a Message is built.
+
+    Returns the offset of the first object that was not parsed (incomplete, or at/after limit).
+    """
+    limit = len(data) if limit is None else limit
+    size = len(data)
+    append = messages.append
+    while pos < limit:
+        found = data.find(SIGNATURE, pos, pos + 8)
+        if found < 0:
+            if pos + 8 <= size:
+                raise BLFFormatError(f"Uszkodzony kontener BLF (offset {pos}).")
+            break
+        if found >= limit or found + OBJ_HEADER.size > size:
+            break
+        pos = found
+        _, header_size, header_version, obj_size, obj_type = OBJ_HEADER.unpack_from(data, pos)
+        next_pos = pos + obj_size
+        if next_pos > size:
+            break
+        body = pos + header_size
+        if header_version == 1:
+            flags, _, _, timestamp = OBJ_HEADER_V1.unpack_from(data, pos + OBJ_HEADER.size)
+        elif header_version == 2:
+            flags, _, _, timestamp = OBJ_HEADER_V2.unpack_from(data, pos + OBJ_HEADER.size)
+        else:
+            pos = next_pos
+            continue
+        # Division by the exact power of ten rounds like python-can's Decimal arithmetic
+        timestamp = timestamp / (1e5 if flags == 1 else 1e9) + start_timestamp
+
+        if obj_type == can_blf.CAN_MESSAGE or obj_type == can_blf.CAN_MESSAGE2:
+            channel, flags, dlc, can_id, can_data = CAN_MSG.unpack_from(data, body)
+            if ids is not None and can_id & 0x1FFFFFFF not in ids:
+                pos = next_pos
+                continue
+            append(can.Message(
+                timestamp=timestamp,
+                arbitration_id=can_id & 0x1FFFFFFF,
+                is_extended_id=bool(can_id & CAN_MSG_EXT),
+                is_remote_frame=bool(flags & can_blf.REMOTE_FLAG),
+                is_rx=not flags & can_blf.DIR,
+                dlc=dlc,
+                data=can_data[:dlc],
+                channel=channel - 1,
+            ))
+        elif obj_type == can_blf.CAN_FD_MESSAGE:
+            channel, flags, dlc, can_id, _, _, fd_flags, valid_bytes, can_data = CAN_FD_MSG.unpack_from(data, body)
+            if ids is not None and can_id & 0x1FFFFFFF not in ids:
+                pos = next_pos
+                continue
+            append(can.Message(
+                timestamp=timestamp,
+                arbitration_id=can_id & 0x1FFFFFFF,
+                is_extended_id=bool(can_id & CAN_MSG_EXT),
+                is_remote_frame=bool(flags & can_blf.REMOTE_FLAG),
+                is_fd=bool(fd_flags & can_blf.EDL),
+                is_rx=not flags & can_blf.DIR,
+                bitrate_switch=bool(fd_flags & can_blf.BRS),
+                error_state_indicator=bool(fd_flags & can_blf.ESI),
+                dlc=dlc2len(dlc),
+                data=can_data[:valid_bytes],
+                channel=channel - 1,
+            ))
+        elif obj_type == can_blf.CAN_FD_MESSAGE_64:
+            members = CAN_FD_MSG_64.unpack_from(data, body)
+            channel, dlc, valid_bytes, can_id, fd_flags = members[0], members[1], members[2], members[4], members[6]
+            if ids is not None and can_id & 0x1FFFFFFF not in ids:
+                pos = next_pos
+                continue
+            ext_data_offset = members[13]
+            length = min(valid_bytes, (ext_data_offset or obj_size) - header_size - CAN_FD_MSG_64.size)
+            offset = body + CAN_FD_MSG_64.size
+            append(can.Message(
+                timestamp=timestamp,
+                arbitration_id=can_id & 0x1FFFFFFF,
+                is_extended_id=bool(can_id & CAN_MSG_EXT),
+                is_remote_frame=bool(fd_flags & 0x0010),
+                is_fd=bool(fd_flags & 0x1000),
+                is_rx=not members[12],
+                bitrate_switch=bool(fd_flags & 0x2000),
+                error_state_indicator=bool(fd_flags & 0x4000),
+                dlc=dlc2len(dlc),
+                data=data[offset:offset + length].ljust(valid_bytes, b"\x00"),
+                channel=channel - 1,
+            ))
+        elif obj_type == can_blf.CAN_ERROR_EXT:
+            members = CAN_ERROR_EXT.unpack_from(data, body)
+            dlc = members[5]
+            can_id = members[7]
+            if ids is not None and can_id & 0x1FFFFFFF not in ids:
+                pos = next_pos
+                continue
+            append(can.Message(
+                timestamp=timestamp,
+                is_error_frame=True,
+                is_extended_id=bool(can_id & CAN_MSG_EXT),
+                arbitration_id=can_id & 0x1FFFFFFF,
+                dlc=dlc,
+                data=members[9][:dlc],
+                channel=members[0] - 1,
+            ))
+        pos = next_pos
+    return pos
+
+
+def read_range(path, first, stop, containers=None, ids=None):
+    """Frames of the objects that start in containers [first, stop), in file order.
+
+    Consecutive ranges cover the file exactly once: an object that crosses into
+    container `stop` is finished here, and a range that does not start at the
+    first container skips the tail of the object that began before it.
+    """
+    if containers is None:
+        containers = scan_containers(path)
+    stop = min(stop, len(containers))
+    if first >= stop:
+        return
+    with open(path, "rb") as f:
+        _, start_timestamp = read_file_header(f)
+        data = read_container(f, containers[first])
+        pos = find_object(data) if first > 0 else 0
+        index = first + 1
+        while True:
+            messages = []
+            pos = parse_objects(data, pos, start_timestamp, messages, ids=ids)
+            yield from messages
+            if index >= len(containers):
+                return
+            tail = data[pos:]
+            data = tail + read_container(f, containers[index])
+            pos = 0
+            index += 1
+            if index > stop:
+                # Only the object that started inside the range
+                messages = []
+                parse_objects(data, 0, start_timestamp, messages, limit=len(tail), ids=ids)
+                yield from messages
+                return
+
+
+def read_containers(path, containers=None):
+    """(container number, frames of the objects that start in it) for every container, in one pass.
+
+    Uses the same attribution as read_range(), so read_range(path, k, k + 1)
+    returns exactly the frames reported for container k.
+    """
+    if containers is None:
+        containers = scan_containers(path)
+    with open(path, "rb") as f:
+        _, start_timestamp = read_file_header(f)
+        tail = b""
+        pending = None  # previous container, until the object crossing into this one is finished
+        for number, offset in enumerate(containers):
+            data = tail + read_container(f, offset)
+            pos = 0
+            if pending is not None:
+                pos = parse_objects(data, 0, start_timestamp, pending[1], limit=len(tail))
+                yield pending
+            messages = []
+            pos = parse_objects(data, pos, start_timestamp, messages)
+            tail = data[pos:]
+            pending = (number, messages)
+        if pending is not None:
+            yield pending
+
+
+def read_batches(path, prefetch=8, processes=0, opener=open_file):
+    """Lists of can.Message, one per log container (see iter_containers for the options).
+
+    Same frames as can.BLFReader; an object that crosses a container boundary
+    belongs to the batch of the container it starts in. The file header is read
+    right away, so a missing or invalid file fails here and not on first use.
+    """
+    with opener(path) as f:
+        _, start_timestamp = read_file_header(f)
+    return _batches(path, start_timestamp, prefetch, processes, opener)
+
+
+def _batches(path, start_timestamp, prefetch, processes, opener):
+    tail = b""
+    for chunk in iter_containers(path, prefetch, processes, opener):
+        data = tail + chunk
+        messages = []
+        pos = parse_objects(data, 0, start_timestamp, messages)
+        tail = data[pos:]
+        if messages:
+            yield messages
+
+
+def read_messages(path, prefetch=8, processes=0, opener=open_file):
+    """read_batches() flattened: one can.Message at a time, like can.BLFReader"""
+    batches = read_batches(path, prefetch, processes, opener)
+    return (msg for batch in batches for msg in batch)
+
+
+CAN_MESSAGE_TYPES = (can_blf.CAN_MESSAGE, can_blf.CAN_MESSAGE2)
+
+
+def _record_dtype(header_size, obj_size):
+    """One CAN_MESSAGE(2) object, header v1 or v2 (flags and timestamp sit at the same offsets in both)"""
+    return np.dtype({
+        "names": ["signature", "header_size", "header_version", "obj_size", "obj_type", "flags", "timestamp",
+                  "dlc", "can_id", "data"],
+        "formats": ["S4", "<u2", "<u2", "<u4", "<u4", "<u4", "<u8", "u1", "<u4", ("u1", 8)],
+        "offsets": [0, 4, 6, 8, 12, 16, 24, header_size + 3, header_size + 4, header_size + 8],
+        "itemsize": obj_size,
+    })
+
+
+def _records_block(records, start_timestamp, width):
+    raw = records["timestamp"].astype(np.float64)
+    # Same division as parse_objects(), so timestamps are bit-identical
+    timestamp = np.where(records["flags"] == 1, raw / 1e5, raw / 1e9) + start_timestamp
+    dlc = records["dlc"].copy()
+    data = np.zeros((len(records), width), dtype=np.uint8)
+    payload = records["data"][:, :width]
+    data[:, :payload.shape[1]] = payload
+    data[np.arange(width) >= dlc[:, None]] = 0  # bytes past the DLC, like Message.data[:dlc]
+    return FrameBlock(timestamp, records["can_id"] & np.uint32(0x1FFFFFFF), dlc, data)
+
+
+def parse_blocks(data, pos, start_timestamp, blocks, width=PAYLOAD_WIDTH):
+    """Columnar parse_objects(): append FrameBlocks of all complete objects from `pos` to `blocks`.
+
+    Runs of classic CAN objects of equal size (the bulk of most logs) are read as
+    one NumPy structured view; any other object goes through parse_objects().
+    Returns the offset of the first object that was not parsed.
+    """
+    size = len(data)
+    pending = []  # Messages of objects parsed one by one
+    while pos < size:
+        found = data.find(SIGNATURE, pos, pos + 8)
+        if found < 0:
+            if pos + 8 <= size:
+                raise BLFFormatError(f"Uszkodzony kontener BLF (offset {pos}).")
+            break
+        if found + OBJ_HEADER.size > size:
+            break
+        pos = found
+        _, header_size, header_version, obj_size, obj_type = OBJ_HEADER.unpack_from(data, pos)
+        count = (size - pos) // obj_size if obj_size else 0
+        if (obj_type in CAN_MESSAGE_TYPES and header_version in (1, 2) and obj_size % 4 == 0
+                and obj_size >= header_size + CAN_MSG.size and count):
+            records = np.ndarray((count,), _record_dtype(header_size, obj_size), data, pos)
+            same = ((records["signature"] == SIGNATURE) & (records["header_size"] == header_size)
+                    & (records["obj_size"] == obj_size) & np.isin(records["obj_type"], CAN_MESSAGE_TYPES)
+                    & np.isin(records["header_version"], (1, 2)))
+            run = count if same.all() else int(np.argmin(same))
+            if pending:
+                blocks.append(FrameBlock.from_messages(pending, width))
+                pending = []
+            blocks.append(_records_block(records[:run], start_timestamp, width))
+            pos += run * obj_size
+            continue
+        next_pos = parse_objects(data, pos, start_timestamp, pending, limit=pos + 1)
+        if next_pos == pos:
+            break  # continues in the next container
+        pos = next_pos
+    if pending:
+        blocks.append(FrameBlock.from_messages(pending, width))
+    return pos
+
+
+def _concat_blocks(blocks):
+    if len(blocks) == 1:
+        return blocks[0]
+    return FrameBlock(*(np.concatenate([getattr(block, name) for block in blocks]) for name in FrameBlock.__slots__))
+
+
+def _slice_block(block, start, stop):
+    return FrameBlock(*(getattr(block, name)[start:stop] for name in FrameBlock.__slots__))
+
+
+def read_blocks(path, size=65536, width=PAYLOAD_WIDTH, prefetch=8, processes=0, opener=open_file):
+    """FrameBlocks of `size` frames (the last one shorter), parsed in bulk; no Message objects are built"""
+    with opener(path) as f:
+        _, start_timestamp = read_file_header(f)
+    return _blocks(path, start_timestamp, size, width, prefetch, processes, opener)
+
+
+def _blocks(path, start_timestamp, size, width, prefetch, processes, opener):
+    pending = []
+    count = 0
+    tail = b""
+    for chunk in iter_containers(path, prefetch, processes, opener):
+        data = tail + chunk
+        blocks = []
+        pos = parse_blocks(data, 0, start_timestamp, blocks, width)
+        tail = data[pos:]
+        for block in blocks:
+            pending.append(block)
+            count += len(block)
+        while count >= size:
+            merged = _concat_blocks(pending)
+            yield _slice_block(merged, 0, size)
+            pending = [_slice_block(merged, size, None)]
+            count -= size
+    if count:
+        yield _concat_blocks(pending)
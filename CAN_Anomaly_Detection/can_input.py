@@ -1,33 +1,192 @@
 import can
+import heapq
 import os
+import threading
+import time
+from operator import attrgetter
+
+import log_formats
+from frame_store import STORE_SUFFIX, FrameStore
+from frames import iter_blocks
+from log_index import open_index
+from pipeline import DROP_NEWEST, BoundedQueue
+
+DEFAULT_REORDER_WINDOW = 0.05   # s a live frame may wait for earlier frames of the other channels
+DEFAULT_CHANNEL_BUFFER = 65536  # frames per channel between its receive thread and the merge
+RECV_TIMEOUT = 0.1
+
+
+def _many(value):
+    return isinstance(value, (list, tuple))
+
+
+def _tagged(channel, messages):
+    for msg in messages:
+        msg.channel = channel
+        yield msg
+
 
 class CANReader:
-    def __init__(self, source, interface=None, channel=None, bitrate=None, filepath=None):
+    """Frames of a bus or a log file.
+
+    A list of channels (and/or interfaces) or of files gives one input merged from
+    all of them in timestamp order, every frame tagged with the position of its
+    source in the list as msg.channel.
+    """
+
+    def __init__(self, source, interface=None, channel=None, bitrate=None, filepath=None, bus_options=None,
+                 reorder_window=DEFAULT_REORDER_WINDOW, buffer_size=DEFAULT_CHANNEL_BUFFER):
         self.source = source
         self.reader = None
         self.bus = None
+        self.store = None
+        self.format = None
+        self.filepath = filepath
+        self.channels = []  # one CANReader per source of a merged input
+        self.buffers = []   # live merge: BoundedQueue per channel
+        self.reorder_window = reorder_window
+        self.buffer_size = buffer_size
+        self.late = 0       # live merge: frames released after a newer one (arrived past the window)
 
-        if source == "interface":
+        if source == "interface" and (_many(interface) or _many(channel)):
+            if _many(interface) and _many(channel) and len(interface) != len(channel):
+                raise ValueError("Liczba interfejsów i kanałów musi być równa")
+            count = len(interface) if _many(interface) else len(channel)
+            interfaces = interface if _many(interface) else [interface] * count
+            channels = channel if _many(channel) else [channel] * count
+            self.channels = [CANReader(source="interface", interface=name, channel=number, bitrate=bitrate,
+                                       bus_options=bus_options) for name, number in zip(interfaces, channels)]
+        elif source == "file" and _many(filepath):
+            self.channels = [CANReader(source="file", filepath=path) for path in filepath]
+        elif source == "interface":
             self.bus = can.interface.Bus(
                 interface=interface,
                 channel=channel,
-                bitrate=bitrate
+                bitrate=bitrate,
+                **(bus_options or {})  # interface specific, e.g. preserve_timestamps for "virtual"
             )
         elif source == "file":
-            ext = os.path.splitext(filepath)[1].lower()
-            if ext == ".blf":
-                self.reader = can.BLFReader(filepath)
-            elif ext == ".asc":
-                self.reader = can.ASCReader(filepath)
+            ext = os.path.splitext(filepath.rstrip("/\\"))[1].lower()
+            if ext == STORE_SUFFIX:
+                self.store = FrameStore(filepath)
+                self.reader = self.store.messages()
             else:
-                raise ValueError("Nieobsługiwany format pliku logu.")
+                # BLF/ASC/TRC/MF4/candump/CSV, recognised by content, optionally .gz/.zst compressed
+                self.format = log_formats.detect_format(filepath)
+                self.reader = log_formats.read_messages(filepath, self.format)
         else:
             raise ValueError("Nieznane źródło: podaj 'interface' lub 'file'")
 
     def read(self):
-        if self.source == "interface":
+        if self.channels:
+            yield from self._merge_live() if self.source == "interface" else self._merge_files()
+        elif self.source == "interface":
             for msg in self.bus:
                 yield msg
         else:
             for msg in self.reader:
                 yield msg
+
+    def _merge_files(self):
+        # Logs are complete, so the heap merge is exact; equal timestamps keep the order of the files
+        return heapq.merge(*(_tagged(k, reader.read()) for k, reader in enumerate(self.channels)),
+                           key=attrgetter("timestamp"))
+
+    def _merge_live(self):
+        """Frames of several buses in timestamp order.
+
+        Every bus is received in its own thread into a bounded buffer (a full buffer
+        drops the newest frames, like the live detection queue). A frame is released
+        once every channel has delivered a frame at least as new, or after it waited
+        reorder_window seconds, so a silent channel holds the stream back by at most
+        the window. The buses must share a time base (hardware or host clock).
+        """
+        stop = threading.Event()
+        arrived = threading.Event()
+        self.buffers = [BoundedQueue(self.buffer_size, DROP_NEWEST, f"channel{k}")
+                        for k in range(len(self.channels))]
+        threads = [threading.Thread(target=self._receive, args=(reader.bus, buffer, arrived, stop),
+                                    name=f"can-channel{k}", daemon=True)
+                   for k, (reader, buffer) in enumerate(zip(self.channels, self.buffers))]
+        for thread in threads:
+            thread.start()
+
+        newest = [float("-inf")] * len(self.channels)  # latest timestamp received per channel
+        heap = []  # (timestamp, sequence, wall time received, message)
+        sequence = 0
+        released = float("-inf")
+        limit = self.buffer_size * len(self.channels)
+        try:
+            while True:
+                for k, buffer in enumerate(self.buffers):
+                    for received, msg in buffer.get_batch(self.buffer_size, timeout=0):
+                        msg.channel = k
+                        if msg.timestamp > newest[k]:
+                            newest[k] = msg.timestamp
+                        heapq.heappush(heap, (msg.timestamp, sequence, received, msg))
+                        sequence += 1
+                # Closed channels (receive error) no longer hold the others back
+                watermark = min((newest[k] for k, buffer in enumerate(self.buffers) if not buffer.closed),
+                                default=float("inf"))
+                now = time.monotonic()
+                while heap and (heap[0][0] <= watermark or now - heap[0][2] >= self.reorder_window
+                                or len(heap) > limit):
+                    timestamp, _, _, msg = heapq.heappop(heap)
+                    if timestamp < released:
+                        self.late += 1
+                    else:
+                        released = timestamp
+                    yield msg
+                if not heap and all(buffer.finished for buffer in self.buffers):
+                    return
+                wait = self.reorder_window - (time.monotonic() - heap[0][2]) if heap else RECV_TIMEOUT
+                arrived.wait(max(wait, 0.0))
+                arrived.clear()
+        finally:
+            stop.set()
+
+    @staticmethod
+    def _receive(bus, buffer, arrived, stop):
+        try:
+            while not stop.is_set():
+                msg = bus.recv(RECV_TIMEOUT)
+                if msg is not None:
+                    buffer.put((time.monotonic(), msg))
+                    arrived.set()
+        finally:
+            buffer.close()
+            arrived.set()
+
+    def stats(self):
+        """Per-channel buffer counters of a live merge"""
+        return {"channels": [buffer.stats() for buffer in self.buffers], "late": self.late}
+
+    def blocks(self, size):
+        """FrameBlocks of at most `size` frames; a frame store hands out views without parsing,
+        a BLF log is parsed into columns without building messages"""
+        if self.store is not None:
+            return self.store.blocks(size)
+        if self.format is not None:
+            return log_formats.read_blocks(self.filepath, size, self.format)
+        return iter_blocks(self.read(), size)
+
+    def batches(self, size=log_formats.DEFAULT_BATCH):
+        """Lists of at most `size` messages, the same for a bus and every log format"""
+        if self.format is not None:
+            return log_formats.read_batches(self.filepath, size, self.format)
+        return log_formats.batched(self.read(), size)
+
+    def query(self, ids=None, start=None, end=None):
+        """Frames of `ids` (any ID if None) with start <= timestamp < end.
+
+        Logs are looked up in their persisted index (built on first use, rebuilt
+        when the file changes), so only the blocks holding matching frames are read.
+        """
+        if self.source != "file":
+            raise ValueError("Zapytania działają tylko dla plików logów")
+        if self.channels:
+            return heapq.merge(*(_tagged(k, reader.query(ids, start, end)) for k, reader in enumerate(self.channels)),
+                               key=attrgetter("timestamp"))
+        if self.store is not None:
+            return self.store.query(ids, start, end)
+        return open_index(self.filepath).query(ids, start, end)
@@ -0,0 +1,197 @@
+# Headless anomaly detection: train or load a model, score a bus or log files, write anomalies.
+# Nothing on this path imports tkinter, so it runs on machines without a display.
+import argparse
+import sys
+import time
+from itertools import chain, islice
+
+from anomaly_engine import AnomalyEngine
+from can_input import CANReader
+from features import FeaturePipeline, load_definitions
+from pipeline import BLOCK, DROP_NEWEST, DetectionPipeline
+from sinks import event_record, frame_record, incident_record, open_sink
+
+
+def build_readers(args):
+    if args.log:
+        if args.merge and len(args.log) > 1:
+            return [CANReader(source="file", filepath=args.log)]
+        return [CANReader(source="file", filepath=path) for path in args.log]
+    # Several interfaces/channels are merged into one time-ordered stream
+    interface = args.interface if len(args.interface) > 1 else args.interface[0]
+    channel = args.channel if len(args.channel) > 1 else args.channel[0]
+    return [CANReader(source="interface", interface=interface, channel=channel, bitrate=args.bitrate,
+                      reorder_window=args.reorder_window)]
+
+
+def train(engine, args, readers):
+    if args.train_log:
+        sources = [CANReader(source="file", filepath=path) for path in args.train_log]
+        # A single reader is passed as is, so a frame store is trained on without building messages
+        frames = sources[0] if len(sources) == 1 else chain.from_iterable(source.read() for source in sources)
+    else:
+        frames = islice(chain.from_iterable(reader.read() for reader in readers), args.train_frames)
+    print("Uczenie...", file=sys.stderr)
+    stats = engine.train(frames)
+    if stats and (not stats["frames"] or stats["loss"] is None):
+        print("Uczenie pominięte: źródło uczenia nie zawiera ramek, model pozostaje nienauczony.", file=sys.stderr)
+    elif stats:
+        print(f"Uczenie zakończone: {stats['frames']} ramek, {stats['frames_per_s']:.0f} ramek/s, "
+              f"loss={stats['loss']:.5f}, modeli specjalizowanych: {stats['models']}", file=sys.stderr)
+    if args.save_model:
+        engine.save_model(args.save_model)
+        print(f"Model zapisany do {args.save_model}", file=sys.stderr)
+    if args.export_onnx:
+        engine.ai.export_onnx(args.export_onnx)
+        print(f"Model ONNX zapisany do {args.export_onnx}", file=sys.stderr)
+
+
+def print_stats(pipeline, anomalies, start, last):
+    """One status line to stderr; returns (time, frames) for the next interval"""
+    now = time.perf_counter()
+    stats = pipeline.stats()
+    processed = stats["processed"]
+    rate = (processed - last[1]) / max(now - last[0], 1e-9)
+    p50, p99 = pipeline.latency.percentiles((50, 99))
+    frames = stats["frames"]
+    print(f"[{now - start:7.1f}s] ramek: {processed} ({rate:.0f}/s), anomalii: {anomalies}, "
+          f"kolejka: {sum(q['depth'] for q in frames)}, odrzucone: {sum(q['dropped'] for q in frames)}, "
+          f"opóźnienie p50 {p50 * 1000:.2f} ms, p99 {p99 * 1000:.2f} ms", file=sys.stderr)
+    return now, processed
+
+
+def run(args):
+    features = FeaturePipeline.default(load_definitions(args.dbc)) if args.dbc else None
+    engine = AnomalyEngine(use_ai=not args.no_ai, use_heuristic=not args.no_heuristic, scorer=args.scorer,
+                           features=features,
+                           scorer_options={"partition": args.partition, "model_cache": args.model_cache})
+    if args.model:
+        engine.load_model(args.model)
+    if args.threshold is not None:
+        engine.ai.threshold = args.threshold
+
+    readers = build_readers(args)
+    if args.train_log or args.train_frames:
+        train(engine, args, readers)
+    elif not args.model:
+        print("Uwaga: brak modelu (--model) i uczenia, AI nie zgłosi anomalii.", file=sys.stderr)
+
+    online = engine.enable_online(interval=args.online_interval) if args.online else None
+    fusion = engine.enable_fusion(half_life=args.risk_half_life, gap=args.incident_gap) if args.incidents else None
+    try:
+        sink = open_sink(args.out, args.format, incidents=fusion is not None)
+    except RuntimeError as e:
+        sys.exit(str(e))
+    pipeline = DetectionPipeline(
+        engine, readers, batch_size=args.batch_size, workers=args.workers,
+        frame_policy=BLOCK if args.log else DROP_NEWEST,
+        result_policy=BLOCK,  # the writer must not lose results, back-pressure goes to the frame queue
+    ).start()
+
+    start = time.perf_counter()
+    last = (start, 0)
+    last_drain = start
+    anomalies = 0
+    try:
+        while pipeline.running or not pipeline.results.finished:
+            for messages, results in pipeline.results.get_batch(pipeline.results.capacity, timeout=0.1):
+                if messages is None:
+                    if fusion is None:
+                        sink.write(event_record(*results))
+                    anomalies += 1
+                    continue
+                if fusion is not None:
+                    anomalies += sum(result.anomalous for result in results)
+                    continue
+                for msg, result in zip(messages, results):
+                    if result.anomalous:
+                        sink.write(frame_record(msg, result))
+                        anomalies += 1
+                    elif args.all:
+                        sink.write(frame_record(msg, result))
+            if fusion is not None and time.perf_counter() - last_drain >= args.incident_interval:
+                # Incidents that changed since the last drain, each once
+                for incident in fusion.drain():
+                    sink.write(incident_record(incident))
+                last_drain = time.perf_counter()
+            if time.perf_counter() - last[0] >= args.stats_interval:
+                last = print_stats(pipeline, anomalies, start, last)
+                sink.flush()
+    except KeyboardInterrupt:
+        pipeline.stop()
+    finally:
+        if fusion is not None:
+            # End of input: every open incident is written once more, closed
+            for incident in fusion.drain(now=float("inf")):
+                sink.write(incident_record(incident))
+        sink.close()
+        engine.disable_online()
+    print_stats(pipeline, anomalies, start, last)
+    if engine.use_ai and engine.ai.models is not None:
+        models = engine.ai.models.stats()
+        print(f"Modele specjalizowane: {models['models']}, w pamięci {models['resident']}/{models['capacity']}, "
+              f"wczytane {models['misses']}, usunięte z pamięci {models['evictions']}", file=sys.stderr)
+    if online is not None:
+        stats = online.stats()
+        print(f"Uczenie online: {stats['updates']} aktualizacji, ostatni loss={stats['last_loss']}, "
+              f"ostatnia {stats['last_seconds']:.2f} s", file=sys.stderr)
+    if fusion is not None:
+        stats = fusion.stats()
+        print(f"Incydenty: {stats['incidents']} z {stats['findings']} zgłoszeń, "
+              f"usunięte z tabeli {stats['evicted']}", file=sys.stderr)
+    print(f"Wyniki zapisane do {args.out}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Detektor anomalii CAN bez GUI")
+    source = parser.add_argument_group("źródło ramek")
+    source.add_argument("--log", nargs="+",
+                        help="pliki logów (BLF/ASC/TRC/MF4/candump/CSV, także .gz/.zst) lub magazyny ramek .frames "
+                             "(zamiast interfejsu)")
+    source.add_argument("--merge", action="store_true",
+                        help="scal pliki --log w jeden strumień według czasu (nagrania równoległe kilku kanałów)")
+    source.add_argument("--interface", nargs="+", default=["vector"])
+    source.add_argument("--channel", nargs="+", default=["0"], help="kilka kanałów jest scalanych według czasu")
+    source.add_argument("--reorder-window", type=float, default=0.05,
+                        help="ile sekund ramka na żywo czeka na wcześniejsze ramki innych kanałów")
+    source.add_argument("--bitrate", type=int, default=500000)
+
+    model = parser.add_argument_group("model")
+    model.add_argument("--model", help="wczytaj zapisany model .pth")
+    model.add_argument("--train-log", nargs="+", help="naucz na tych plikach logów")
+    model.add_argument("--train-frames", type=int, help="naucz na pierwszych N ramkach ze źródła")
+    model.add_argument("--save-model", help="zapisz nauczony model .pth (i wagi .npz dla backendu numpy)")
+    model.add_argument("--export-onnx", help="zapisz nauczoną sieć także jako .onnx (wymaga pakietu onnx)")
+    model.add_argument("--scorer", choices=("torch", "numpy"), default="torch",
+                       help="backend AI; numpy wczytuje wagi .npz zapisane obok modelu .pth i nie wymaga torch")
+    model.add_argument("--dbc", help="definicje ramek (def_CAN_Bus.py lub .dbc): sygnały jako cechy nowego modelu")
+    model.add_argument("--partition", choices=("id", "pgn"),
+                       help="ucz też osobny mały model dla każdego ID lub PGN (J1939)")
+    model.add_argument("--model-cache", type=int, default=256, help="ile modeli specjalizowanych trzymać w pamięci")
+    model.add_argument("--online", action="store_true",
+                       help="douczaj model w tle na ramkach uznanych za normalne (wymaga torch)")
+    model.add_argument("--online-interval", type=float, default=60.0, help="co ile sekund douczać model")
+    model.add_argument("--threshold", type=float, help="globalny próg AI (MSE)")
+    model.add_argument("--no-ai", action="store_true")
+    model.add_argument("--no-heuristic", action="store_true")
+
+    output = parser.add_argument_group("wyjście")
+    output.add_argument("--out", default="anomalie.jsonl", help="plik wynikowy .jsonl lub .parquet")
+    output.add_argument("--format", choices=("jsonl", "parquet"), help="domyślnie według rozszerzenia")
+    output.add_argument("--all", action="store_true", help="zapisuj wszystkie ramki, nie tylko anomalie")
+    output.add_argument("--incidents", action="store_true",
+                        help="zapisuj incydenty (powtarzające się zgłoszenia ID zebrane razem, z ryzykiem ID) "
+                             "zamiast pojedynczych ramek")
+    output.add_argument("--incident-interval", type=float, default=1.0, help="co ile sekund zapisać zmienione incydenty")
+    output.add_argument("--incident-gap", type=float, default=5.0,
+                        help="po ilu sekundach bez zgłoszeń incydent jest zamykany")
+    output.add_argument("--risk-half-life", type=float, default=10.0, help="okres półtrwania ryzyka ID [s]")
+    output.add_argument("--stats-interval", type=float, default=5.0, help="co ile sekund wypisać statystyki")
+
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=1, help="wątki detektora (podział po ID)")
+    run(parser.parse_args(argv))
+
+
+if __name__ == '__main__':
+    main()
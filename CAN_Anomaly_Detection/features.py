@@ -0,0 +1,332 @@
+import copy
+import importlib.util
+import os
+
+import numpy as np
+
+from frames import FrameBlock
+from id_table import IdTable, grow
+from j1939 import pgn_of
+
+MAX_SIGNALS = 8  # DBC signals per frame that become features
+DEFAULT_DEFINITIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                   "..", "CAN_Device_Imitation", "def_CAN_Bus.py")
+
+
+class BlockContext:
+    """What the features of one block share: ID slots and, per frame, the previous frame of its ID."""
+
+    __slots__ = ("block", "slots", "first_rows", "first_slots", "inner_rows", "prev_rows", "last_rows", "last_slots")
+
+    def __init__(self, block, slots):
+        self.block = block
+        self.slots = slots
+        order = np.argsort(slots, kind="stable")
+        sorted_slots = slots[order]
+        first = np.ones(len(slots), dtype=bool)
+        first[1:] = sorted_slots[1:] != sorted_slots[:-1]
+        last = np.ones(len(slots), dtype=bool)
+        last[:-1] = first[1:]
+        self.first_rows = order[first]
+        self.first_slots = sorted_slots[first]
+        self.inner_rows = order[~first]
+        self.prev_rows = order[np.flatnonzero(~first) - 1]
+        self.last_rows = order[last]
+        self.last_slots = sorted_slots[last]
+
+    def previous(self, values, state):
+        """values of the previous frame of the same ID; state[slot] for an ID's first frame in the block"""
+        out = np.empty_like(values)
+        out[self.first_rows] = state[self.first_slots]
+        out[self.inner_rows] = values[self.prev_rows]
+        return out
+
+    def store_last(self, values, state):
+        """Remember each ID's last value of the block in state[slot]"""
+        state[self.last_slots] = values[self.last_rows]
+
+
+class Feature:
+    """One group of feature columns. Per-ID state lives in arrays indexed by the pipeline's ID slot."""
+
+    name = ""
+    width = 0
+
+    def ensure_capacity(self, size):
+        pass
+
+    def register(self, slots, ids):
+        """New IDs got `slots`"""
+
+    def reset(self):
+        """Forget per-ID state (previous frames), keep the configuration"""
+
+    def compute(self, ctx, out):
+        """Write the (n, width) columns of a block into `out`"""
+        raise NotImplementedError
+
+    def config(self):
+        return {}
+
+
+class ScaledId(Feature):
+    """arbitration ID / 2048, the original single ID column (kept for checkpoints trained with it)"""
+
+    name = "id_scaled"
+    width = 1
+
+    def compute(self, ctx, out):
+        out[:, 0] = ctx.block.arbitration_id / 2048.0
+
+
+class IdEmbedding(Feature):
+    """Fixed pseudo-random vector per arbitration ID, looked up by the dense ID slot.
+
+    The vector only depends on the ID, so it does not need to be stored, and an
+    ID never seen in training gets a vector the model cannot reconstruct well.
+    """
+
+    name = "id_embedding"
+
+    def __init__(self, dim=8):
+        self.width = dim
+        self.table = np.zeros((0, dim), dtype=np.float32)
+
+    def ensure_capacity(self, size):
+        self.table = grow(self.table, size)
+
+    def register(self, slots, ids):
+        for slot, arb_id in zip(slots, ids):
+            self.table[slot] = np.random.default_rng(arb_id).random(self.width, dtype=np.float32)
+
+    def compute(self, ctx, out):
+        out[:] = self.table[ctx.slots]
+
+    def config(self):
+        return {"dim": self.width}
+
+
+class Dlc(Feature):
+    name = "dlc"
+    width = 1
+
+    def compute(self, ctx, out):
+        out[:, 0] = ctx.block.dlc / 8.0
+
+
+class Payload(Feature):
+    """The 8 payload bytes / 255; their reconstruction errors are the per-byte errors"""
+
+    name = "payload"
+    width = 8
+
+    def compute(self, ctx, out):
+        payload = ctx.block.data[:, :self.width]
+        out[:, :payload.shape[1]] = payload / 255.0
+
+
+class InterArrival(Feature):
+    """Time since the previous frame of the same ID, log-scaled: 0.1 ms → 0, 10 s → 1 (first frame: 1)"""
+
+    name = "inter_arrival"
+    width = 1
+
+    def __init__(self):
+        self.last = np.zeros(0, dtype=np.float64)
+
+    def ensure_capacity(self, size):
+        self.last = grow(self.last, size, fill=np.nan)
+
+    def reset(self):
+        self.last[:] = np.nan
+
+    def compute(self, ctx, out):
+        timestamps = ctx.block.timestamp
+        delta = timestamps - ctx.previous(timestamps, self.last)
+        ctx.store_last(timestamps, self.last)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scaled = (np.log10(np.maximum(delta, 1e-4)) + 4.0) / 5.0
+        out[:, 0] = np.clip(np.nan_to_num(scaled, nan=1.0), 0.0, 1.0)
+
+
+class ByteDelta(Feature):
+    """Change of each payload byte against the previous frame of the same ID, / 255 (first frame: 0)"""
+
+    name = "byte_delta"
+    width = 8
+
+    def __init__(self):
+        self.last = np.zeros((0, self.width), dtype=np.int16)
+        self.seen = np.zeros(0, dtype=bool)
+
+    def ensure_capacity(self, size):
+        self.last = grow(self.last, size)
+        self.seen = grow(self.seen, len(self.last))
+
+    def reset(self):
+        self.last[:] = 0
+        self.seen[:] = False
+
+    def compute(self, ctx, out):
+        payload = np.zeros((len(ctx.slots), self.width), dtype=np.int16)
+        data = ctx.block.data[:, :self.width]
+        payload[:, :data.shape[1]] = data
+        previous = ctx.previous(payload, self.last)
+        known = ctx.previous(np.ones(len(ctx.slots), dtype=bool), self.seen)
+        ctx.store_last(payload, self.last)
+        self.seen[ctx.last_slots] = True
+        out[:] = (payload - previous) / 255.0
+        out[~known] = 0.0
+
+
+class DbcSignals(Feature):
+    """Raw values of up to MAX_SIGNALS little-endian DBC signals, / their full range.
+
+    Definitions are matched by the exact ID first, then by PGN, so the same J1939
+    message from another source address still decodes. IDs without a definition
+    get zeros.
+    """
+
+    name = "dbc"
+
+    def __init__(self, ids=(), start=(), length=(), max_signals=MAX_SIGNALS):
+        self.width = max_signals
+        self.def_ids = np.asarray(ids, dtype=np.int64)
+        self.start = np.asarray(start, dtype=np.uint64).reshape(len(self.def_ids), max_signals)
+        self.length = np.asarray(length, dtype=np.uint64).reshape(len(self.def_ids), max_signals)
+        self.by_id = {int(arb_id): row for row, arb_id in enumerate(self.def_ids)}
+        self.by_pgn = {}
+        for row, arb_id in enumerate(self.def_ids):
+            self.by_pgn.setdefault(pgn_of(int(arb_id)), row)
+        self.row = np.zeros(0, dtype=np.int64)
+
+    @classmethod
+    def from_definitions(cls, definitions, max_signals=MAX_SIGNALS):
+        """From {frame_id: FrameDefinition} as in CAN_Device_Imitation/def_CAN_Bus.py"""
+        ids, starts, lengths = [], [], []
+        for frame_id, frame in definitions.items():
+            signals = [s for s in frame.signals if 0 < s.length < 64 and s.start_bit + s.length <= 64]
+            signals = signals[:max_signals]
+            ids.append(frame_id)
+            starts.append([s.start_bit for s in signals] + [0] * (max_signals - len(signals)))
+            lengths.append([s.length for s in signals] + [0] * (max_signals - len(signals)))
+        return cls(ids, starts, lengths, max_signals)
+
+    def ensure_capacity(self, size):
+        self.row = grow(self.row, size, fill=-1)
+
+    def register(self, slots, ids):
+        for slot, arb_id in zip(slots, ids):
+            row = self.by_id.get(arb_id)
+            self.row[slot] = row if row is not None else self.by_pgn.get(pgn_of(arb_id), -1)
+
+    def compute(self, ctx, out):
+        rows = self.row[ctx.slots]
+        have = np.flatnonzero(rows >= 0)
+        out[:] = 0.0
+        if not len(have):
+            return
+        payload = np.zeros((len(have), 8), dtype=np.uint8)
+        data = ctx.block.data[have, :8]
+        payload[:, :data.shape[1]] = data
+        words = payload.view("<u8")  # (k, 1) little-endian 64-bit payload
+        start = self.start[rows[have]]
+        length = self.length[rows[have]]
+        mask = (np.uint64(1) << length) - np.uint64(1)
+        raw = (words >> start) & mask
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out[have] = np.where(length > 0, raw / np.maximum(mask, 1).astype(np.float64), 0.0)
+
+    def config(self):
+        return {"ids": self.def_ids.tolist(), "start": self.start.tolist(), "length": self.length.tolist(),
+                "max_signals": self.width}
+
+
+FEATURES = {feature.name: feature for feature in (ScaledId, IdEmbedding, Dlc, Payload, InterArrival, ByteDelta, DbcSignals)}
+
+# Checkpoints without a feature configuration were trained on these
+LEGACY_FEATURES = [("id_scaled", {}), ("dlc", {}), ("payload", {})]
+DEFAULT_FEATURES = [("id_embedding", {}), ("dlc", {}), ("payload", {}), ("inter_arrival", {}), ("byte_delta", {})]
+
+
+class FeaturePipeline:
+    """Frames → (n, width) float32 feature matrix, computed per block with array operations.
+
+    The features share one dense ID index; per-ID state (previous timestamp and
+    payload, ...) lives in arrays indexed by its slots and carries over between blocks.
+    """
+
+    def __init__(self, features):
+        self.features = list(features)
+        self.ids = IdTable()
+        self.width = sum(feature.width for feature in self.features)
+        self.byte_columns = None  # columns of the payload bytes, for the per-byte errors
+        offset = 0
+        for feature in self.features:
+            if isinstance(feature, Payload):
+                self.byte_columns = slice(offset, offset + feature.width)
+            offset += feature.width
+
+    @classmethod
+    def from_config(cls, config=None):
+        """From [(name, kwargs), ...]; None means the legacy 10 features"""
+        config = LEGACY_FEATURES if config is None else config
+        return cls(FEATURES[name](**kwargs) for name, kwargs in config)
+
+    @classmethod
+    def default(cls, definitions=None):
+        """Default features, plus DBC signals if `definitions` ({frame_id: FrameDefinition}) are given"""
+        pipeline = cls.from_config(DEFAULT_FEATURES)
+        if definitions:
+            pipeline = cls(pipeline.features + [DbcSignals.from_definitions(definitions)])
+        return pipeline
+
+    def config(self):
+        return [(feature.name, feature.config()) for feature in self.features]
+
+    def fork(self):
+        """Same features with separate per-ID state (for another detector thread)"""
+        return FeaturePipeline.from_config(copy.deepcopy(self.config()))
+
+    def reset(self):
+        for feature in self.features:
+            feature.reset()
+
+    def transform(self, frames):
+        block = frames if isinstance(frames, FrameBlock) else FrameBlock.from_messages(frames)
+        known = len(self.ids)
+        slots = self.ids.add_batch(block.arbitration_id)
+        if len(self.ids) > known:
+            new_slots = np.arange(known, len(self.ids))
+            new_ids = self.ids.ids[known:]
+            for feature in self.features:
+                feature.ensure_capacity(len(self.ids))
+                feature.register(new_slots, new_ids)
+
+        ctx = BlockContext(block, slots)
+        x = np.empty((len(block), self.width), dtype=np.float32)
+        offset = 0
+        for feature in self.features:
+            feature.compute(ctx, x[:, offset:offset + feature.width])
+            offset += feature.width
+        return x
+
+
+def load_definitions(path=DEFAULT_DEFINITIONS):
+    """{frame_id: FrameDefinition} from a generated def_CAN_Bus.py, or from a .dbc file (needs cantools)"""
+    if path.lower().endswith(".dbc"):
+        import cantools
+        from types import SimpleNamespace
+
+        db = cantools.database.load_file(path, strict=False)
+        return {
+            message.frame_id: SimpleNamespace(signals=[
+                SimpleNamespace(start_bit=signal.start, length=signal.length)
+                for signal in message.signals if signal.byte_order == "little_endian"
+            ])
+            for message in db.messages
+        }
+    spec = importlib.util.spec_from_file_location("can_definitions", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.DEVICE_DEFINITIONS
@@ -0,0 +1,231 @@
+import numpy as np
+
+# Rule codes of heuristic findings
+RULE_AI = 0         # not a heuristic: AI detections in incidents (fusion.py), delta = loss / threshold
+RULE_TIMEOUT = 1    # delta = seconds since previous frame of the ID
+RULE_BIT_RISE = 2   # byte = byte index, mask = bits that went 0→1
+RULE_DM1_FAULT = 3   # one per active DTC: delta = SPN, mask = FMI, byte = occurrence count
+RULE_PERIOD_LATE = 4  # delta = interval longer than the learned period allows
+RULE_PERIOD_FAST = 5  # delta = interval shorter than the learned period allows
+RULE_SILENT = 6       # delta = seconds since the ID was last seen (raised by the deadline scheduler)
+
+DEFAULT_CAPACITY = 1 << 16
+
+
+def _format_ai(arb_id, byte, mask, delta):
+    return f"AI: błąd rekonstrukcji ID {hex(arb_id)} {delta:.2f}× powyżej progu"
+
+
+def _format_timeout(arb_id, byte, mask, delta):
+    return f"Timeout: brak ID {hex(arb_id)} przez {delta:.2f}s"
+
+
+def _format_bit_rise(arb_id, byte, mask, delta):
+    return f"Bit 0→1 w bajcie {byte}: {bin(mask)}"
+
+
+def _format_dm1_fault(arb_id, byte, mask, delta):
+    return f"DM1: SA {arb_id & 0xFF:#04x} zgłasza DTC SPN {int(delta)} FMI {mask} OC {byte}"
+
+
+def _format_period_late(arb_id, byte, mask, delta):
+    return f"Okres: brak ID {hex(arb_id)} przez {delta * 1000:.1f} ms (ponad wyuczony okres)"
+
+
+def _format_period_fast(arb_id, byte, mask, delta):
+    return f"Okres: ID {hex(arb_id)} za często, {delta * 1000:.2f} ms od poprzedniej (wstrzykiwanie?)"
+
+
+def _format_silent(arb_id, byte, mask, delta):
+    return f"Cisza: ID {hex(arb_id)} nie nadaje od {delta:.2f}s"
+
+
+# rule → function(arb_id, byte, mask, delta) returning the human readable reason
+FORMATTERS = {
+    RULE_AI: _format_ai,
+    RULE_TIMEOUT: _format_timeout,
+    RULE_BIT_RISE: _format_bit_rise,
+    RULE_DM1_FAULT: _format_dm1_fault,
+    RULE_PERIOD_LATE: _format_period_late,
+    RULE_PERIOD_FAST: _format_period_fast,
+    RULE_SILENT: _format_silent,
+}
+
+
+def format_finding(rule, arb_id, byte, mask, delta):
+    formatter = FORMATTERS.get(rule)
+    if formatter is None:
+        return f"Reguła {rule}: ID {hex(arb_id)}"
+    return formatter(arb_id, byte, mask, delta)
+
+
+class FindingBuffer:
+    """Preallocated ring buffer of integer-coded findings (rule, arb id, byte, mask, delta).
+
+    Every finding gets a sequence number (`written` before it was appended); the
+    slot is seq % capacity, so old findings are overwritten once the ring is full.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.rule = np.zeros(capacity, dtype=np.uint8)
+        self.arb_id = np.zeros(capacity, dtype=np.uint32)
+        self.byte = np.zeros(capacity, dtype=np.int8)  # -1 when not applicable
+        self.mask = np.zeros(capacity, dtype=np.uint8)
+        self.delta = np.zeros(capacity, dtype=np.float64)
+        self.written = 0
+        # Typed memoryviews: scalar writes from check() are much cheaper than through NumPy
+        self._rule = memoryview(self.rule)
+        self._arb_id = memoryview(self.arb_id)
+        self._byte = memoryview(self.byte)
+        self._mask = memoryview(self.mask)
+        self._delta = memoryview(self.delta)
+
+    def append(self, rule, arb_id, byte=-1, mask=0, delta=0.0):
+        seq = self.written
+        i = seq % self.capacity
+        self._rule[i] = rule
+        self._arb_id[i] = arb_id
+        self._byte[i] = byte
+        self._mask[i] = mask
+        self._delta[i] = delta
+        self.written = seq + 1
+        return seq
+
+    def extend(self, rule, arb_id, byte, mask, delta):
+        """Append arrays of findings, returns the sequence number of the first one"""
+        seq = self.written
+        count = len(rule)
+        if count > self.capacity:
+            # Only the newest `capacity` findings can be kept
+            skip = count - self.capacity
+            rule, arb_id, byte, mask, delta = rule[skip:], arb_id[skip:], byte[skip:], mask[skip:], delta[skip:]
+            self.written += skip
+            count = self.capacity
+        start = self.written % self.capacity
+        head = min(count, self.capacity - start)
+        for column, values in ((self.rule, rule), (self.arb_id, arb_id), (self.byte, byte),
+                               (self.mask, mask), (self.delta, delta)):
+            column[start:start + head] = values[:head]
+            column[:count - head] = values[head:]
+        self.written += count
+        return seq
+
+    def is_valid(self, seq):
+        return self.written - self.capacity <= seq < self.written
+
+    def record(self, seq):
+        i = seq % self.capacity
+        return (int(self.rule[i]), int(self.arb_id[i]), int(self.byte[i]),
+                int(self.mask[i]), float(self.delta[i]))
+
+
+class Findings:
+    """Findings of one frame: the window [start, start + count) of a FindingBuffer.
+
+    Holds only integers; the reasons are formatted when the findings are iterated
+    or format() is called, i.e. when they are actually displayed or exported.
+    """
+
+    __slots__ = ("buffer", "start", "count")
+
+    def __init__(self, buffer, start, count):
+        self.buffer = buffer
+        self.start = start
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __bool__(self):
+        return self.count > 0
+
+    def __iter__(self):
+        return iter(self.format())
+
+    def __repr__(self):
+        return f"Findings({self.format()!r})"
+
+    @property
+    def stale(self):
+        """True if the ring buffer has already overwritten (part of) these findings"""
+        return self.count > 0 and not self.buffer.is_valid(self.start)
+
+    def records(self):
+        """[(rule, arb_id, byte, mask, delta), ...]"""
+        if self.stale:
+            return []
+        return [self.buffer.record(seq) for seq in range(self.start, self.start + self.count)]
+
+    def format(self):
+        if self.stale:
+            return ["(wpis nadpisany)"]
+        return [format_finding(*record) for record in self.records()]
+
+
+NO_FINDINGS = Findings(None, 0, 0)
+
+
+def findings_columns(findings):
+    """(frame, rule, arb_id, byte, mask, delta) arrays of a list of per-frame Findings.
+
+    Like BatchFindings.columns(), for results that only hold Findings (one ring
+    buffer per list, as with the results of one evaluate_batch call). Findings
+    the ring buffer has already overwritten are left out.
+    """
+    counts = np.fromiter((f.count for f in findings), dtype=np.int64, count=len(findings))
+    total = int(counts.sum())
+    if not total:
+        return tuple(np.zeros(0, dtype=dtype) for dtype in (np.int64, np.uint8, np.uint32, np.int8, np.uint8,
+                                                             np.float64))
+    buffer = next(f.buffer for f in findings if f.count)
+    starts = np.fromiter((f.start for f in findings), dtype=np.int64, count=len(findings))
+    frame = np.repeat(np.arange(len(counts)), counts)
+    offsets = np.cumsum(counts) - counts
+    seq = starts[frame] + np.arange(total) - offsets[frame]
+    keep = seq >= buffer.written - buffer.capacity
+    i = seq[keep] % buffer.capacity
+    return frame[keep], buffer.rule[i], buffer.arb_id[i], buffer.byte[i], buffer.mask[i], buffer.delta[i]
+
+
+class BatchFindings:
+    """Findings of a block of frames: frame i owns [start + offsets[i], start + offsets[i + 1]).
+
+    Per-frame Findings objects are only created when a frame is indexed.
+    """
+
+    __slots__ = ("buffer", "start", "offsets")
+
+    def __init__(self, buffer, start, offsets):
+        self.buffer = buffer
+        self.start = start
+        self.offsets = offsets  # int64[n + 1]
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        begin = int(self.offsets[i])
+        count = int(self.offsets[i + 1]) - begin
+        return Findings(self.buffer, self.start + begin, count) if count else NO_FINDINGS
+
+    def __iter__(self):
+        offsets = self.offsets.tolist()
+        for begin, end in zip(offsets, offsets[1:]):
+            yield Findings(self.buffer, self.start + begin, end - begin) if end > begin else NO_FINDINGS
+
+    def counts(self):
+        return np.diff(self.offsets)
+
+    def columns(self):
+        """(frame, rule, arb_id, byte, mask, delta) arrays of all findings of the block.
+
+        Findings the ring buffer has already overwritten are left out.
+        """
+        counts = self.counts()
+        frame = np.repeat(np.arange(len(counts)), counts)
+        seq = self.start + np.arange(len(frame))
+        buffer = self.buffer
+        keep = seq >= buffer.written - buffer.capacity
+        i = seq[keep] % buffer.capacity
+        return frame[keep], buffer.rule[i], buffer.arb_id[i], buffer.byte[i], buffer.mask[i], buffer.delta[i]
@@ -0,0 +1,310 @@
+# Columnar binary copy of a log: one memory-mapped file per column, so repeated
+# training runs and forensic scans skip BLF/ASC parsing and read frames as NumPy views.
+import argparse
+import json
+import os
+import sys
+import time
+
+import can
+import numpy as np
+
+from frames import PAYLOAD_WIDTH, FrameBlock
+
+STORE_SUFFIX = ".frames"
+STORE_VERSION = 1
+MAX_DATA = 64  # CAN FD payload
+
+# Column → (dtype, shape of one row)
+COLUMNS = {
+    "timestamp": (np.float64, ()),
+    "arbitration_id": (np.uint32, ()),
+    "flags": (np.uint8, ()),
+    "dlc": (np.uint8, ()),
+    "data": (np.uint8, (MAX_DATA,)),
+    "channel": (np.uint8, ()),
+}
+ROW_BYTES = sum(np.dtype(dtype).itemsize * int(np.prod(shape)) for dtype, shape in COLUMNS.values())
+
+FLAG_EXTENDED = 0x01
+FLAG_REMOTE = 0x02
+FLAG_ERROR = 0x04
+FLAG_FD = 0x08
+FLAG_BRS = 0x10
+FLAG_ESI = 0x20
+FLAG_RX = 0x40
+NO_CHANNEL = 0xFF  # channel None or not a small integer
+
+
+def store_path(log_path):
+    """log.blf → log.blf.frames"""
+    return log_path + STORE_SUFFIX
+
+
+def message_flags(msg):
+    return ((FLAG_EXTENDED if msg.is_extended_id else 0) | (FLAG_REMOTE if msg.is_remote_frame else 0)
+            | (FLAG_ERROR if msg.is_error_frame else 0) | (FLAG_FD if msg.is_fd else 0)
+            | (FLAG_BRS if msg.bitrate_switch else 0) | (FLAG_ESI if msg.error_state_indicator else 0)
+            | (FLAG_RX if msg.is_rx else 0))
+
+
+def _columns(messages):
+    """Column arrays of a list of can.Message (payload zero padded to MAX_DATA)"""
+    n = len(messages)
+    timestamps = [0.0] * n
+    ids = [0] * n
+    flags = [0] * n
+    dlcs = [0] * n
+    channels = [NO_CHANNEL] * n
+    payload = bytearray(n * MAX_DATA)
+    for i, msg in enumerate(messages):
+        timestamps[i] = msg.timestamp
+        ids[i] = msg.arbitration_id
+        flags[i] = message_flags(msg)
+        dlcs[i] = msg.dlc
+        if isinstance(msg.channel, int) and 0 <= msg.channel < NO_CHANNEL:
+            channels[i] = msg.channel
+        data = msg.data[:MAX_DATA]
+        offset = i * MAX_DATA
+        payload[offset:offset + len(data)] = data
+    return {
+        "timestamp": np.array(timestamps, dtype=np.float64),
+        "arbitration_id": np.array(ids, dtype=np.uint32),
+        "flags": np.array(flags, dtype=np.uint8),
+        "dlc": np.array(dlcs, dtype=np.uint8),
+        "data": np.frombuffer(payload, dtype=np.uint8).reshape(n, MAX_DATA),
+        "channel": np.array(channels, dtype=np.uint8),
+    }
+
+
+def _map(path, dtype, shape, count, mode="r"):
+    if count == 0:  # np.memmap cannot map an empty file
+        return np.zeros((0,) + shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode=mode, shape=(count,) + shape)
+
+
+def convert(log_path, out=None, chunk=65536):
+    """Parse a log once into a frame store directory; returns its path.
+
+    Frames are written in time order (sorted afterwards if the log is not),
+    together with an index of the rows of every ID. meta.json is written last,
+    so an interrupted conversion never looks like a valid store.
+    """
+    from can_input import CANReader
+
+    out = out or store_path(log_path)
+    os.makedirs(out, exist_ok=True)
+    meta_path = os.path.join(out, "meta.json")
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    count = 0
+    ordered = True
+    last = -np.inf
+    files = {name: open(os.path.join(out, name + ".bin"), "wb") for name in COLUMNS}
+    try:
+        messages = []
+        for msg in CANReader(source="file", filepath=log_path).read():
+            messages.append(msg)
+            if len(messages) < chunk:
+                continue
+            count, ordered, last = _write(files, messages, count, ordered, last)
+            messages = []
+        if messages:
+            count, ordered, last = _write(files, messages, count, ordered, last)
+    finally:
+        for f in files.values():
+            f.close()
+
+    columns = {name: _map(os.path.join(out, name + ".bin"), dtype, shape, count, mode="r+")
+               for name, (dtype, shape) in COLUMNS.items()}
+    if not ordered:
+        order = np.argsort(columns["timestamp"], kind="stable")
+        for values in columns.values():
+            values[:] = values[order]
+    # Rows of each ID, in time order: id_order[id_offsets[k]:id_offsets[k + 1]] for id_values[k]
+    id_order = np.argsort(columns["arbitration_id"], kind="stable").astype(np.int64)
+    id_values, id_counts = np.unique(columns["arbitration_id"], return_counts=True)
+    id_order.tofile(os.path.join(out, "id_order.bin"))
+    np.savez(os.path.join(out, "id_index.npz"), id_values=id_values,
+             id_offsets=np.concatenate(([0], np.cumsum(id_counts))).astype(np.int64))
+    for values in columns.values():
+        if isinstance(values, np.memmap):
+            values.flush()
+    del columns
+
+    stat = os.stat(log_path)
+    meta = {"version": STORE_VERSION, "count": count, "source": os.path.abspath(log_path),
+            "source_size": stat.st_size, "source_mtime": stat.st_mtime}
+    with open(meta_path + ".tmp", "w") as f:
+        json.dump(meta, f, indent=1)
+    os.replace(meta_path + ".tmp", meta_path)
+    return out
+
+
+def _write(files, messages, count, ordered, last):
+    columns = _columns(messages)
+    timestamps = columns["timestamp"]
+    ordered = ordered and timestamps[0] >= last and bool(np.all(timestamps[1:] >= timestamps[:-1]))
+    for name, values in columns.items():
+        files[name].write(values.tobytes())
+    return count + len(messages), ordered, timestamps[-1]
+
+
+class FrameStore:
+    """Memory-mapped columns of a converted log (see convert()).
+
+    Ranges of rows and time ranges are zero-copy views of the mapped files.
+    Frames of one ID are not contiguous, so by_id() gathers them (a copy of
+    that ID's rows only); id_rows() is the zero-copy row index.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(os.path.join(path, "meta.json")) as f:
+                self.meta = json.load(f)
+        except FileNotFoundError:
+            raise ValueError(f"{path} nie jest kompletnym magazynem ramek (brak meta.json)") from None
+        if self.meta.get("version") != STORE_VERSION:
+            raise ValueError(f"{path}: nieobsługiwana wersja magazynu ramek {self.meta.get('version')}")
+        count = self.meta["count"]
+        for name, (dtype, shape) in COLUMNS.items():
+            setattr(self, name, _map(os.path.join(path, name + ".bin"), dtype, shape, count))
+        self.id_order = _map(os.path.join(path, "id_order.bin"), np.int64, (), count)
+        with np.load(os.path.join(path, "id_index.npz")) as index:
+            self.id_values = index["id_values"]
+            self.id_offsets = index["id_offsets"]
+
+    def __len__(self):
+        return self.meta["count"]
+
+    def stale(self):
+        """True if the source log changed (or disappeared) since the conversion"""
+        try:
+            stat = os.stat(self.meta["source"])
+        except OSError:
+            return True
+        return stat.st_size != self.meta["source_size"] or stat.st_mtime != self.meta["source_mtime"]
+
+    def rows(self, start=None, end=None):
+        """(first, stop) rows of the frames with start <= timestamp < end"""
+        first = 0 if start is None else int(np.searchsorted(self.timestamp, start, side="left"))
+        stop = len(self) if end is None else int(np.searchsorted(self.timestamp, end, side="left"))
+        return first, max(first, stop)
+
+    def block(self, first=0, stop=None, width=PAYLOAD_WIDTH):
+        """FrameBlock of rows [first, stop), as views of the mapped columns"""
+        stop = len(self) if stop is None else stop
+        return FrameBlock(self.timestamp[first:stop], self.arbitration_id[first:stop],
+                          self.dlc[first:stop], self.data[first:stop, :width])
+
+    def time_range(self, start=None, end=None, width=PAYLOAD_WIDTH):
+        return self.block(*self.rows(start, end), width=width)
+
+    def blocks(self, size, first=0, stop=None, width=PAYLOAD_WIDTH):
+        """Consecutive FrameBlock views of at most `size` frames (see frames.iter_blocks)"""
+        stop = len(self) if stop is None else stop
+        for offset in range(first, stop, size):
+            yield self.block(offset, min(offset + size, stop), width)
+
+    def ids(self):
+        return self.id_values
+
+    def id_rows(self, arb_id):
+        """Rows of the frames of one ID, in time order (a view of the stored index)"""
+        k = int(np.searchsorted(self.id_values, arb_id))
+        if k == len(self.id_values) or self.id_values[k] != arb_id:
+            return self.id_order[:0]
+        return self.id_order[self.id_offsets[k]:self.id_offsets[k + 1]]
+
+    def by_id(self, arb_id, start=None, end=None, width=PAYLOAD_WIDTH):
+        """FrameBlock of the frames of one ID, optionally limited to start <= timestamp < end"""
+        rows = self.id_rows(arb_id)
+        if start is not None or end is not None:
+            timestamps = self.timestamp[rows]
+            first = 0 if start is None else np.searchsorted(timestamps, start, side="left")
+            stop = len(rows) if end is None else np.searchsorted(timestamps, end, side="left")
+            rows = rows[first:stop]
+        return FrameBlock(self.timestamp[rows], self.arbitration_id[rows], self.dlc[rows], self.data[rows, :width])
+
+    def select(self, ids=None, start=None, end=None):
+        """Sorted rows of the frames of `ids` (any ID if None) with start <= timestamp < end"""
+        if ids is None:
+            return np.arange(*self.rows(start, end))
+        rows = np.sort(np.concatenate([self.id_rows(arb_id) for arb_id in ids] + [self.id_order[:0]]))
+        timestamps = self.timestamp[rows]
+        keep = np.ones(len(rows), dtype=bool)
+        if start is not None:
+            keep &= timestamps >= start
+        if end is not None:
+            keep &= timestamps < end
+        return rows[keep]
+
+    def query(self, ids=None, start=None, end=None):
+        """can.Message objects of select(), see CANReader.query"""
+        rows = self.select(ids, start, end)
+        for offset in range(0, len(rows), 4096):
+            yield from self._messages(rows[offset:offset + 4096])
+
+    def messages(self, first=0, stop=None, chunk=4096):
+        """can.Message objects of rows [first, stop), for consumers that need them"""
+        stop = len(self) if stop is None else stop
+        for offset in range(first, stop, chunk):
+            yield from self._messages(slice(offset, min(offset + chunk, stop)))
+
+    def _messages(self, rows):
+        """can.Message objects of a slice or an index array of rows"""
+        timestamps = self.timestamp[rows].tolist()
+        ids = self.arbitration_id[rows].tolist()
+        flags = self.flags[rows].tolist()
+        dlcs = self.dlc[rows].tolist()
+        channels = self.channel[rows].tolist()
+        data = self.data[rows]
+        for i in range(len(timestamps)):
+            flag = flags[i]
+            dlc = dlcs[i]
+            yield can.Message(
+                timestamp=timestamps[i], arbitration_id=ids[i], dlc=dlc,
+                channel=channels[i] if channels[i] != NO_CHANNEL else None,
+                data=data[i, :dlc].tobytes() if not flag & FLAG_REMOTE else None,
+                is_extended_id=bool(flag & FLAG_EXTENDED), is_remote_frame=bool(flag & FLAG_REMOTE),
+                is_error_frame=bool(flag & FLAG_ERROR), is_fd=bool(flag & FLAG_FD),
+                bitrate_switch=bool(flag & FLAG_BRS), error_state_indicator=bool(flag & FLAG_ESI),
+                is_rx=bool(flag & FLAG_RX), check=False,
+            )
+
+
+def open_store(log_path, rebuild=True):
+    """FrameStore of a log, converting it first if there is no up-to-date store"""
+    path = log_path if log_path.endswith(STORE_SUFFIX) else store_path(log_path)
+    try:
+        store = FrameStore(path)
+    except (ValueError, OSError):
+        store = None
+    if path != log_path and rebuild and (store is None or store.stale()):
+        convert(log_path, path)
+        store = FrameStore(path)
+    if store is None:
+        raise ValueError(f"Brak magazynu ramek dla {log_path}")
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Konwersja logów BLF/ASC do kolumnowego magazynu ramek")
+    parser.add_argument("logs", nargs="+", help="pliki logów .blf/.asc")
+    parser.add_argument("--out", help="katalog wynikowy (tylko dla jednego logu; domyślnie <log>.frames)")
+    args = parser.parse_args()
+    if args.out and len(args.logs) > 1:
+        sys.exit("--out można podać tylko dla jednego logu")
+
+    for log_path in args.logs:
+        start = time.perf_counter()
+        path = convert(log_path, args.out)
+        store = FrameStore(path)
+        print(f"{log_path} → {path}: {len(store)} ramek, {len(store.ids())} ID, "
+              f"{time.perf_counter() - start:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+from itertools import islice
+
+import numpy as np
+
+PAYLOAD_WIDTH = 8  # classic CAN payload
+
+
+class FrameBlock:
+    """Columnar block of CAN frames: one NumPy array per message field."""
+
+    __slots__ = ("timestamp", "arbitration_id", "dlc", "data")
+
+    def __init__(self, timestamp, arbitration_id, dlc, data):
+        self.timestamp = timestamp            # float64[n]
+        self.arbitration_id = arbitration_id  # uint32[n]
+        self.dlc = dlc                        # uint8[n]
+        self.data = data                      # uint8[n, width], zero padded
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    @classmethod
+    def from_messages(cls, messages, width=PAYLOAD_WIDTH):
+        if not isinstance(messages, (list, tuple)):
+            messages = list(messages)
+        n = len(messages)
+        timestamps = [0.0] * n
+        ids = [0] * n
+        dlcs = [0] * n
+        payload = bytearray(n * width)
+
+        # Single pass over the Python objects, everything else is NumPy
+        for i, msg in enumerate(messages):
+            timestamps[i] = msg.timestamp
+            ids[i] = msg.arbitration_id
+            dlcs[i] = msg.dlc
+            data = msg.data[:width]
+            offset = i * width
+            payload[offset:offset + len(data)] = data
+
+        return cls(
+            np.array(timestamps, dtype=np.float64),
+            np.array(ids, dtype=np.uint32),
+            np.array(dlcs, dtype=np.uint8),
+            np.frombuffer(payload, dtype=np.uint8).reshape(n, width),
+        )
+
+
+def payload_lengths(messages):
+    """uint8[n] real payload lengths, len(msg.data): 0 for remote frames, up to 64 for CAN FD"""
+    return np.fromiter((len(msg.data) for msg in messages), dtype=np.uint8, count=len(messages))
+
+
+def iter_blocks(messages, size):
+    """Group an iterator of can.Message into FrameBlocks of at most `size` frames.
+
+    Sources that already hold columns (a CANReader of a frame store) provide
+    their own blocks(size) and are not turned into messages and back.
+    """
+    blocks = getattr(messages, "blocks", None)
+    if blocks is not None:
+        yield from blocks(size)
+        return
+    iterator = iter(messages)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield FrameBlock.from_messages(chunk)
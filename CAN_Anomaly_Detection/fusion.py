@@ -0,0 +1,298 @@
+# Fusion of the AI and heuristic verdicts: a decaying risk score per ID, and repeated
+# findings collapsed into incidents, so consumers handle a few incidents per second
+# instead of every anomalous frame.
+import math
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+
+from findings import (RULE_AI, RULE_BIT_RISE, RULE_DM1_FAULT, RULE_PERIOD_FAST, RULE_PERIOD_LATE, RULE_SILENT,
+                      RULE_TIMEOUT, BatchFindings, format_finding)
+from heuristic_rules import group_by_slot
+from id_table import IdTable, grow
+
+DEFAULT_HALF_LIFE = 10.0  # seconds
+DEFAULT_GAP = 5.0         # seconds without a finding that close an incident
+DEFAULT_CAPACITY = 4096   # incidents kept in the table
+
+# Risk added by one finding of each rule; an AI detection adds its weight times
+# loss / threshold, capped at MAX_AI_RATIO
+RULE_WEIGHTS = {
+    RULE_AI: 1.0,
+    RULE_TIMEOUT: 1.0,
+    RULE_BIT_RISE: 0.25,
+    RULE_DM1_FAULT: 2.0,
+    RULE_PERIOD_LATE: 0.5,
+    RULE_PERIOD_FAST: 2.0,
+    RULE_SILENT: 1.0,
+}
+MAX_AI_RATIO = 10.0
+
+
+class RiskScore:
+    """Per-ID risk: the sum of all contributions, each decaying with `half_life`.
+
+    r(t) = Σ c_k · 2^(-(t - t_k) / half_life). State is one (risk, time) pair per
+    ID slot, the risk after every frame of a block is computed with array
+    operations (a cumulative log-sum-exp per ID, see update()).
+    """
+
+    def __init__(self, half_life=DEFAULT_HALF_LIFE):
+        self.half_life = half_life
+        self.tau = half_life / math.log(2)
+        self.ids = IdTable()
+        self.risk = np.zeros(0, dtype=np.float64)  # slot → risk at time[slot]
+        self.time = np.zeros(0, dtype=np.float64)  # slot → time of the last contribution
+
+    def update(self, timestamps, ids, contributions):
+        """Add the contributions of a block (time ordered within an ID); returns the risk after each frame"""
+        n = len(timestamps)
+        if n == 0:
+            return np.zeros(0, dtype=np.float64)
+        slots = self.ids.add_batch(ids)
+        self.risk = grow(self.risk, len(self.ids))
+        self.time = grow(self.time, len(self.ids))
+
+        order, sorted_slots, first, last = group_by_slot(slots)
+        t = timestamps[order]
+        c = contributions[order].astype(np.float64)
+        # The risk left from earlier blocks enters as part of each ID's first contribution
+        first_slots = sorted_slots[first]
+        age = np.maximum(t[first] - self.time[first_slots], 0.0)
+        c[first] += self.risk[first_slots] * np.exp(-age / self.tau)
+
+        # r_i = Σ_{j<=i} c_j e^{-(t_i - t_j)/τ} within an ID, as logaddexp.accumulate over
+        # log c_j + t_j/τ. Every ID is lifted by `spread` above the previous one, so the
+        # running sum of earlier IDs falls far below double precision and restarts.
+        rel = (t - t.min()) / self.tau
+        with np.errstate(divide="ignore"):
+            log_c = np.log(c)
+        finite = log_c[np.isfinite(log_c)]
+        spread = rel.max() + max(finite.max() if len(finite) else 0.0, 0.0) + 64.0
+        lift = (np.cumsum(first) - 1) * spread
+        accumulated = np.logaddexp.accumulate(log_c + rel + lift)
+        sorted_risk = np.exp(accumulated - lift - rel)
+
+        self.risk[sorted_slots[last]] = sorted_risk[last]
+        self.time[sorted_slots[last]] = t[last]
+        risk = np.empty(n, dtype=np.float64)
+        risk[order] = sorted_risk
+        return risk
+
+    def current(self, now):
+        """(ids, risk) of all IDs, decayed to `now`"""
+        n = len(self.ids)
+        age = np.maximum(now - self.time[:n], 0.0)
+        return self.ids.to_array(), self.risk[:n] * np.exp(-age / self.tau)
+
+
+@dataclass(slots=True)
+class Incident:
+    number: int        # increasing, unique per FusionStage
+    arb_id: int
+    rule: int          # findings.RULE_*, RULE_AI for AI detections
+    first_seen: float  # frame time base
+    last_seen: float
+    count: int         # findings collapsed into the incident
+    risk: float        # highest risk of the ID during the incident
+    reason: str        # the latest finding, formatted
+    closed: bool       # no finding for `gap` seconds, later findings open a new incident
+
+
+class IncidentTable:
+    """Bounded table of incidents keyed by (ID, rule).
+
+    Findings of the same key less than `gap` seconds apart extend one incident.
+    Rows are preallocated; when the table is full a closed incident (or else the
+    one seen least recently) is overwritten. drain() hands out each incident changed since the previous call
+    once, so a flood of findings reaches the consumer as a handful of updates.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, gap=DEFAULT_GAP):
+        self.capacity = capacity
+        self.gap = gap
+        self.number = np.full(capacity, -1, dtype=np.int64)  # -1 = free row
+        self.arb_id = np.zeros(capacity, dtype=np.uint32)
+        self.rule = np.zeros(capacity, dtype=np.uint8)
+        self.first_seen = np.zeros(capacity, dtype=np.float64)
+        self.last_seen = np.full(capacity, -np.inf)
+        self.count = np.zeros(capacity, dtype=np.int64)
+        self.risk = np.zeros(capacity, dtype=np.float64)
+        self.reason = [None] * capacity  # (rule, arb_id, byte, mask, delta) of the latest finding
+        self.closed = np.zeros(capacity, dtype=bool)
+        self.dirty = np.zeros(capacity, dtype=bool)
+        self.open = {}  # (ID, rule) → row of its open incident
+        self.opened = 0
+        self.evicted = 0
+        self.findings = 0
+
+    def __len__(self):
+        return int(np.count_nonzero(self.number >= 0))
+
+    def _new_row(self, key):
+        free = np.flatnonzero(self.number < 0)
+        if len(free):
+            row = int(free[0])
+        else:
+            # Closed incidents already handed out go first, then closed ones, then the open one seen least recently
+            for candidates in (self.closed & ~self.dirty, self.closed):
+                if candidates.any():
+                    row = int(np.argmin(np.where(candidates, self.last_seen, np.inf)))
+                    break
+            else:
+                row = int(np.argmin(self.last_seen))
+            self.evicted += 1
+            old_key = (int(self.arb_id[row]), int(self.rule[row]))
+            if self.open.get(old_key) == row:
+                del self.open[old_key]
+        self.number[row] = self.opened
+        self.opened += 1
+        self.arb_id[row], self.rule[row] = key
+        self.count[row] = 0
+        self.risk[row] = 0.0
+        self.closed[row] = False
+        self.open[key] = row
+        return row
+
+    def add(self, time, arb_id, rule, byte, mask, delta, risk):
+        """Merge findings given as arrays (in time order within a key)"""
+        n = len(time)
+        if n == 0:
+            return
+        self.findings += n
+        # Sort by key, then time; a run of one key is split where findings are more than `gap` apart
+        key = (arb_id.astype(np.uint64) << np.uint64(8)) | rule.astype(np.uint64)
+        order = np.lexsort((time, key))
+        key, time = key[order], time[order]
+        start = np.ones(n, dtype=bool)
+        start[1:] = (key[1:] != key[:-1]) | (np.diff(time) > self.gap)
+        starts = np.flatnonzero(start)
+        ends = np.append(starts[1:], n) - 1
+        peak = np.maximum.reduceat(risk[order], starts)
+
+        for begin, end, top in zip(starts.tolist(), ends.tolist(), peak.tolist()):
+            i = order[end]
+            k = (int(arb_id[i]), int(rule[i]))
+            row = self.open.get(k)
+            if row is None or time[begin] - self.last_seen[row] > self.gap:
+                if row is not None:
+                    self.closed[row] = True
+                    self.dirty[row] = True
+                row = self._new_row(k)
+                self.first_seen[row] = time[begin]
+            self.last_seen[row] = time[end]
+            self.count[row] += end - begin + 1
+            self.risk[row] = max(self.risk[row], top)
+            self.reason[row] = (k[1], k[0], int(byte[i]), int(mask[i]), float(delta[i]))
+            self.dirty[row] = True
+
+    def close(self, now):
+        """Close the incidents without a finding for `gap` seconds before `now`"""
+        for key, row in list(self.open.items()):
+            if now - self.last_seen[row] > self.gap:
+                del self.open[key]
+                self.closed[row] = True
+                self.dirty[row] = True
+
+    def incident(self, row):
+        return Incident(int(self.number[row]), int(self.arb_id[row]), int(self.rule[row]),
+                        float(self.first_seen[row]), float(self.last_seen[row]), int(self.count[row]),
+                        float(self.risk[row]), format_finding(*self.reason[row]), bool(self.closed[row]))
+
+    def drain(self):
+        """Incidents changed since the previous drain(), oldest first"""
+        rows = np.flatnonzero(self.dirty)
+        self.dirty[rows] = False
+        rows = rows[np.argsort(self.number[rows])]
+        return [self.incident(row) for row in rows.tolist()]
+
+    def active(self):
+        """Open incidents, highest risk first"""
+        rows = sorted(self.open.values(), key=lambda row: -self.risk[row])
+        return [self.incident(row) for row in rows]
+
+
+class FusionStage:
+    """Combines the verdicts of AnomalyEngine.evaluate_batch into risk and incidents.
+
+    One stage is shared by all detector threads of an engine (see
+    AnomalyEngine.enable_fusion); updates hold a lock, so drain() may be called
+    from the consumer thread.
+    """
+
+    def __init__(self, half_life=DEFAULT_HALF_LIFE, gap=DEFAULT_GAP, capacity=DEFAULT_CAPACITY, weights=None,
+                 max_ai_ratio=MAX_AI_RATIO):
+        self.weights = np.ones(256, dtype=np.float64)  # rule code → weight, 1 for unknown rules
+        for rule, weight in {**RULE_WEIGHTS, **(weights or {})}.items():
+            self.weights[rule] = weight
+        self.max_ai_ratio = max_ai_ratio
+        self.scores = RiskScore(half_life)
+        self.incidents = IncidentTable(capacity, gap)
+        self.now = -np.inf  # latest frame time seen
+        self._lock = threading.Lock()
+
+    def update(self, block, ai, ratio, findings):
+        """Risk after every frame of `block`.
+
+        `ai` flags the AI detections, `ratio` is their loss / threshold; `findings`
+        is the BatchFindings of the heuristics (anything else counts as no findings).
+        """
+        n = len(block)
+        ai_rows = np.flatnonzero(ai)
+        contributions = np.zeros(n, dtype=np.float64)
+        ai_ratio = np.minimum(ratio[ai_rows], self.max_ai_ratio).astype(np.float64)
+        contributions[ai_rows] = self.weights[RULE_AI] * ai_ratio
+
+        if isinstance(findings, BatchFindings):
+            rows, rule, arb_id, byte, mask, delta = findings.columns()
+            contributions += np.bincount(rows, weights=self.weights[rule], minlength=n)
+        else:
+            rows = np.zeros(0, dtype=np.int64)
+            rule = arb_id = byte = mask = delta = rows
+
+        with self._lock:
+            risk = self.scores.update(block.timestamp, block.arbitration_id, contributions)
+            if n:
+                self.now = max(self.now, float(block.timestamp.max()))
+            self.incidents.add(
+                np.concatenate((block.timestamp[ai_rows], block.timestamp[rows])),
+                np.concatenate((block.arbitration_id[ai_rows], arb_id)).astype(np.uint32),
+                np.concatenate((np.full(len(ai_rows), RULE_AI, dtype=np.uint8), rule)).astype(np.uint8),
+                np.concatenate((np.full(len(ai_rows), -1), byte)),
+                np.concatenate((np.zeros(len(ai_rows)), mask)),
+                np.concatenate((ai_ratio, delta)),
+                np.concatenate((risk[ai_rows], risk[rows])),
+            )
+        return risk
+
+    def update_findings(self, now, findings):
+        """Findings without a frame (AnomalyEngine.poll): they add to the risk at `now`"""
+        records = findings.records()
+        if not records:
+            return
+        rule, arb_id, byte, mask, delta = (np.array(column) for column in zip(*records))
+        arb_id = arb_id.astype(np.uint32)
+        rule = rule.astype(np.uint8)
+        times = np.full(len(records), float(now))
+        with self._lock:
+            risk = self.scores.update(times, arb_id, self.weights[rule])
+            self.now = max(self.now, float(now))
+            self.incidents.add(times, arb_id, rule, byte, mask, delta, risk)
+
+    def drain(self, now=None):
+        """Incidents changed since the previous call; incidents quiet for `gap` seconds
+        before `now` (default: the latest frame time) are closed first"""
+        with self._lock:
+            self.incidents.close(self.now if now is None else now)
+            return self.incidents.drain()
+
+    def risk(self, now=None):
+        """(ids, risk) of all IDs decayed to `now` (default: the latest frame time)"""
+        with self._lock:
+            return self.scores.current(self.now if now is None else now)
+
+    def stats(self):
+        table = self.incidents
+        return {"findings": table.findings, "incidents": table.opened, "open": len(table.open),
+                "evicted": table.evicted}
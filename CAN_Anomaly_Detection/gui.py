@@ -1,8 +1,11 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import threading
+import numpy as np
 from can_input import CANReader
 from anomaly_engine import AnomalyEngine
+from history import FrameHistory
+from pipeline import DetectionPipeline, BLOCK, DROP_NEWEST
 import os
 
 class CANAnomalyDetectorApp:
@@ -13,13 +16,21 @@ class CANAnomalyDetectorApp:
         self.anomaly_engine = AnomalyEngine()
         self.can_readers = []
         self.running = False
+        self.pipeline = None
+        self.history = FrameHistory()
+        self.learned_frames = 0
+        self.drain_interval_ms = 100
+        self.max_visible_rows = 1000  # older rows are evicted from the table, they stay in self.history
 
         self.mode = tk.StringVar(value="interface")
         self.file_paths = []
+        self.merge_files = tk.BooleanVar(value=False)
         self.interface = tk.StringVar(value="vector")
         self.channel = tk.StringVar(value="0")
         self.bitrate = tk.StringVar(value="500000")
         self.threshold = tk.DoubleVar(value=0.1)
+        self.view = tk.StringVar(value="anomalies")
+        self.sample_every = tk.IntVar(value=100)
 
         self.build_gui()
 
@@ -34,10 +45,11 @@ class CANAnomalyDetectorApp:
         self.files_label = ttk.Label(frame, text="Nie wybrano plików")
         self.files_label.grid(row=1, column=0, columnspan=2, sticky="w")
         ttk.Button(frame, text="Wybierz pliki", command=self.choose_files).grid(row=1, column=2)
+        ttk.Checkbutton(frame, text="Scal według czasu", variable=self.merge_files).grid(row=1, column=3, sticky="w")
 
         ttk.Label(frame, text="Interfejs:").grid(row=2, column=0, sticky="e")
         ttk.Entry(frame, textvariable=self.interface).grid(row=2, column=1, sticky="w")
-        ttk.Label(frame, text="Kanał:").grid(row=3, column=0, sticky="e")
+        ttk.Label(frame, text="Kanał(y):").grid(row=3, column=0, sticky="e")
         ttk.Entry(frame, textvariable=self.channel).grid(row=3, column=1, sticky="w")
         ttk.Label(frame, text="Bitrate:").grid(row=4, column=0, sticky="e")
         ttk.Entry(frame, textvariable=self.bitrate).grid(row=4, column=1, sticky="w")
@@ -52,6 +64,13 @@ class CANAnomalyDetectorApp:
         ttk.Button(frame, text="Zapisz model", command=self.save_model).grid(row=7, column=0, pady=5)
         ttk.Button(frame, text="Wczytaj model", command=self.load_model).grid(row=7, column=1, pady=5)
 
+        ttk.Label(frame, text="Widok:").grid(row=8, column=0, sticky="e")
+        ttk.Radiobutton(frame, text="Tylko anomalie", variable=self.view, value="anomalies").grid(row=8, column=1, sticky="w")
+        ttk.Radiobutton(frame, text="Próbkowany", variable=self.view, value="sampled").grid(row=8, column=2, sticky="w")
+        ttk.Radiobutton(frame, text="Wszystkie", variable=self.view, value="all").grid(row=8, column=3, sticky="w")
+        ttk.Label(frame, text="Co N ramek:").grid(row=9, column=0, sticky="e")
+        ttk.Entry(frame, textvariable=self.sample_every, width=10).grid(row=9, column=1, sticky="w")
+
         columns = ("timestamp", "id", "dlc", "data", "ai", "loss", "heur")
         self.tree = ttk.Treeview(self.root, columns=columns, show="headings", height=20)
         for col in columns:
@@ -63,8 +82,12 @@ class CANAnomalyDetectorApp:
         self.tree.configure(yscroll=scrollbar.set)
         scrollbar.grid(row=8, column=1, sticky="ns")
 
+        self.status_label = ttk.Label(self.root, text="")
+        self.status_label.grid(row=9, column=0, padx=10, sticky="w")
+
     def choose_files(self):
-        files = filedialog.askopenfilenames(filetypes=[("Log files", "*.blf *.asc")])
+        files = filedialog.askopenfilenames(filetypes=[
+            ("Log files", "*.blf *.asc *.trc *.mf4 *.log *.csv *.gz *.zst"), ("All files", "*")])
         if files:
             self.file_paths = list(files)
             self.files_label.config(text=f"Wybrano {len(files)} plików")
@@ -72,12 +95,17 @@ class CANAnomalyDetectorApp:
     def prepare_readers(self):
         self.can_readers = []
         if self.mode.get() == "interface":
+            # "0, 1" opens both channels and merges them by timestamp
+            channels = [channel.strip() for channel in self.channel.get().split(",") if channel.strip()]
             self.can_readers.append(CANReader(
                 source="interface",
                 interface=self.interface.get(),
-                channel=self.channel.get(),
+                channel=channels if len(channels) > 1 else self.channel.get(),
                 bitrate=int(self.bitrate.get())
             ))
+        elif self.merge_files.get() and len(self.file_paths) > 1:
+            # Parallel recordings of several channels: one time-ordered stream
+            self.can_readers.append(CANReader(source="file", filepath=self.file_paths))
         else:
             for path in self.file_paths:
                 self.can_readers.append(CANReader(
@@ -88,59 +116,125 @@ class CANAnomalyDetectorApp:
     def learn_normal(self):
         self.prepare_readers()
         self.running = True
+        self.learned_frames = 0
         self.tree.delete(*self.tree.get_children())
         self.anomaly_engine.ai.threshold = self.threshold.get()
-        threading.Thread(target=self._learn_thread).start()
+        thread = threading.Thread(target=self._learn_thread)
+        thread.start()
+        self.root.after(self.drain_interval_ms, self._show_learning_progress, thread)
 
     def start_detection(self):
         self.prepare_readers()
         self.running = True
         self.tree.delete(*self.tree.get_children())
+        self.history = FrameHistory()
         self.anomaly_engine.ai.threshold = self.threshold.get()
-        threading.Thread(target=self._detect_thread).start()
+        # A log file can wait for the detector; a live bus must not, there the newest frames are dropped
+        frame_policy = BLOCK if self.mode.get() == "file" else DROP_NEWEST
+        self.pipeline = DetectionPipeline(self.anomaly_engine, self.can_readers, frame_policy=frame_policy).start()
+        self.root.after(self.drain_interval_ms, self._drain_results)
 
     def stop(self):
         self.running = False
+        if self.pipeline is not None:
+            self.pipeline.stop()
 
     def save_model(self):
         path = filedialog.asksaveasfilename(defaultextension=".pth", filetypes=[("Model files", "*.pth")])
         if path:
-            self.anomaly_engine.ai.save_model(path)
+            self.anomaly_engine.save_model(path)
             messagebox.showinfo("Zapisano", f"Model zapisany do {path}")
 
     def load_model(self):
         path = filedialog.askopenfilename(filetypes=[("Model files", "*.pth")])
         if path:
-            self.anomaly_engine.ai.load_model(path)
+            self.anomaly_engine.load_model(path)
             self.threshold.set(self.anomaly_engine.ai.threshold)
             messagebox.showinfo("Załadowano", f"Model załadowany z {path}")
 
     def _learn_thread(self):
-        messages = []
-        for reader in self.can_readers:
-            for msg in reader.read():
-                if not self.running:
-                    break
-                messages.append(msg)
-                self.root.after(0, self.display_frame, msg, False, 0.0, [])
-        self.anomaly_engine.train_ai(messages)
-
-    def _detect_thread(self):
+        stats = self.anomaly_engine.train(self._learning_frames())
+        if stats:
+            self.root.after(0, messagebox.showinfo, "Uczenie zakończone",
+                            f"Ramek: {stats['frames']}, {stats['frames_per_s']:.0f} ramek/s, "
+                            f"szczytowe RSS: {stats['peak_rss_mb'] or 0:.0f} MB")
+
+    def _learning_frames(self):
+        # Frames are streamed straight into the trainer, the log is never kept in memory
         for reader in self.can_readers:
             for msg in reader.read():
                 if not self.running:
-                    break
-                result = self.anomaly_engine.evaluate(msg, return_loss=True)
-                self.root.after(0, self.display_frame, msg, result["ai"], result.get("loss", 0.0), result["heur"])
-
-    def display_frame(self, msg, ai_anomaly, loss, heuristics):
-        self.tree.insert("", "end", values=(
-            f"{msg.timestamp:.6f}",
-            f"{msg.arbitration_id:X}",
-            f"{msg.dlc}",
-            ' '.join(f"{b:02X}" for b in msg.data),
-            "TAK" if ai_anomaly else "",
-            f"{loss:.5f}" if ai_anomaly else "",
-            "; ".join(heuristics)
-        ))
+                    return
+                self.learned_frames += 1
+                yield msg
+
+    def _show_learning_progress(self, thread):
+        self.status_label.config(text=f"Uczenie: {self.learned_frames} ramek")
+        if thread.is_alive():
+            self.root.after(self.drain_interval_ms, self._show_learning_progress, thread)
+
+    def _drain_results(self):
+        """Runs on the Tk thread every drain_interval_ms, the detector threads never touch Tk.
+
+        Everything drained goes to the history; the table only gets the rows of the
+        current view (anomalies, every N-th frame or all) and keeps max_visible_rows.
+        """
+        pipeline = self.pipeline
+        if pipeline is None:
+            return
+        start = len(self.history)
+        events = []
+        for messages, results in pipeline.results.get_batch(pipeline.results.capacity, timeout=0):
+            if messages is None:
+                self.history.add_event(*results)
+                events.append(results)
+            else:
+                self.history.append_batch(messages, results)
+        self.display_rows(self._visible_rows(start, len(self.history)))
+        for timestamp, findings in events:
+            self.display_event(timestamp, findings)
+        self._evict_rows()
         self.tree.yview_moveto(1.0)
+        self.show_pipeline_stats(pipeline.stats())
+        if pipeline.running or not pipeline.results.finished:
+            self.root.after(self.drain_interval_ms, self._drain_results)
+
+    def _visible_rows(self, start, stop):
+        view = self.view.get()
+        if view == "all":
+            rows = np.arange(start, stop)
+        else:
+            rows = self.history.anomalous(start, stop)
+            if view == "sampled":
+                try:
+                    step = max(1, self.sample_every.get())
+                except tk.TclError:
+                    step = 1
+                first = -(-start // step) * step
+                rows = np.union1d(rows, np.arange(first, stop, step))
+        # Anything older would be evicted from the table right away
+        return rows[-self.max_visible_rows:]
+
+    def _evict_rows(self):
+        children = self.tree.get_children()
+        excess = len(children) - self.max_visible_rows
+        if excess > 0:
+            self.tree.delete(*children[:excess])
+
+    def show_pipeline_stats(self, stats):
+        frames = stats["frames"]
+        results = stats["results"]
+        self.status_label.config(text=(
+            f"Ramek: {stats['processed']} (w historii: {len(self.history)})  |  "
+            f"kolejka ramek: {sum(q['depth'] for q in frames)} (maks. {max(q['high_watermark'] for q in frames)}), "
+            f"odrzucone: {sum(q['dropped'] for q in frames)}  |  "
+            f"kolejka wyników: {results['depth']} (maks. {results['high_watermark']}), "
+            f"odrzucone: {results['dropped']}"
+        ))
+
+    def display_event(self, timestamp, heuristics):
+        self.tree.insert("", "end", values=(f"{timestamp:.6f}", "", "", "", "", "", "; ".join(heuristics)))
+
+    def display_rows(self, rows):
+        for row in rows.tolist():
+            self.tree.insert("", "end", values=self.history.row_values(row))
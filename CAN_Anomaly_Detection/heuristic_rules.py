@@ -1,62 +1,317 @@
+import io
 import time
 from collections import defaultdict
 
-DM1_PGN = 0xFECA  # J1939 PGN for DM1 messages (65226)
+import numpy as np
+
+from findings import (NO_FINDINGS, RULE_BIT_RISE, RULE_DM1_FAULT, RULE_PERIOD_FAST, RULE_PERIOD_LATE, RULE_SILENT,
+                      RULE_TIMEOUT, BatchFindings, FindingBuffer, Findings)
+from frames import iter_blocks
+from id_table import IdTable, grow
+from j1939 import DM1_PGN, TP_CM_PGN, TP_DT_PGN, TransportReassembler, dm1_dtcs, dm1_dtcs_batch, pgn_of, pgn_of_batch
+from scheduler import DeadlineWheel
+from timing import CycleTimeModel
+
 DEFAULT_TIMEOUT = 0.5  # seconds
+MAX_PAYLOAD = 64  # CAN FD
+
+
+def group_by_slot(slots):
+    """Stable grouping of a block by ID slot.
+
+    Returns (order, sorted_slots, first, last): frames sorted by slot keeping time
+    order within a slot, and masks (in sorted order) of each slot's first/last frame.
+    """
+    order = np.argsort(slots, kind="stable")
+    sorted_slots = slots[order]
+    first = np.ones(len(slots), dtype=bool)
+    first[1:] = sorted_slots[1:] != sorted_slots[:-1]
+    last = np.ones(len(slots), dtype=bool)
+    last[:-1] = first[1:]
+    return order, sorted_slots, first, last
+
 
 class HeuristicEngine:
-    def __init__(self, timeout_s=DEFAULT_TIMEOUT):
-        self.last_seen = {}  # ID → timestamp
-        self.prev_data = {}  # ID → data bytes
+    """Rule based checks. Per-ID state lives in flat arrays indexed by a dense IdTable,
+    shared by the per-frame check() and the vectorised check_batch()."""
+
+    def __init__(self, timeout_s=DEFAULT_TIMEOUT, findings_capacity=1 << 16):
+        self.ids = IdTable()
+        self.last_seen = np.zeros(0, dtype=np.float64)  # slot → timestamp (NaN = never seen)
+        self.prev_len = np.zeros(0, dtype=np.int16)     # slot → length of previous payload
+        self._prev_buf = bytearray()                     # slot → previous payload (MAX_PAYLOAD bytes)
+        self.prev_data = np.zeros((0, MAX_PAYLOAD), dtype=np.uint8)
         self.timeout_s = timeout_s
         self.anomalies = defaultdict(list)  # ID → [reason, ...]
+        self.findings = FindingBuffer(findings_capacity)
+        self.timing = CycleTimeModel(self.ids)
+        # IDs that stop transmitting for good: deadline = last frame + allowed interval
+        self.deadlines = DeadlineWheel()
+        # Multi-packet J1939 messages (e.g. DM1 with several DTCs) arrive through TP.CM/TP.DT
+        self.transport = TransportReassembler()
+
+    def _ensure_capacity(self, size):
+        if size <= len(self.last_seen):
+            return
+        self.last_seen = grow(self.last_seen, size, fill=np.nan)
+        capacity = len(self.last_seen)
+        self.prev_len = grow(self.prev_len, capacity)
+        buf = bytearray(capacity * MAX_PAYLOAD)
+        buf[:len(self._prev_buf)] = self._prev_buf
+        self._prev_buf = buf
+        # NumPy view on the same memory, used by check_batch()
+        self.prev_data = np.frombuffer(buf, dtype=np.uint8).reshape(capacity, MAX_PAYLOAD)
+        self.timing.ensure_capacity(capacity)
+        self.deadlines.ensure_capacity(capacity)
+
+    def learn(self, msg):
+        """Learn the cycle time of the frame's ID from normal traffic"""
+        self.timing.learn(msg.timestamp, self.ids.add(msg.arbitration_id))
+
+    def learn_batch(self, block):
+        slots = self.ids.add_batch(block.arbitration_id)
+        self._ensure_capacity(len(self.ids))
+        self.timing.learn_batch(block.timestamp, slots, *group_by_slot(slots))
+
+    def learn_stream(self, messages, block_size=16384):
+        for block in iter_blocks(messages, block_size):
+            self.learn_batch(block)
+
+    def save_state(self, path):
+        """Save what was learned (ID table and cycle times) to an .npz file"""
+        np.savez(path, ids=self.ids.to_array(), timeout_s=self.timeout_s, **self.timing.state())
+
+    def load_state(self, path):
+        """Load learned state; the detection state (last frames seen) starts from scratch"""
+        with np.load(path) as state:
+            self.__init__(timeout_s=float(state["timeout_s"]), findings_capacity=self.findings.capacity)
+            for arb_id in state["ids"].tolist():
+                self.ids.add(arb_id)
+            self._ensure_capacity(len(self.ids))
+            self.timing.load_state(state["count"], state["mean"], state["m2"])
+
+    def reset(self):
+        """Forget the frames seen so far, keep what was learned"""
+        state = io.BytesIO()
+        self.save_state(state)
+        state.seek(0)
+        self.load_state(state)
 
     def check(self, msg):
+        """Findings of one frame (integer coded, formatted only when displayed)"""
         timestamp = msg.timestamp
         arb_id = msg.arbitration_id
-        reasons = []
+        findings = self.findings
+        start = findings.written
 
-        # 1. Timeout check
-        if arb_id in self.last_seen:
-            delta = timestamp - self.last_seen[arb_id]
-            if delta > self.timeout_s:
-                reasons.append(f"Timeout: brak ID {hex(arb_id)} przez {delta:.2f}s")
-        self.last_seen[arb_id] = timestamp
+        slot = self.ids.add(arb_id)
+        if slot >= len(self.last_seen):
+            self._ensure_capacity(slot + 1)
+
+        # 1. Timing: learned period of the ID if it has one, global timeout otherwise
+        last = self.last_seen[slot]
+        late = self.timing.late[slot]
+        if last == last:  # seen before (not NaN)
+            delta = timestamp - last
+            if late == late:
+                if delta > late:
+                    findings.append(RULE_PERIOD_LATE, arb_id, delta=delta)
+                elif delta < self.timing.fast[slot]:
+                    findings.append(RULE_PERIOD_FAST, arb_id, delta=delta)
+            elif delta > self.timeout_s:
+                findings.append(RULE_TIMEOUT, arb_id, delta=delta)
+        self.last_seen[slot] = timestamp
+        self.deadlines.touch(slot, timestamp + (late if late == late else self.timeout_s))
 
         # 2. Bit change detection
-        if arb_id in self.prev_data:
-            prev = self.prev_data[arb_id]
-            current = bytes(msg.data)
-            if len(prev) == len(current):
+        current = bytes(msg.data)[:MAX_PAYLOAD]
+        offset = slot * MAX_PAYLOAD
+        if self.prev_len[slot] == len(current):
+            prev = self._prev_buf[offset:offset + len(current)]
+            if ~int.from_bytes(prev, "big") & int.from_bytes(current, "big"):
                 for i in range(len(current)):
                     changed = (~prev[i] & current[i]) & 0xFF  # 0→1 bits
                     if changed:
-                        reasons.append(f"Bit 0→1 w bajcie {i}: {bin(changed)}")
-        self.prev_data[arb_id] = bytes(msg.data)
+                        findings.append(RULE_BIT_RISE, arb_id, i, changed)
+        self._prev_buf[offset:offset + len(current)] = current
+        self.prev_len[slot] = len(current)
+
+        # 3. DM1 content check (SPN/FMI errors in data), single frame or reassembled
+        pgn = pgn_of(arb_id)
+        if pgn == DM1_PGN:
+            self._append_dtcs(arb_id, current)
+        elif pgn == TP_DT_PGN or pgn == TP_CM_PGN:
+            completed = self.transport.feed(arb_id, current, timestamp)
+            if completed is not None and completed[0] == DM1_PGN:
+                self._append_dtcs(0x18FECA00 | completed[1], completed[2])
+
+        count = findings.written - start
+        return Findings(findings, start, count) if count else NO_FINDINGS
+
+    def check_batch(self, block, lengths=None):
+        """check() for a whole FrameBlock with array operations.
+
+        `lengths` are the real payload lengths (frames.payload_lengths: 0 for remote
+        frames). Given them and a block wide enough for the longest payload (MAX_PAYLOAD
+        with CAN FD), item i of the returned BatchFindings has the same content as check()
+        would return for frame i. Without them the DLC column stands in, which differs
+        from check() for remote frames, and payload bytes past the block width are not
+        compared.
+        """
+        n = len(block)
+        if n == 0:
+            return BatchFindings(self.findings, self.findings.written, np.zeros(1, dtype=np.int64))
+
+        timestamps = block.timestamp
+        ids = block.arbitration_id
+        lengths = (block.dlc if lengths is None else lengths).astype(np.int16)
+        width = min(block.data.shape[1], MAX_PAYLOAD)
+        data = block.data[:, :width]
+
+        slots = self.ids.add_batch(ids)
+        self._ensure_capacity(len(self.ids))
+
+        # Group the frames by ID and find, for every frame, the previous frame of the
+        # same ID: either in this block or in the state
+        order, sorted_slots, first, last = group_by_slot(slots)
+        prev_row = np.empty(n, dtype=np.int64)
+        prev_row[order[1:]] = order[:-1]
+
+        first_rows = order[first]
+        first_slots = sorted_slots[first]
+        inner_rows = order[~first]
+
+        prev_ts = np.empty(n, dtype=np.float64)
+        prev_ts[first_rows] = self.last_seen[first_slots]
+        prev_ts[inner_rows] = timestamps[prev_row[inner_rows]]
+
+        prev_len = np.empty(n, dtype=np.int16)
+        prev_len[first_rows] = self.prev_len[first_slots]
+        prev_len[inner_rows] = lengths[prev_row[inner_rows]]
+
+        prev_data = np.empty_like(data)
+        prev_data[first_rows] = self.prev_data[first_slots, :width]
+        prev_data[inner_rows] = data[prev_row[inner_rows]]
+
+        # 1. Timing: learned period where there is one, global timeout otherwise
+        # (NaN for never seen IDs / IDs without a period compares False)
+        delta = timestamps - prev_ts
+        late_limit = self.timing.late[slots]
+        modelled = late_limit == late_limit
+        with np.errstate(invalid="ignore"):
+            late = delta > late_limit
+            fast = (delta < self.timing.fast[slots]) & ~late
+            timeout = (delta > self.timeout_s) & ~modelled
+
+        # 2. Bit change detection, only between payloads of equal length
+        rises = ~prev_data & data
+        rises[prev_len != lengths] = 0
+
+        # 3. DM1 content check: single frame DM1s vectorised, transport frames (few) one by one
+        pgns = pgn_of_batch(ids)
+        dm1 = np.flatnonzero(pgns == DM1_PGN)
+        dm1_rows, spn, fmi, oc = dm1_dtcs_batch(data[dm1], lengths[dm1])
+        dm1_rows = dm1[dm1_rows]
+        dm1_ids = ids[dm1_rows]
+        transport = np.flatnonzero((pgns == TP_DT_PGN) | (pgns == TP_CM_PGN))
+        if len(transport):
+            tp_rows, tp_ids, tp_dtcs = self._feed_transport(transport, timestamps, ids, data, lengths)
+            if tp_rows:
+                dm1_rows = np.concatenate((dm1_rows, np.array(tp_rows, dtype=np.int64)))
+                dm1_ids = np.concatenate((dm1_ids, np.array(tp_ids, dtype=np.uint32)))
+                tp_dtcs = np.array(tp_dtcs, dtype=np.int64).reshape(-1, 3)
+                spn = np.concatenate((spn, tp_dtcs[:, 0]))
+                fmi = np.concatenate((fmi, tp_dtcs[:, 1]))
+                oc = np.concatenate((oc, tp_dtcs[:, 2]))
+
+        # Update the per-ID state with the last frame of each ID in the block
+        last_rows = order[last]
+        last_slots = sorted_slots[last]
+        self.last_seen[last_slots] = timestamps[last_rows]
+        self.prev_len[last_slots] = lengths[last_rows]
+        self.prev_data[last_slots, :width] = data[last_rows]
+        allowed = self.timing.late[last_slots]
+        allowed[np.isnan(allowed)] = self.timeout_s
+        self.deadlines.touch_batch(last_slots, timestamps[last_rows] + allowed)
+
+        timeout_rows = np.flatnonzero(timeout)
+        late_rows = np.flatnonzero(late)
+        fast_rows = np.flatnonzero(fast)
+        rise_rows, rise_bytes = np.nonzero(rises)
+        return self._emit(n, ids, [
+            (late_rows, RULE_PERIOD_LATE, -1, 0, delta[late_rows]),
+            (fast_rows, RULE_PERIOD_FAST, -1, 0, delta[fast_rows]),
+            (timeout_rows, RULE_TIMEOUT, -1, 0, delta[timeout_rows]),
+            (rise_rows, RULE_BIT_RISE, rise_bytes, rises[rise_rows, rise_bytes], 0.0),
+            (dm1_rows, RULE_DM1_FAULT, oc, fmi, spn, dm1_ids),
+        ])
+
+    def poll(self, now):
+        """Timeouts of IDs that went silent and have not been seen since.
+
+        Call periodically from the detection thread (with `now` on the frame time base);
+        the cost only depends on the deadlines that come due, not on the number of IDs.
+        Also expires abandoned J1939 transport sessions.
+        """
+        self.transport.expire(now)
+        slots = self.deadlines.advance(now)
+        if not len(slots):
+            return NO_FINDINGS
+        ids = np.array([self.ids.ids[slot] for slot in slots.tolist()], dtype=np.uint32)
+        silent_for = now - self.last_seen[slots]
+        start = self.findings.extend(np.full(len(slots), RULE_SILENT, dtype=np.uint8), ids,
+                                     np.full(len(slots), -1, dtype=np.int8), np.zeros(len(slots), dtype=np.uint8),
+                                     silent_for)
+        return Findings(self.findings, start, len(slots))
+
+    def _emit(self, n, ids, groups):
+        """Write the findings of a batch of n frames to the ring buffer ordered by frame
+        (and by rule within a frame, in the order of `groups`).
+
+        groups: [(rows, rule, byte, mask, delta[, arb_ids]), ...], byte/mask/delta scalars or
+        per-row arrays; arb_ids defaults to the IDs of the rows
+        """
+        groups = [group for group in groups if len(group[0])]
+        if not groups:
+            return BatchFindings(self.findings, self.findings.written, np.zeros(n + 1, dtype=np.int64))
+        rows = np.concatenate([group[0] for group in groups])
+        arb_ids = np.concatenate([group[5] if len(group) > 5 else ids[group[0]] for group in groups])
+        rank = np.concatenate([np.full(len(group[0]), k, dtype=np.int64) for k, group in enumerate(groups)])
+        rule = np.concatenate([np.full(len(group[0]), group[1], dtype=np.uint8) for group in groups])
+        columns = []
+        for column, dtype in ((2, np.int8), (3, np.uint8), (4, np.float64)):
+            columns.append(np.concatenate([np.broadcast_to(np.asarray(group[column], dtype=dtype), len(group[0]))
+                                           for group in groups]))
+        order = np.lexsort((rank, rows))
+        rows = rows[order]
+        start = self.findings.extend(rule[order], arb_ids[order], columns[0][order], columns[1][order],
+                                     columns[2][order])
+        return BatchFindings(self.findings, start, np.searchsorted(rows, np.arange(n + 1)))
+
+    def _append_dtcs(self, arb_id, data):
+        for spn, fmi, oc in dm1_dtcs(data):
+            self.findings.append(RULE_DM1_FAULT, arb_id, oc, fmi, spn)
 
-        # 3. DM1 content check (SPN/FMI errors in data)
-        if self.is_dm1(msg):
-            if self.has_dm1_fault(msg):
-                reasons.append("DM1: zawiera błędy (DTC != 0)")
+    def _feed_transport(self, rows, timestamps, ids, data, lengths):
+        """Feed the TP.CM/TP.DT frames of a block to the reassembler (in time order).
 
-        return reasons
+        Returns (rows, arb ids, [(SPN, FMI, OC), ...]) of the DTCs of completed DM1s.
+        """
+        dtc_rows, dtc_ids, dtcs = [], [], []
+        for row, arb_id, timestamp, length in zip(rows.tolist(), ids[rows].tolist(),
+                                                  timestamps[rows].tolist(), lengths[rows].tolist()):
+            completed = self.transport.feed(arb_id, data[row, :length].tobytes(), timestamp)
+            if completed is not None and completed[0] == DM1_PGN:
+                for dtc in dm1_dtcs(completed[2]):
+                    dtc_rows.append(row)
+                    dtc_ids.append(0x18FECA00 | completed[1])
+                    dtcs.append(dtc)
+        return dtc_rows, dtc_ids, dtcs
 
     def is_dm1(self, msg):
         """Check if arbitration ID corresponds to PGN 65226 (DM1)"""
-        # For J1939: PGN = (ID >> 8) & 0xFFFF
-        pgn = (msg.arbitration_id >> 8) & 0xFFFF
-        return pgn == DM1_PGN
+        return pgn_of(msg.arbitration_id) == DM1_PGN
 
     def has_dm1_fault(self, msg):
-        """Check if DM1 frame contains actual DTCs (SPN/FMI != 0)"""
-        # DM1 DTCs start from byte 8, each DTC = 4 bytes
-        dtc_start = 8
-        dtc_count = (len(msg.data) - dtc_start) // 4
-        if dtc_count <= 0:
-            return False
-        for i in range(dtc_count):
-            base = dtc_start + i * 4
-            dtc_bytes = msg.data[base:base+4]
-            if any(b != 0xFF and b != 0x00 for b in dtc_bytes):
-                return True
-        return False
+        """Check if a single frame DM1 contains active DTCs (SPN/FMI != 0)"""
+        return bool(dm1_dtcs(msg.data))
@@ -0,0 +1,119 @@
+import numpy as np
+
+from findings import findings_columns, format_finding
+from frames import FrameBlock, PAYLOAD_WIDTH
+from id_table import grow
+
+
+class FrameHistory:
+    """Append-only columnar store of every scored frame (~30 bytes per frame).
+
+    The GUI table only shows a bounded window; everything that was scored stays
+    here. Findings are copied out of the ring buffer as integer columns when a frame
+    is appended (before the ring overwrites them) and formatted only for the rows
+    the table actually shows.
+    """
+
+    def __init__(self, width=PAYLOAD_WIDTH):
+        self.width = width
+        self.size = 0
+        self.timestamp = np.zeros(0, dtype=np.float64)
+        self.arbitration_id = np.zeros(0, dtype=np.uint32)
+        self.dlc = np.zeros(0, dtype=np.uint8)
+        self.data = np.zeros((0, width), dtype=np.uint8)
+        self.loss = np.zeros(0, dtype=np.float32)
+        self.ai = np.zeros(0, dtype=bool)
+        self.heur = np.zeros(0, dtype=bool)
+        # Heuristic findings, sorted by row: (rule, arb id, byte, mask, delta) as in findings.FindingBuffer
+        self.findings = 0
+        self.finding_row = np.zeros(0, dtype=np.int64)
+        self.finding_rule = np.zeros(0, dtype=np.uint8)
+        self.finding_arb_id = np.zeros(0, dtype=np.uint32)
+        self.finding_byte = np.zeros(0, dtype=np.int8)
+        self.finding_mask = np.zeros(0, dtype=np.uint8)
+        self.finding_delta = np.zeros(0, dtype=np.float64)
+        self.events = []   # (row count at the time, timestamp, reasons) of findings without a frame
+
+    def __len__(self):
+        return self.size
+
+    def _ensure_capacity(self, size):
+        if size > len(self.timestamp):
+            self.timestamp = grow(self.timestamp, size)
+            capacity = len(self.timestamp)
+            self.arbitration_id = grow(self.arbitration_id, capacity)
+            self.dlc = grow(self.dlc, capacity)
+            self.data = grow(self.data, capacity)
+            self.loss = grow(self.loss, capacity)
+            self.ai = grow(self.ai, capacity)
+            self.heur = grow(self.heur, capacity)
+
+    def append_batch(self, messages, results):
+        """Store a scored batch (AnomalyEngine.evaluate_batch output); returns the new rows as a range"""
+        block = FrameBlock.from_messages(messages, self.width)
+        start = self.size
+        stop = start + len(block)
+        self._ensure_capacity(stop)
+        self.timestamp[start:stop] = block.timestamp
+        self.arbitration_id[start:stop] = block.arbitration_id
+        self.dlc[start:stop] = block.dlc
+        self.data[start:stop] = block.data
+        self.loss[start:stop] = [result.loss for result in results]
+        self.ai[start:stop] = [result.ai for result in results]
+        heur = [result.heur for result in results]
+        self.heur[start:stop] = [bool(findings) for findings in heur]
+        self._append_findings(start, findings_columns(heur))
+        self.size = stop
+        return range(start, stop)
+
+    def _append_findings(self, start, columns):
+        frame = columns[0]
+        first = self.findings
+        stop = first + len(frame)
+        if len(self.finding_row) < stop:
+            self.finding_row = grow(self.finding_row, stop)
+            capacity = len(self.finding_row)
+            self.finding_rule = grow(self.finding_rule, capacity)
+            self.finding_arb_id = grow(self.finding_arb_id, capacity)
+            self.finding_byte = grow(self.finding_byte, capacity)
+            self.finding_mask = grow(self.finding_mask, capacity)
+            self.finding_delta = grow(self.finding_delta, capacity)
+        self.finding_row[first:stop] = frame + start
+        for column, values in zip((self.finding_rule, self.finding_arb_id, self.finding_byte, self.finding_mask,
+                                   self.finding_delta), columns[1:]):
+            column[first:stop] = values
+        self.findings = stop
+
+    def reasons(self, row):
+        """"; "-joined heuristic findings of a stored frame, formatted now"""
+        if not self.heur[row]:
+            return ""
+        rows = self.finding_row[:self.findings]
+        first, stop = np.searchsorted(rows, row, "left"), np.searchsorted(rows, row, "right")
+        if first == stop:
+            return "(wpis nadpisany)"
+        return "; ".join(format_finding(int(self.finding_rule[i]), int(self.finding_arb_id[i]),
+                                        int(self.finding_byte[i]), int(self.finding_mask[i]),
+                                        float(self.finding_delta[i])) for i in range(first, stop))
+
+    def add_event(self, timestamp, findings):
+        self.events.append((self.size, timestamp, "; ".join(findings)))
+
+    def anomalous(self, start=0, stop=None):
+        """Rows in [start, stop) flagged by the AI or the heuristics"""
+        stop = self.size if stop is None else stop
+        return np.flatnonzero(self.ai[start:stop] | self.heur[start:stop]) + start
+
+    def row_values(self, row):
+        """Treeview values of one stored frame"""
+        dlc = int(self.dlc[row])
+        ai = bool(self.ai[row])
+        return (
+            f"{self.timestamp[row]:.6f}",
+            f"{int(self.arbitration_id[row]):X}",
+            f"{dlc}",
+            ' '.join(f"{b:02X}" for b in self.data[row, :min(dlc, self.width)].tolist()),
+            "TAK" if ai else "",
+            f"{self.loss[row]:.5f}" if ai else "",
+            self.reasons(row),
+        )
@@ -0,0 +1,83 @@
+import numpy as np
+
+
+class IdTable:
+    """Dense index of arbitration IDs: every ID seen gets a slot 0..n-1.
+
+    Per-ID state is kept in flat NumPy arrays indexed by slot, so a lookup is one
+    dict access and batches are handled with array indexing.
+    """
+
+    def __init__(self, ids=()):
+        self.slots = {}  # ID → slot
+        self.ids = []    # slot → ID
+        for arb_id in ids:
+            self.add(int(arb_id))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, arb_id):
+        return arb_id in self.slots
+
+    def add(self, arb_id):
+        slot = self.slots.get(arb_id)
+        if slot is None:
+            slot = len(self.ids)
+            self.slots[arb_id] = slot
+            self.ids.append(arb_id)
+        return slot
+
+    def get(self, arb_id, default=-1):
+        return self.slots.get(arb_id, default)
+
+    def add_batch(self, ids):
+        """Slots of an array of IDs, registering the new ones"""
+        unique, inverse = np.unique(ids, return_inverse=True)
+        slots = np.fromiter((self.add(int(arb_id)) for arb_id in unique), dtype=np.int64, count=len(unique))
+        return slots[inverse]
+
+    def get_batch(self, ids):
+        """Slots of an array of IDs, -1 for IDs not in the table"""
+        unique, inverse = np.unique(ids, return_inverse=True)
+        get = self.slots.get
+        slots = np.fromiter((get(int(arb_id), -1) for arb_id in unique), dtype=np.int64, count=len(unique))
+        return slots[inverse]
+
+    def to_array(self):
+        return np.array(self.ids, dtype=np.uint32)
+
+
+def grow(array, size, fill=0):
+    """Return `array` enlarged (geometrically) so that it holds at least `size` rows"""
+    if len(array) >= size:
+        return array
+    new_size = max(size, 2 * len(array), 64)
+    grown = np.full((new_size,) + array.shape[1:], fill, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+def merge_moments(count, mean, m2, slots, values):
+    """Merge `values` (grouped by `slots`) into per-slot running count/mean/M2 arrays, in place.
+
+    Batch form of Welford's algorithm (Chan et al.), so statistics are built in one
+    streaming pass without keeping the samples.
+    """
+    n = len(count)
+    values = values.astype(np.float64)
+    count_b = np.bincount(slots, minlength=n)
+    mean_b = np.bincount(slots, weights=values, minlength=n) / np.maximum(count_b, 1)
+    centered = values - mean_b[slots]
+    m2_b = np.bincount(slots, weights=centered * centered, minlength=n)
+
+    present = np.flatnonzero(count_b)
+    count_b = count_b[present]
+    mean_b = mean_b[present]
+    count_a = count[present]
+    mean_a = mean[present]
+    total = count_a + count_b
+    delta = mean_b - mean_a
+    mean[present] = mean_a + delta * count_b / total
+    m2[present] += m2_b[present] + delta * delta * count_a * count_b / total
+    count[present] = total
@@ -0,0 +1,179 @@
+import numpy as np
+
+DM1_PGN = 0xFECA   # active diagnostic trouble codes (65226)
+TP_CM_PGN = 0xEC00  # transport protocol, connection management (60416)
+TP_DT_PGN = 0xEB00  # transport protocol, data transfer (60160)
+
+TP_RTS = 0x10
+TP_CTS = 0x11
+TP_EOM_ACK = 0x13
+TP_BAM = 0x20
+TP_ABORT = 0xFF
+
+TP_MAX_SIZE = 1785   # 255 packets * 7 bytes
+TP_TIMEOUT = 0.75    # T1: max gap between packets of one session [s]
+GLOBAL_ADDRESS = 0xFF
+
+
+def pgn_of(arb_id):
+    """PGN of a 29-bit J1939 identifier (destination address stripped for PDU1)"""
+    pgn = (arb_id >> 8) & 0x3FFFF
+    if (pgn & 0xFF00) < 0xF000:  # PDU1: PS is the destination address
+        pgn &= 0x3FF00
+    return pgn
+
+
+def pgn_of_batch(ids):
+    pgn = (ids >> 8) & 0x3FFFF
+    return np.where((pgn & 0xFF00) < 0xF000, pgn & 0x3FF00, pgn)
+
+
+def decode_dtc(b0, b1, b2, b3):
+    """(SPN, FMI, OC) of one 4-byte DTC (SPN conversion method 4)"""
+    spn = b0 | (b1 << 8) | ((b2 & 0xE0) << 11)
+    return spn, b2 & 0x1F, b3 & 0x7F
+
+
+def dm1_dtcs(data):
+    """Active DTCs [(SPN, FMI, OC), ...] of a DM1 payload: 2 lamp status bytes, then 4 bytes per DTC.
+
+    All-zero and 0xFF padded entries mean "no DTC".
+    """
+    dtcs = []
+    for base in range(2, len(data) - 3, 4):
+        b0, b1, b2, b3 = data[base:base + 4]
+        if b0 == b1 == b2 == b3 == 0xFF:
+            continue
+        spn, fmi, oc = decode_dtc(b0, b1, b2, b3)
+        if spn or fmi:
+            dtcs.append((spn, fmi, oc))
+    return dtcs
+
+
+def dm1_dtcs_batch(data, lengths):
+    """Vectorised dm1_dtcs() over a payload matrix: (rows, spn, fmi, oc) arrays, in row and DTC order"""
+    slots = (data.shape[1] - 2) // 4
+    if slots <= 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty, empty
+    dtc = data[:, 2:2 + slots * 4].reshape(len(data), slots, 4).astype(np.int64)
+    spn = dtc[:, :, 0] | (dtc[:, :, 1] << 8) | ((dtc[:, :, 2] & 0xE0) << 11)
+    fmi = dtc[:, :, 2] & 0x1F
+    oc = dtc[:, :, 3] & 0x7F
+    active = ((spn != 0) | (fmi != 0)) & ~(dtc == 0xFF).all(axis=2)
+    active &= np.arange(slots) < ((lengths.astype(np.int64) - 2) // 4)[:, None]
+    rows, columns = np.nonzero(active)
+    return rows, spn[rows, columns], fmi[rows, columns], oc[rows, columns]
+
+
+class TransportReassembler:
+    """Passive J1939 transport protocol (TP.CM / TP.DT) reassembly, BAM and RTS/CTS.
+
+    Sessions are keyed by (source, destination) address (destination 0xFF for BAM).
+    The pool of sessions and their buffers is preallocated, so following a transfer
+    costs a slice copy per TP.DT frame; only a completed message is copied out.
+    When the pool is full the least recently active session is dropped.
+    """
+
+    def __init__(self, max_sessions=64, timeout_s=TP_TIMEOUT):
+        self.timeout_s = timeout_s
+        self.buffers = [bytearray(TP_MAX_SIZE) for _ in range(max_sessions)]
+        self.keys = [None] * max_sessions
+        self.pgn = [0] * max_sessions
+        self.size = [0] * max_sessions
+        self.packets = [0] * max_sessions
+        self.next_seq = [0] * max_sessions
+        self.last_ts = [0.0] * max_sessions
+        self.sessions = {}  # (source, destination) → pool index
+        self.completed = 0
+        self.errors = 0     # timeouts, sequence errors, aborts, evictions
+
+    def feed(self, arb_id, data, timestamp):
+        """Process one frame; returns (pgn, source address, payload) when a transfer completes"""
+        pf = (arb_id >> 16) & 0xFF
+        if pf == 0xEC:
+            self._connection_management(arb_id, data, timestamp)
+        elif pf == 0xEB:
+            return self._data_transfer(arb_id, data, timestamp)
+        return None
+
+    def _connection_management(self, arb_id, data, timestamp):
+        if len(data) < 8:
+            return
+        source = arb_id & 0xFF
+        destination = (arb_id >> 8) & 0xFF
+        control = data[0]
+        if control == TP_BAM or control == TP_RTS:
+            size = data[1] | (data[2] << 8)
+            packets = data[3]
+            if not 9 <= size <= TP_MAX_SIZE or packets != (size + 6) // 7:
+                self.errors += 1
+                return
+            key = (source, GLOBAL_ADDRESS if control == TP_BAM else destination)
+            slot = self._open(key)
+            self.pgn[slot] = data[5] | (data[6] << 8) | (data[7] << 16)
+            self.size[slot] = size
+            self.packets[slot] = packets
+            self.next_seq[slot] = 1
+            self.last_ts[slot] = timestamp
+        elif control == TP_ABORT:
+            # Either side may abort a connection
+            for key in ((source, destination), (destination, source)):
+                if key in self.sessions:
+                    self._close(key)
+                    self.errors += 1
+
+    def _data_transfer(self, arb_id, data, timestamp):
+        source = arb_id & 0xFF
+        destination = (arb_id >> 8) & 0xFF
+        key = (source, destination)
+        slot = self.sessions.get(key)
+        if slot is None or len(data) < 2:
+            return None
+        seq = data[0]
+        if timestamp - self.last_ts[slot] > self.timeout_s or seq != self.next_seq[slot]:
+            self._close(key)
+            self.errors += 1
+            return None
+        offset = (seq - 1) * 7
+        chunk = data[1:8]
+        self.buffers[slot][offset:offset + len(chunk)] = chunk
+        self.last_ts[slot] = timestamp
+        if seq < self.packets[slot]:
+            self.next_seq[slot] = seq + 1
+            return None
+        payload = bytes(self.buffers[slot][:self.size[slot]])
+        pgn = self.pgn[slot]
+        self._close(key)
+        self.completed += 1
+        return pgn, source, payload
+
+    def expire(self, now):
+        """Drop the sessions idle for longer than the timeout (e.g. an abandoned BAM); returns how many.
+
+        Without it a timeout is only noticed when the next TP.DT of the session arrives.
+        """
+        expired = [key for key, slot in self.sessions.items() if now - self.last_ts[slot] > self.timeout_s]
+        for key in expired:
+            self._close(key)
+        self.errors += len(expired)
+        return len(expired)
+
+    def _open(self, key):
+        slot = self.sessions.get(key)
+        if slot is not None:
+            self.errors += 1  # new announcement interrupts the running transfer
+            return slot
+        try:
+            slot = self.keys.index(None)
+        except ValueError:
+            slot = min(range(len(self.keys)), key=self.last_ts.__getitem__)
+            del self.sessions[self.keys[slot]]
+            self.errors += 1
+        self.keys[slot] = key
+        self.sessions[key] = slot
+        return slot
+
+    def _close(self, key):
+        slot = self.sessions.pop(key)
+        self.keys[slot] = None
@@ -0,0 +1,222 @@
+# Log file formats of CANReader. The format is recognised by the first bytes of the
+# file (the extension is only a fallback), .gz/.zst files are decompressed on the fly,
+# and every format is read as a stream behind one interface (messages, batches, blocks).
+import csv
+import gzip
+import io
+import os
+import re
+from itertools import islice
+
+import can
+
+import blf
+from frames import iter_blocks
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+SNIFF_BYTES = 4096
+DEFAULT_BATCH = 4096
+
+# Fallback when the content is not conclusive (e.g. an empty file)
+EXTENSIONS = {
+    ".blf": "blf", ".asc": "asc", ".trc": "trc", ".mf4": "mf4", ".mdf": "mf4", ".log": "candump",
+    ".csv": "csv",
+}
+COMPRESSED_SUFFIXES = (".gz", ".zst", ".zstd")
+
+# (1700000000.123456) can0 18FEF100#FFFF...   candump -L, python-can's CanutilsLogWriter
+CANDUMP_LOG = re.compile(r"\(\d+\.\d+\)\s+\S+\s+[0-9A-Fa-f]+##?[0-9A-Fa-fR]*")
+# [(1700000000.123456)]  can0  18FEF100   [8]  FF FF ...   candump on a terminal, optionally with -t
+CANDUMP_TEXT = re.compile(r"(?:\((?P<time>[-\d.]+)\)\s+)?(?P<channel>\S+)\s+(?P<id>[0-9A-Fa-f]{3,8})\s+"
+                          r"\[(?P<dlc>\d+)\]\s*(?P<data>(?:[0-9A-Fa-f]{2}\s*)*)(?P<remote>remote request)?")
+ID_ROW = re.compile(r"0x[0-9A-Fa-f]+")
+
+
+def compression_of(path):
+    """"gzip", "zstd" or None, by the magic bytes"""
+    with open(path, "rb") as f:
+        head = f.read(len(ZSTD_MAGIC))
+    if head.startswith(GZIP_MAGIC):
+        return "gzip"
+    if head == ZSTD_MAGIC:
+        return "zstd"
+    return None
+
+
+def _zstd_reader(path):
+    try:
+        from compression import zstd  # Python 3.14+
+    except ImportError:
+        pass
+    else:
+        return zstd.ZstdFile(path)
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("Pliki .zst wymagają pakietu zstandard (pip install zstandard).") from None
+    reader = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True)
+    return io.BufferedReader(reader)
+
+
+def open_binary(path):
+    """The log as a binary stream, decompressed on the fly if it is gzip or zstd compressed"""
+    compression = compression_of(path)
+    if compression == "gzip":
+        return gzip.open(path, "rb")
+    if compression == "zstd":
+        return _zstd_reader(path)
+    return open(path, "rb")
+
+
+def open_text(path):
+    return io.TextIOWrapper(open_binary(path), encoding="utf-8", errors="replace", newline="")
+
+
+def sniff(head):
+    """Format of a log from its first bytes (decompressed), None if they are not conclusive"""
+    if head.startswith(b"LOGG"):
+        return "blf"
+    if head.startswith((b"MDF     ", b"UnFinMF ")):
+        return "mf4"
+    text = head.decode("utf-8", "replace")
+    lines = [line.strip() for line in text.splitlines()[:-1] or text.splitlines()]
+    lines = [line for line in lines if line]
+    if not lines:
+        return None
+    first = lines[0]
+    lowered = first.lower()
+    if first.startswith(";$FILEVERSION") or (first.startswith(";") and "PCAN" in text):
+        return "trc"
+    if lowered.startswith(("date ", "base ")):
+        return "asc"
+    if CANDUMP_LOG.match(first):
+        return "candump"
+    if CANDUMP_TEXT.fullmatch(first):
+        return "candump-text"
+    if lowered.startswith("timestamp,arbitration_id"):
+        return "csv"  # python-can's CSVWriter
+    if lowered.replace(" ", "") == "timestamp,id,data":
+        return "logger-csv"  # Prototype Pentester/logger.py
+    if ID_ROW.fullmatch(first):
+        return "id-csv"  # PenTester/Reader_Logger_v2.py
+    return None
+
+
+def detect_format(path):
+    """Format of a log file (see READERS), by content first, then by extension"""
+    with open_binary(path) as f:
+        head = f.read(SNIFF_BYTES)
+    fmt = sniff(head)
+    if fmt is None:
+        name = path.lower()
+        for suffix in COMPRESSED_SUFFIXES:
+            if name.endswith(suffix):
+                name = name[:-len(suffix)]
+        fmt = EXTENSIONS.get(os.path.splitext(name)[1])
+    if fmt is None:
+        raise ValueError("Nieobsługiwany format pliku logu.")
+    return fmt
+
+
+def _python_can(reader_class, text=True):
+    """Reader function around a python-can reader, fed with a (decompressing) stream"""
+    def read(path):
+        stream = open_text(path) if text else open_binary(path)
+        with reader_class(stream) as reader:
+            yield from reader
+    return read
+
+
+def _read_mf4(path):
+    stream = open_binary(path)
+    if not stream.seekable():
+        # MF4 is read with random access; a zstd stream can only go forward
+        stream = io.BytesIO(stream.read())
+    try:
+        reader = can.MF4Reader(stream)
+    except NotImplementedError:
+        raise RuntimeError("Odczyt MF4 wymaga pakietu asammdf (pip install asammdf).") from None
+    with reader:
+        yield from reader
+
+
+def _read_candump_text(path):
+    """candump output as printed on a terminal; without -t the frame number stands in for the time"""
+    with open_text(path) as f:
+        for number, line in enumerate(f):
+            match = CANDUMP_TEXT.fullmatch(line.strip())
+            if match is None:
+                continue
+            arb_id = match["id"]
+            timestamp = float(match["time"]) if match["time"] else float(number)
+            remote = match["remote"] is not None
+            data = bytes.fromhex(match["data"]) if not remote else b""
+            yield can.Message(timestamp=timestamp, arbitration_id=int(arb_id, 16), is_extended_id=len(arb_id) > 3,
+                              is_remote_frame=remote, is_fd=int(match["dlc"]) > 8, dlc=int(match["dlc"]), data=data,
+                              channel=match["channel"])
+
+
+def _read_logger_csv(path):
+    """Timestamp,ID,Data rows of Prototype Pentester/logger.py (ID as 0x..., data as hex)"""
+    with open_text(path) as f:
+        rows = csv.reader(f)
+        next(rows, None)
+        for row in rows:
+            if len(row) < 3:
+                continue
+            arb_id = int(row[1], 16)
+            data = bytes.fromhex(row[2])
+            yield can.Message(timestamp=float(row[0]), arbitration_id=arb_id, is_extended_id=arb_id > 0x7FF,
+                              data=data, is_fd=len(data) > 8)
+
+
+def _read_id_csv(path):
+    """One 0x... ID per row (PenTester/Reader_Logger_v2.py): no time nor payload, the row number stands in for the time"""
+    with open_text(path) as f:
+        for number, row in enumerate(csv.reader(f)):
+            if not row or not ID_ROW.fullmatch(row[0].strip()):
+                continue
+            arb_id = int(row[0], 16)
+            yield can.Message(timestamp=float(number), arbitration_id=arb_id, is_extended_id=arb_id > 0x7FF, dlc=0)
+
+
+# format → function(path) yielding can.Message in file order
+READERS = {
+    "blf": lambda path: blf.read_messages(path, opener=open_binary),
+    "asc": _python_can(can.ASCReader),
+    "trc": _python_can(can.TRCReader),
+    "mf4": _read_mf4,
+    "candump": _python_can(can.CanutilsLogReader),
+    "candump-text": _read_candump_text,
+    "csv": _python_can(can.CSVReader),
+    "logger-csv": _read_logger_csv,
+    "id-csv": _read_id_csv,
+}
+
+
+def read_messages(path, fmt=None):
+    return READERS[fmt or detect_format(path)](path)
+
+
+def batched(messages, size=DEFAULT_BATCH):
+    """Lists of at most `size` messages of any message iterator"""
+    messages = iter(messages)
+    while True:
+        batch = list(islice(messages, size))
+        if not batch:
+            return
+        yield batch
+
+
+def read_batches(path, size=DEFAULT_BATCH, fmt=None):
+    """Lists of at most `size` can.Message, the same for every format"""
+    return batched(read_messages(path, fmt), size)
+
+
+def read_blocks(path, size, fmt=None):
+    """FrameBlocks of at most `size` frames; BLF is parsed straight into columns"""
+    fmt = fmt or detect_format(path)
+    if fmt == "blf":
+        return blf.read_blocks(path, size, opener=open_binary)
+    return iter_blocks(read_messages(path, fmt), size)
@@ -0,0 +1,212 @@
+# Persisted index of a BLF/ASC log: which blocks of the file hold frames of each ID
+# and which time span every block covers, so queries read only the matching blocks.
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+import asc
+import blf
+
+INDEX_SUFFIX = ".idx.npz"
+INDEX_VERSION = 1
+ASC_BLOCK_BYTES = 1 << 20
+
+
+def index_path(log_path):
+    """log.blf → log.blf.idx.npz"""
+    return log_path + INDEX_SUFFIX
+
+
+class LogIndex:
+    """Block index of one log file.
+
+    A block is a log container of a BLF file, or a line-aligned byte range of an
+    ASC file: the smallest piece that can be read without the rest of the file.
+    For every block the first and last timestamp are kept (the coarse time table),
+    for every ID the sorted list of blocks that contain it (CSR arrays:
+    id_blocks[id_offsets[k]:id_offsets[k + 1]] for id_values[k]).
+    """
+
+    def __init__(self, path, kind, offsets, block_start, block_end, id_values, id_offsets, id_blocks,
+                 frames, source_size, source_mtime):
+        self.path = path
+        self.kind = kind                # "blf" or "asc"
+        self.offsets = offsets          # int64[blocks + 1]: container offsets (BLF) or byte ranges (ASC)
+        self.block_start = block_start  # float64[blocks], +inf for blocks without frames
+        self.block_end = block_end      # float64[blocks], -inf for blocks without frames
+        self.id_values = id_values
+        self.id_offsets = id_offsets
+        self.id_blocks = id_blocks
+        self.frames = frames
+        self.source_size = source_size
+        self.source_mtime = source_mtime
+
+    def __len__(self):
+        return len(self.block_start)
+
+    @classmethod
+    def build(cls, path, block_bytes=ASC_BLOCK_BYTES):
+        """One pass over the log"""
+        stat = os.stat(path)
+        ext = os.path.splitext(path)[1].lower()
+        if ext == ".blf":
+            kind = "blf"
+            containers = blf.scan_containers(path)
+            offsets = np.append(containers, stat.st_size)
+            pieces = blf.read_containers(path, containers)
+        elif ext == ".asc":
+            kind = "asc"
+            offsets = np.append(np.arange(0, max(stat.st_size, 1), block_bytes), stat.st_size).astype(np.int64)
+            pieces = ((k, asc.read_range(path, offsets[k], offsets[k + 1])) for k in range(len(offsets) - 1))
+        else:
+            raise ValueError("Indeks obsługuje tylko pliki .blf i .asc")
+
+        blocks = len(offsets) - 1
+        block_start = np.full(blocks, np.inf)
+        block_end = np.full(blocks, -np.inf)
+        pair_ids = []
+        pair_blocks = []
+        frames = 0
+        for k, messages in pieces:
+            ids = []
+            timestamps = []
+            for msg in messages:
+                ids.append(msg.arbitration_id)
+                timestamps.append(msg.timestamp)
+            if not ids:
+                continue
+            frames += len(ids)
+            block_start[k] = min(timestamps)
+            block_end[k] = max(timestamps)
+            unique = np.unique(np.array(ids, dtype=np.uint32))
+            pair_ids.append(unique)
+            pair_blocks.append(np.full(len(unique), k, dtype=np.int32))
+
+        pair_ids = np.concatenate(pair_ids) if pair_ids else np.zeros(0, dtype=np.uint32)
+        pair_blocks = np.concatenate(pair_blocks) if pair_blocks else np.zeros(0, dtype=np.int32)
+        order = np.lexsort((pair_blocks, pair_ids))
+        id_values, id_counts = np.unique(pair_ids, return_counts=True)
+        return cls(path, kind, offsets, block_start, block_end, id_values,
+                   np.concatenate(([0], np.cumsum(id_counts))).astype(np.int64), pair_blocks[order],
+                   frames, stat.st_size, stat.st_mtime)
+
+    def save(self, path=None):
+        path = path or index_path(self.path)
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, version=INDEX_VERSION, kind=self.kind, offsets=self.offsets, block_start=self.block_start,
+                 block_end=self.block_end, id_values=self.id_values, id_offsets=self.id_offsets,
+                 id_blocks=self.id_blocks, frames=self.frames, source_size=self.source_size,
+                 source_mtime=self.source_mtime)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, log_path, path=None):
+        with np.load(path or index_path(log_path)) as state:
+            if int(state["version"]) != INDEX_VERSION:
+                raise ValueError(f"Nieobsługiwana wersja indeksu: {int(state['version'])}")
+            return cls(log_path, str(state["kind"]), state["offsets"], state["block_start"], state["block_end"],
+                       state["id_values"], state["id_offsets"], state["id_blocks"], int(state["frames"]),
+                       int(state["source_size"]), float(state["source_mtime"]))
+
+    def stale(self):
+        """True if the log changed since the index was built"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return True
+        return stat.st_size != self.source_size or stat.st_mtime != self.source_mtime
+
+    def ids(self):
+        return self.id_values
+
+    def blocks_of(self, arb_id):
+        k = int(np.searchsorted(self.id_values, arb_id))
+        if k == len(self.id_values) or self.id_values[k] != arb_id:
+            return self.id_blocks[:0]
+        return self.id_blocks[self.id_offsets[k]:self.id_offsets[k + 1]]
+
+    def blocks_for(self, ids=None, start=None, end=None):
+        """Sorted blocks that may hold frames of `ids` with start <= timestamp < end"""
+        if ids is None:
+            blocks = np.arange(len(self))
+        else:
+            blocks = np.unique(np.concatenate([self.blocks_of(arb_id) for arb_id in ids] + [self.id_blocks[:0]]))
+        keep = np.ones(len(blocks), dtype=bool)
+        if start is not None:
+            keep &= self.block_end[blocks] >= start
+        if end is not None:
+            keep &= self.block_start[blocks] < end
+        return blocks[keep].astype(np.int64)
+
+    def read_blocks(self, blocks, ids=None):
+        """Frames of the given sorted blocks; runs of consecutive blocks are read in one go.
+
+        `ids` (a set) lets the BLF parser skip other frames early; ASC blocks are not filtered.
+        """
+        if not len(blocks):
+            return
+        breaks = np.flatnonzero(np.diff(blocks) != 1) + 1
+        containers = self.offsets[:-1] if self.kind == "blf" else None
+        for run in np.split(blocks, breaks):
+            first, stop = int(run[0]), int(run[-1]) + 1
+            if self.kind == "blf":
+                yield from blf.read_range(self.path, first, stop, containers, ids)
+            else:
+                yield from asc.read_range(self.path, int(self.offsets[first]), int(self.offsets[stop]))
+
+    def query(self, ids=None, start=None, end=None):
+        """Frames of `ids` (any ID if None) with start <= timestamp < end, in file order"""
+        wanted = None if ids is None else {int(arb_id) for arb_id in ids}
+        low = -np.inf if start is None else start
+        high = np.inf if end is None else end
+        for msg in self.read_blocks(self.blocks_for(wanted, start, end), wanted):
+            if (wanted is None or msg.arbitration_id in wanted) and low <= msg.timestamp < high:
+                yield msg
+
+
+def open_index(log_path, rebuild=True):
+    """Index of a log, built (and saved next to it, if possible) when missing or stale"""
+    try:
+        index = LogIndex.load(log_path)
+    except (OSError, ValueError, KeyError):
+        index = None
+    if index is None or index.stale():
+        if not rebuild:
+            raise ValueError(f"Brak aktualnego indeksu dla {log_path}")
+        index = LogIndex.build(log_path)
+        try:
+            index.save()
+        except OSError:
+            pass  # read-only location: the index is used for this session only
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Indeks ID/czasu logów BLF/ASC i zapytania o ramki")
+    parser.add_argument("logs", nargs="+", help="pliki logów .blf/.asc")
+    parser.add_argument("--id", nargs="+", type=lambda text: int(text, 16), help="szukane ID (hex)")
+    parser.add_argument("--start", type=float, help="początek okna czasu [s]")
+    parser.add_argument("--end", type=float, help="koniec okna czasu [s]")
+    args = parser.parse_args()
+
+    for log_path in args.logs:
+        start = time.perf_counter()
+        index = open_index(log_path)
+        print(f"{log_path}: {index.frames} ramek, {len(index)} bloków, {len(index.ids())} ID "
+              f"({time.perf_counter() - start:.2f} s)", file=sys.stderr)
+        if args.id is None and args.start is None and args.end is None:
+            continue
+        start = time.perf_counter()
+        count = 0
+        for msg in index.query(args.id, args.start, args.end):
+            print(msg)
+            count += 1
+        print(f"{count} ramek z {len(index.blocks_for(args.id, args.start, args.end))} bloków "
+              f"({time.perf_counter() - start:.2f} s)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+import os
+import sys
+import threading
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (None if the platform can't tell)"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in kB on Linux, in bytes on macOS
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    try:
+        import psutil
+    except ImportError:
+        return None
+    info = psutil.Process().memory_info()
+    return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+
+
+def rss_mb():
+    """Current resident set size of this process in MB (None if the platform can't tell)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss / (1024 * 1024)
+
+
+class LatencyWindow:
+    """The most recent `capacity` latency samples (seconds), for percentiles"""
+
+    def __init__(self, capacity=65536):
+        self.samples = np.zeros(capacity, dtype=np.float64)
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)[-len(self.samples):]
+        with self._lock:
+            index = (self.count + np.arange(len(values))) % len(self.samples)
+            self.samples[index] = values
+            self.count += len(values)
+
+    def percentiles(self, q=(50, 99)):
+        """Latency percentiles in seconds (NaN before the first sample)"""
+        with self._lock:
+            samples = self.samples[:min(self.count, len(self.samples))].copy()
+        if not len(samples):
+            return [float("nan")] * len(q)
+        return np.percentile(samples, q).tolist()
@@ -0,0 +1,136 @@
+# Specialised models: one small autoencoder per arbitration ID or PGN, stored as
+# weights-only .npz files in a directory and loaded on demand through an LRU cache.
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from j1939 import pgn_of_batch
+
+WEIGHT_NAMES = ("w1", "b1", "w2", "b2", "w3", "b3", "w4", "b4")
+PARTITIONS = ("id", "pgn")
+
+
+def models_path(path):
+    """model.pth → model.models, the directory of the specialised models"""
+    return os.path.splitext(path)[0] + ".models"
+
+
+def partition_keys(partition, ids):
+    """Model key of each arbitration ID: the ID itself or its J1939 PGN"""
+    ids = np.asarray(ids, dtype=np.int64)
+    return pgn_of_batch(ids) if partition == "pgn" else ids
+
+
+def group_rows(keys):
+    """[(key, rows), ...] of an array of keys, rows in their original order"""
+    unique, inverse = np.unique(keys, return_inverse=True)
+    order = np.argsort(inverse, kind="stable")
+    bounds = np.cumsum(np.bincount(inverse, minlength=len(unique)))[:-1]
+    return list(zip(unique.tolist(), np.split(order, bounds)))
+
+
+def fuse_layers(w1, b1, w2, b2, w3, b3, w4, b4):
+    """CANAutoencoder weights → three (weight, bias) float32 layers with the bottleneck fused"""
+    w1, b1, w2, b2, w3, b3, w4, b4 = (np.asarray(a, dtype=np.float64) for a in (w1, b1, w2, b2, w3, b3, w4, b4))
+    # Linear(hidden→8) then Linear(8→hidden): h·W2ᵀ·W3ᵀ + (b2·W3ᵀ + b3)
+    fused_w = w3 @ w2
+    fused_b = w3 @ b2 + b3
+    # Stored transposed, so a layer is x @ w + b
+    return [(w.T.astype(np.float32).copy(), b.astype(np.float32))
+            for w, b in ((w1, b1), (fused_w, fused_b), (w4, b4))]
+
+
+def squared_errors(layers, x):
+    """(n, n_features) squared reconstruction errors of fused layers"""
+    (w1, b1), (w2, b2), (w3, b3) = layers
+    h = x @ w1
+    h += b1
+    np.maximum(h, 0, out=h)
+    h = h @ w2
+    h += b2
+    np.maximum(h, 0, out=h)
+    out = h @ w3
+    out += b3
+    out -= x
+    out *= out
+    return out
+
+
+class ModelRegistry:
+    """Directory of specialised models, key → fused layers, with at most `capacity` resident.
+
+    Shared by the detector threads; a model missing from the cache is read from
+    disk by the thread that needs it, the least recently used one is dropped.
+    """
+
+    def __init__(self, directory, partition="id", capacity=256):
+        if partition not in PARTITIONS:
+            raise ValueError(f"Nieznany podział modeli: {partition} (dostępne: {', '.join(PARTITIONS)})")
+        self.directory = directory
+        self.partition = partition
+        self.capacity = capacity
+        os.makedirs(directory, exist_ok=True)
+        self.keys = {int(name[:-4], 16) for name in os.listdir(directory) if name.endswith(".npz")}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key:08x}.npz")
+
+    def save(self, key, weights):
+        """Store the weights (dict in WEIGHT_NAMES) of one model"""
+        np.savez(self.path(key), **weights)
+        with self._lock:
+            self.keys.add(key)
+            self._cache.pop(key, None)
+
+    def get(self, key):
+        """Fused layers of the model for `key`, or None if it has no own model"""
+        if key not in self.keys:
+            return None
+        with self._lock:
+            layers = self._cache.get(key)
+            if layers is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return layers
+            self.misses += 1
+        with np.load(self.path(key)) as state:
+            layers = fuse_layers(*(state[name] for name in WEIGHT_NAMES))
+        with self._lock:
+            self._cache[key] = layers
+            while len(self._cache) > self.capacity:
+                self._cache.popitem(last=False)
+                self.evictions += 1
+        return layers
+
+    def squared_errors(self, ids, x, fallback):
+        """Squared errors of each row by the model of its ID; `fallback(x)` for keys without one"""
+        errors = np.empty_like(x)
+        missing = []
+        for key, rows in group_rows(partition_keys(self.partition, ids)):
+            layers = self.get(key)
+            if layers is None:
+                missing.append(rows)
+            else:
+                errors[rows] = squared_errors(layers, x[rows])
+        if missing:
+            rows = np.concatenate(missing)
+            errors[rows] = fallback(x[rows])
+        return errors
+
+    def stats(self):
+        with self._lock:
+            return {"models": len(self.keys), "resident": len(self._cache), "capacity": self.capacity,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
@@ -0,0 +1,55 @@
+import json
+import os
+
+import numpy as np
+
+from features import FeaturePipeline
+from model_registry import WEIGHT_NAMES, fuse_layers, squared_errors
+from scorer import ReconstructionScorer
+
+
+def weights_path(path):
+    """model.pth → model.npz, the torch-free copy written by CANAutoencoderEngine.save_model"""
+    return os.path.splitext(path)[0] + ".npz"
+
+
+class NumpyAutoencoderScorer(ReconstructionScorer):
+    """CANAutoencoder inference in plain NumPy, from the weights-only .npz export.
+
+    The encoder's output layer and the decoder's input layer have no activation
+    in between, so they are fused into one 16x16 layer at load time: a batch is
+    three matmuls. Training stays in the torch backend.
+    """
+
+    def __init__(self, threshold=0.1, per_id_thresholds=True, sigma=4.0, min_samples=30, features=None,
+                 partition=None, model_cache=256):
+        super().__init__(threshold, per_id_thresholds, sigma, min_samples, features, partition, model_cache)
+        self.layers = None
+        self.raw_weights = None
+
+    def load_model(self, path="model.pth"):
+        if not path.endswith(".npz"):
+            path = weights_path(path)
+        with np.load(path) as state:
+            weights = [state[name] for name in WEIGHT_NAMES]
+            self.threshold = float(state["threshold"])
+            self.sigma = float(state["sigma"])
+            self.pipeline = FeaturePipeline.from_config(json.loads(str(state["features"])) if "features" in state else None)
+            self.load_id_state({name: state[name] for name in self.id_state() if name in state})
+            partition = str(state["partition"]) if "partition" in state else None
+        self._open_models(path, partition)
+        self.raw_weights = dict(zip(WEIGHT_NAMES, weights))
+        self.layers = fuse_layers(*weights)
+        self.trained = True
+
+    def weights(self):
+        return self.raw_weights
+
+    def prepare_weights(self, weights):
+        return weights, fuse_layers(*(weights[name] for name in WEIGHT_NAMES))
+
+    def _install(self, prepared):
+        self.raw_weights, self.layers = prepared
+
+    def _squared_errors(self, x):
+        return squared_errors(self.layers, x)
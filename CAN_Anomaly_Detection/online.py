@@ -0,0 +1,105 @@
+# Opt-in online learning: the shared autoencoder is fine-tuned on recent frames
+# judged normal while detection keeps running. Needs torch, also for the numpy backend.
+import threading
+import time
+
+import numpy as np
+
+from autoencoder import CANAutoencoder, fit, load_weights, model_weights
+
+
+class OnlineAdapter:
+    """Fine-tunes a copy of the scorer's shared model in a background thread.
+
+    Detector threads only copy the feature rows of normal frames into a bounded
+    ring buffer (observe()). Every `interval` seconds, once `min_frames` new rows
+    have arrived, a snapshot of the buffer is trained for `epochs` passes on a
+    copy of the model, so scoring never waits for training. The result is
+    published as one (version, prepared) tuple; every scorer sharing the adapter
+    installs it before its next batch. Specialised per-ID models are not adapted.
+    """
+
+    def __init__(self, scorer, buffer_size=32768, interval=60.0, min_frames=4096, epochs=1, lr=1e-4,
+                 batch_size=256, pause=0.001, seed=0):
+        if not scorer.trained or scorer.weights() is None:
+            raise RuntimeError("Uczenie online wymaga nauczonego lub wczytanego modelu.")
+        self.scorer = scorer
+        self.interval = interval
+        self.min_frames = min_frames
+        self.epochs = epochs
+        self.lr = lr
+        self.batch_size = batch_size
+        self.pause = pause  # sleep after every training step, so scoring is not starved
+        self.rng = np.random.default_rng(seed)
+
+        self.buffer = np.empty((buffer_size, scorer.n_features), dtype=np.float32)
+        self.filled = 0
+        self.position = 0  # next ring slot
+        self.fresh = 0     # rows observed since the last update
+        self._lock = threading.Lock()
+
+        self.weights = scorer.weights()
+        self.current = (0, None)
+        self.updates = 0
+        self.last_loss = None
+        self.last_seconds = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def observe(self, x):
+        """Remember the feature rows of frames judged normal (called by the detector threads)"""
+        n = len(x)
+        if not n:
+            return
+        capacity = len(self.buffer)
+        if n > capacity:
+            x = x[-capacity:]
+            n = capacity
+        with self._lock:
+            end = self.position + n
+            if end <= capacity:
+                self.buffer[self.position:end] = x
+            else:
+                split = capacity - self.position
+                self.buffer[self.position:] = x[:split]
+                self.buffer[:n - split] = x[split:]
+            self.position = end % capacity
+            self.filled = min(self.filled + n, capacity)
+            self.fresh += n
+
+    def update(self):
+        """One fine-tuning round on the buffered rows; returns False if there were too few new ones"""
+        with self._lock:
+            if self.fresh < self.min_frames:
+                return False
+            data = self.buffer[:self.filled].copy()
+            self.fresh = 0
+
+        start = time.perf_counter()
+        model = load_weights(CANAutoencoder(input_size=data.shape[1]), self.weights)
+        loss = fit(model, data, self.epochs, self.lr, self.batch_size, self.rng, self.pause)
+        self.weights = model_weights(model)
+        prepared = self.scorer.prepare_weights(self.weights)
+        self.current = (self.current[0] + 1, prepared)
+        self.updates += 1
+        self.last_loss = loss.item() if loss is not None else None
+        self.last_seconds = time.perf_counter() - start
+        return True
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="online-learning", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.update()
+
+    def stats(self):
+        return {"updates": self.updates, "buffered": self.filled, "fresh": self.fresh,
+                "last_loss": self.last_loss, "last_seconds": self.last_seconds}
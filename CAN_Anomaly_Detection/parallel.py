@@ -0,0 +1,180 @@
+import argparse
+import csv
+import heapq
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import asc
+import blf
+from can_input import CANReader
+from frame_store import ROW_BYTES, STORE_SUFFIX, FrameStore
+
+DEFAULT_BLOCK_MB = 32
+
+REPORT_COLUMNS = ("timestamp", "file", "id", "dlc", "data", "ai", "loss", "heur")
+
+_engine = None  # AnomalyEngine of the worker process
+
+
+def plan_shards(paths, block_bytes=DEFAULT_BLOCK_MB << 20):
+    """Split the logs into independent pieces of work: (path, kind, first, stop).
+
+    BLF files are split by ranges of log containers, ASC files by byte ranges
+    (aligned to lines by the worker), frame stores by row ranges, other files
+    are one shard each.
+    """
+    shards = []
+    for path in paths:
+        ext = os.path.splitext(path.rstrip("/\\"))[1].lower()
+        if ext == STORE_SUFFIX:
+            count = len(FrameStore(path))
+            per_block = max(1, block_bytes // ROW_BYTES)
+            for first in range(0, max(count, 1), per_block):
+                shards.append((path, "frames", first, min(first + per_block, count)))
+            continue
+        size = os.path.getsize(path)
+        if ext == ".blf":
+            containers = blf.scan_containers(path)
+            # Containers are roughly the same size, so a count per block is good enough
+            per_block = max(1, int(len(containers) * block_bytes // max(size, 1)))
+            for first in range(0, len(containers), per_block):
+                shards.append((path, "blf", first, first + per_block))
+        elif ext == ".asc":
+            for start in range(0, max(size, 1), block_bytes):
+                shards.append((path, "asc", start, start + block_bytes))
+        else:
+            shards.append((path, "file", 0, size))
+    return shards
+
+
+def read_shard(shard):
+    path, kind, first, stop = shard
+    if kind == "blf":
+        return blf.read_range(path, first, stop)
+    if kind == "asc":
+        return asc.read_range(path, first, stop)
+    if kind == "frames":
+        return FrameStore(path).messages(first, stop)
+    return CANReader(source="file", filepath=path).read()
+
+
+def _init_worker(model_path, use_ai, use_heuristic, torch_threads):
+    global _engine
+    from anomaly_engine import AnomalyEngine
+
+    _engine = AnomalyEngine(use_ai=use_ai, use_heuristic=use_heuristic)
+    if model_path:
+        _engine.load_model(model_path)
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        # One scoring process per core, each must not spawn its own thread pool
+        torch.set_num_threads(torch_threads)
+
+
+def score_shard(shard, out_path, batch_size=1024):
+    """Score one shard into a CSV file of its anomalies (report rows, sorted by time).
+
+    Returns (frames scored, anomalies). Rows go to disk as they are found, so
+    neither the worker nor the parent keeps a shard's anomalies in memory (they
+    are only read back for sorting if the log itself is out of time order).
+    Heuristic and feature state start fresh in every shard (the first frames of each
+    ID have no predecessor to compare with); the learned cycle times come from the model.
+    """
+    engine = _engine
+    engine.heuristic.reset()
+    if engine.use_ai:
+        engine.ai.pipeline.reset()
+    path = shard[0]
+    frames = 0
+    anomalies = 0
+    last = float("-inf")
+    ordered = True
+    iterator = iter(read_shard(shard))
+    with open(out_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        while True:
+            batch = list(islice(iterator, batch_size))
+            if not batch:
+                break
+            frames += len(batch)
+            for msg, result in zip(batch, engine.evaluate_batch(batch)):
+                if result.anomalous:
+                    ordered &= msg.timestamp >= last
+                    last = msg.timestamp
+                    anomalies += 1
+                    writer.writerow((
+                        f"{msg.timestamp:.6f}", path, f"{msg.arbitration_id:X}", msg.dlc,
+                        ' '.join(f"{b:02X}" for b in msg.data),
+                        "TAK" if result.ai else "", f"{result.loss:.5f}" if result.ai else "",
+                        "; ".join(result.heur),
+                    ))
+            now = batch[-1].timestamp
+            silent = engine.poll(now)
+            if silent:
+                ordered &= now >= last
+                last = now
+                anomalies += 1
+                writer.writerow((f"{now:.6f}", path, "", "", "", "", "", "; ".join(silent)))
+    if not ordered:
+        with open(out_path, newline="", encoding="utf-8") as f:
+            rows = sorted(csv.reader(f), key=lambda row: float(row[0]))
+        with open(out_path, "w", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerows(rows)
+    return frames, anomalies
+
+
+def merge_reports(shard_paths, path):
+    """Stream-merge the sorted shard files into one CSV report, in time order"""
+    files = [open(shard_path, newline="", encoding="utf-8") for shard_path in shard_paths]
+    try:
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(REPORT_COLUMNS)
+            writer.writerows(heapq.merge(*(csv.reader(shard) for shard in files), key=lambda row: float(row[0])))
+    finally:
+        for shard in files:
+            shard.close()
+
+
+def score_files(paths, model_path, out_path, workers=None, block_bytes=DEFAULT_BLOCK_MB << 20,
+                use_ai=True, use_heuristic=True, batch_size=1024):
+    """Score the logs in parallel into a CSV report merged in time order; returns (frames, anomalies)"""
+    shards = plan_shards(paths, block_bytes)
+    workers = workers or os.cpu_count()
+    # Shard reports next to the report, so they are on the same disk
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(out_path))) as tmp:
+        shard_paths = [os.path.join(tmp, f"{k}.csv") for k in range(len(shards))]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(model_path, use_ai, use_heuristic, 1)) as pool:
+            results = list(pool.map(score_shard, shards, shard_paths, [batch_size] * len(shards)))
+        merge_reports(shard_paths, out_path)
+    return sum(frames for frames, _ in results), sum(anomalies for _, anomalies in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Równoległa ocena wielu plików logów (BLF/ASC)")
+    parser.add_argument("logs", nargs="+", help="pliki .blf/.asc")
+    parser.add_argument("--model", help="zapisany model .pth (stan heurystyk obok, .heur.npz); wymagany bez --no-ai")
+    parser.add_argument("--out", default="anomalie.csv", help="raport CSV posortowany po czasie")
+    parser.add_argument("--workers", type=int, default=None, help="liczba procesów (domyślnie liczba rdzeni)")
+    parser.add_argument("--block-mb", type=int, default=DEFAULT_BLOCK_MB, help="rozmiar fragmentu dużego pliku")
+    parser.add_argument("--no-ai", action="store_true")
+    parser.add_argument("--no-heuristic", action="store_true")
+    args = parser.parse_args()
+    if not args.no_ai and not args.model:
+        parser.error("podaj --model albo --no-ai (same heurystyki)")
+
+    start = time.perf_counter()
+    frames, anomalies = score_files(args.logs, args.model, args.out, args.workers, args.block_mb << 20,
+                                    use_ai=not args.no_ai, use_heuristic=not args.no_heuristic)
+    elapsed = time.perf_counter() - start
+    print(f"Ramek: {frames}, anomalii: {anomalies}, {elapsed:.1f}s ({frames / elapsed:.0f} ramek/s)")
+    print(f"Raport zapisany do {args.out}")
+
+
+if __name__ == '__main__':
+    main()
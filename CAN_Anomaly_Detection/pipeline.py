@@ -0,0 +1,184 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from metrics import LatencyWindow
+
+# What a full queue does with a new item
+BLOCK = "block"              # producer waits (back-pressure up to the source)
+DROP_NEWEST = "drop_newest"  # the new item is discarded
+DROP_OLDEST = "drop_oldest"  # the oldest queued item is discarded to make room
+
+
+class BoundedQueue:
+    """Bounded FIFO between pipeline stages with an overflow policy and counters."""
+
+    def __init__(self, capacity, policy=BLOCK, name=""):
+        if policy not in (BLOCK, DROP_NEWEST, DROP_OLDEST):
+            raise ValueError(f"Nieznana polityka kolejki: {policy}")
+        self.capacity = capacity
+        self.policy = policy
+        self.name = name
+        self._items = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self.closed = False
+        self.put_count = 0
+        self.dropped = 0
+        self.high_watermark = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item):
+        """Returns False if the item was dropped (or the queue is closed)"""
+        with self._lock:
+            if self.closed:
+                return False
+            if len(self._items) >= self.capacity:
+                if self.policy == DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                if self.policy == DROP_OLDEST:
+                    self._items.popleft()
+                    self.dropped += 1
+                else:
+                    while len(self._items) >= self.capacity and not self.closed:
+                        self._not_full.wait(0.1)
+                    if self.closed:
+                        return False
+            self._items.append(item)
+            self.put_count += 1
+            if len(self._items) > self.high_watermark:
+                self.high_watermark = len(self._items)
+            self._not_empty.notify()
+            return True
+
+    def get_batch(self, max_items, timeout=None):
+        """Up to max_items items; waits for the first one at most `timeout` seconds.
+
+        Returns an empty list on timeout or once the queue is closed and empty.
+        """
+        with self._lock:
+            if not self._items and not self.closed:
+                self._not_empty.wait(timeout)
+            count = min(max_items, len(self._items))
+            batch = [self._items.popleft() for _ in range(count)]
+            if count:
+                self._not_full.notify_all()
+            return batch
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+    @property
+    def finished(self):
+        return self.closed and not self._items
+
+    def stats(self):
+        return {
+            "depth": len(self._items),
+            "capacity": self.capacity,
+            "high_watermark": self.high_watermark,
+            "put": self.put_count,
+            "dropped": self.dropped,
+        }
+
+
+class DetectionPipeline:
+    """reader thread → frame queue(s) → detector worker(s) → result queue.
+
+    The reader only moves frames from the CANReaders into the bounded frame queue.
+    Detector workers take up to `batch_size` frames at a time and score them with
+    AnomalyEngine.evaluate_batch, then put (messages, results) for every batch on the
+    result queue, and (None, (time, findings)) for IDs that went silent. The consumer
+    (e.g. the GUI on a timer) drains `results` at its own pace. With several workers frames are
+    partitioned by arbitration ID, so every ID keeps its heuristic state in one worker.
+    """
+
+    def __init__(self, engine, readers, batch_size=256, workers=1,
+                 frame_capacity=65536, frame_policy=BLOCK,
+                 result_capacity=1024, result_policy=DROP_OLDEST,
+                 poll_interval=0.05):
+        self.readers = readers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.engines = [engine] + [engine.fork() for _ in range(workers - 1)]
+        self.frames = [BoundedQueue(frame_capacity, frame_policy, f"frames{i}") for i in range(workers)]
+        self.results = BoundedQueue(result_capacity, result_policy, "results")
+        self.processed = 0
+        self.latency = LatencyWindow()  # reader → scored, per frame
+        self._stop = threading.Event()
+        self._threads = []
+        self._workers_left = workers
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._threads = [threading.Thread(target=self._read, name="can-reader", daemon=True)]
+        for i, engine in enumerate(self.engines):
+            self._threads.append(threading.Thread(target=self._detect, args=(engine, self.frames[i]),
+                                                  name=f"can-detector{i}", daemon=True))
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def running(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def _read(self):
+        queues = self.frames
+        count = len(queues)
+        try:
+            for reader in self.readers:
+                for msg in reader.read():
+                    if self._stop.is_set():
+                        return
+                    queue = queues[msg.arbitration_id % count] if count > 1 else queues[0]
+                    queue.put((time.monotonic(), msg))
+        finally:
+            for queue in queues:
+                queue.close()
+
+    def _detect(self, engine, frames):
+        last_timestamp = None
+        last_wall = time.monotonic()
+        try:
+            while not (self._stop.is_set() or frames.finished):
+                items = frames.get_batch(self.batch_size, timeout=self.poll_interval)
+                if items:
+                    received, batch = zip(*items)
+                    batch = list(batch)
+                    self.results.put((batch, engine.evaluate_batch(batch)))
+                    self.latency.add(time.monotonic() - np.array(received))
+                    last_timestamp = batch[-1].timestamp
+                    last_wall = time.monotonic()
+                    with self._lock:
+                        self.processed += len(batch)
+                if last_timestamp is not None:
+                    # Keep the silence scanner ticking on the frame time base while the bus is idle
+                    now = last_timestamp + (time.monotonic() - last_wall)
+                    silent = engine.poll(now)
+                    if silent:
+                        self.results.put((None, (now, silent)))
+        finally:
+            with self._lock:
+                self._workers_left -= 1
+                if self._workers_left == 0:
+                    self.results.close()
+
+    def stats(self):
+        return {
+            "processed": self.processed,
+            "frames": [queue.stats() for queue in self.frames],
+            "results": self.results.stats(),
+        }
@@ -0,0 +1,90 @@
+import numpy as np
+
+from id_table import grow
+
+EMPTY_SLOTS = np.zeros(0, dtype=np.int64)
+
+
+class DeadlineWheel:
+    """Hashed timer wheel of per-slot deadlines (e.g. "ID must be seen again by t").
+
+    Frames only overwrite deadline[slot], there is no heap push per frame. A slot sits
+    in at most one bucket; when its bucket comes due the current deadline is checked
+    and the slot is either reported as expired or moved to the bucket of its new
+    deadline. An expired slot stays quiet until it is touched again.
+    """
+
+    def __init__(self, tick_s=0.01, n_buckets=1024):
+        self.tick_s = tick_s
+        self.n_buckets = n_buckets
+        self.buckets = [[] for _ in range(n_buckets)]
+        self.deadline = np.zeros(0, dtype=np.float64)
+        self.scheduled = np.zeros(0, dtype=bool)
+        self.current = None  # last tick processed
+
+    def ensure_capacity(self, size):
+        if size > len(self.deadline):
+            self.deadline = grow(self.deadline, size)
+            self.scheduled = grow(self.scheduled, len(self.deadline))
+
+    def _tick(self, t):
+        return int(t // self.tick_s)
+
+    def touch(self, slot, deadline):
+        self.deadline[slot] = deadline
+        if not self.scheduled[slot]:
+            tick = self._tick(deadline)
+            if self.current is None:
+                self.current = tick - 1
+            self.buckets[max(tick, self.current + 1) % self.n_buckets].append(slot)
+            self.scheduled[slot] = True
+
+    def touch_batch(self, slots, deadlines):
+        self.deadline[slots] = deadlines
+        new = ~self.scheduled[slots]
+        if new.any():
+            self._insert(slots[new], deadlines[new])
+
+    def _insert(self, slots, deadlines):
+        ticks = (deadlines // self.tick_s).astype(np.int64)
+        if self.current is None:
+            self.current = int(ticks.min()) - 1
+        buckets = np.maximum(ticks, self.current + 1) % self.n_buckets
+        order = np.argsort(buckets, kind="stable")
+        buckets = buckets[order]
+        slots = slots[order]
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        for begin, end in zip(starts.tolist(), np.r_[starts[1:], len(slots)].tolist()):
+            self.buckets[int(buckets[begin])].extend(slots[begin:end].tolist())
+        self.scheduled[slots] = True
+
+    def advance(self, now):
+        """Process every tick up to `now`; returns the slots whose deadline has passed"""
+        if self.current is None:
+            return EMPTY_SLOTS
+        tick = self._tick(now)
+        if tick <= self.current:
+            return EMPTY_SLOTS
+
+        expired = []
+        # After a jump longer than one revolution every bucket is visited exactly once
+        steps = min(tick - self.current, self.n_buckets)
+        first = tick - steps + 1
+        self.current = tick
+        for t in range(first, tick + 1):
+            index = t % self.n_buckets
+            bucket = self.buckets[index]
+            if not bucket:
+                continue
+            self.buckets[index] = []
+            slots = np.array(bucket, dtype=np.int64)
+            due = self.deadline[slots] <= now
+            if due.any():
+                expired.append(slots[due])
+                self.scheduled[slots[due]] = False
+                slots = slots[~due]
+            if len(slots):
+                self._insert(slots, self.deadline[slots])
+        if not expired:
+            return EMPTY_SLOTS
+        return np.concatenate(expired)
@@ -0,0 +1,209 @@
+import copy
+import importlib
+
+import numpy as np
+
+from features import FeaturePipeline
+from frames import FrameBlock
+from id_table import IdTable, grow, merge_moments
+from model_registry import ModelRegistry, models_path
+
+# Scorer backends: name → (module, class). Modules are imported on first use, so
+# e.g. torch is only loaded when the torch backend is actually created.
+SCORERS = {
+    "torch": ("autoencoder", "CANAutoencoderEngine"),
+    "numpy": ("numpy_scorer", "NumpyAutoencoderScorer"),
+}
+
+
+def create_scorer(name="torch", **kwargs):
+    try:
+        module_name, class_name = SCORERS[name]
+    except KeyError:
+        raise ValueError(f"Nieznany backend AI: {name} (dostępne: {', '.join(SCORERS)})") from None
+    return getattr(importlib.import_module(module_name), class_name)(**kwargs)
+
+
+class ReconstructionScorer:
+    """Interface of the AI scorers: reconstruction error of frame features with per-ID thresholds.
+
+    A backend implements _squared_errors() and, if it can learn, train();
+    plus save_model()/load_model(). Features, scoring and thresholds are shared,
+    so all backends agree on what "anomalous" means.
+
+    With a `partition` ("id" or "pgn") a model also has specialised models per
+    ID or PGN in a ModelRegistry; frames of a batch are grouped by key and scored
+    by their model, keys without one fall back to the shared model.
+    """
+
+    def __init__(self, threshold=0.1, per_id_thresholds=True, sigma=4.0, min_samples=30, features=None,
+                 partition=None, model_cache=256):
+        # Feature pipeline of new models; a loaded model brings its own
+        self.pipeline = features if features is not None else FeaturePipeline.default()
+        self.partition = partition  # for training; a loaded model brings its own
+        self.model_cache = model_cache  # specialised models kept in memory
+        self.models = None
+        self.online = None  # online.OnlineAdapter publishing fine-tuned weights
+        self._online_version = 0
+        self.threshold = threshold  # global threshold, used for IDs without own statistics
+        self.trained = False
+        self.train_stats = None
+
+        # Per-ID loss statistics (Welford), indexed by the dense slot from self.ids
+        self.per_id_thresholds = per_id_thresholds
+        self.sigma = sigma
+        self.min_samples = min_samples
+        self._reset_id_stats()
+
+    @property
+    def n_features(self):
+        return self.pipeline.width
+
+    def features(self, frames):
+        """(n, n_features) float32 feature matrix; advances the per-ID state of the pipeline"""
+        return self.pipeline.transform(frames)
+
+    def fork(self):
+        """Scorer for another detector thread: same model, separate feature state"""
+        scorer = copy.copy(self)
+        scorer.pipeline = self.pipeline.fork()
+        return scorer
+
+    def _squared_errors(self, x):
+        """(n, n_features) squared reconstruction errors of a feature matrix"""
+        raise NotImplementedError
+
+    def weights(self):
+        """Weights of the shared model, named as in model_registry.WEIGHT_NAMES"""
+        raise NotImplementedError
+
+    def prepare_weights(self, weights):
+        """Backend form of `weights`, built once and then installed by every fork"""
+        raise NotImplementedError
+
+    def _install(self, prepared):
+        raise NotImplementedError
+
+    def _sync_online(self):
+        """Swap in the newest weights of online learning, between batches"""
+        version, prepared = self.online.current
+        if version != self._online_version:
+            self._install(prepared)
+            self._online_version = version
+
+    def train(self, messages, on_block=None, **kwargs):
+        raise NotImplementedError(f"{type(self).__name__} nie obsługuje uczenia")
+
+    def save_model(self, path):
+        raise NotImplementedError
+
+    def load_model(self, path):
+        raise NotImplementedError
+
+    def _errors(self, ids, x):
+        """Squared errors of a block, each frame by the model of its ID if there are specialised models"""
+        if self.models is None:
+            return self._squared_errors(x)
+        return self.models.squared_errors(ids, x, self._squared_errors)
+
+    def _losses(self, x):
+        return self._squared_errors(x).mean(axis=1)
+
+    def _open_models(self, path, partition):
+        """Specialised models stored next to the model at `path`, if it was trained with a partition"""
+        self.partition = partition or None
+        self.models = ModelRegistry(models_path(path), partition, self.model_cache) if partition else None
+
+    def score(self, msg):
+        """Reconstruction loss of one frame and the squared error of each payload byte"""
+        losses, errors = self.score_batch([msg])
+        return float(losses[0]), errors[0]
+
+    def score_batch(self, frames):
+        """Per-frame losses (n,) and per-byte squared errors (n, 8)"""
+        block = frames if isinstance(frames, FrameBlock) else FrameBlock.from_messages(frames)
+        return self.score_block(block)[1:]
+
+    def score_block(self, block):
+        """score_batch() of a FrameBlock, also returning its feature matrix"""
+        x = self.features(block)
+        if not self.trained:
+            return x, np.zeros(len(x), dtype=np.float32), np.zeros((len(x), 8), dtype=np.float32)
+        if self.online is not None:
+            self._sync_online()
+        errors = self._errors(block.arbitration_id, x)
+        return x, errors.mean(axis=1), errors[:, self.pipeline.byte_columns]
+
+    def is_anomalous(self, msg):
+        return self.score(msg)[0] > self.threshold_for(msg.arbitration_id)
+
+    def is_anomalous_batch(self, frames):
+        block = frames if isinstance(frames, FrameBlock) else FrameBlock.from_messages(frames)
+        return self.score_batch(block)[0] > self.thresholds_for(block.arbitration_id)
+
+    def _reset_id_stats(self):
+        self.ids = IdTable()
+        self.id_count = np.zeros(0, dtype=np.int64)
+        self.id_mean = np.zeros(0, dtype=np.float64)
+        self.id_m2 = np.zeros(0, dtype=np.float64)
+        self.id_threshold = np.zeros(0, dtype=np.float32)
+
+    def _update_id_stats(self, ids, losses):
+        """Merge the losses of one chunk into the per-ID loss statistics"""
+        slots = self.ids.add_batch(ids)
+        n = len(self.ids)
+        self.id_count = grow(self.id_count, n)
+        self.id_mean = grow(self.id_mean, n)
+        self.id_m2 = grow(self.id_m2, n)
+
+        merge_moments(self.id_count, self.id_mean, self.id_m2, slots, losses)
+
+    def _refresh_id_thresholds(self):
+        """mean + sigma * std per ID; NaN (→ global threshold) for IDs with too few samples"""
+        n = len(self.ids)
+        count = self.id_count[:n]
+        mean = self.id_mean[:n]
+        std = np.sqrt(self.id_m2[:n] / np.maximum(count - 1, 1))
+        # IDs whose loss is almost constant would otherwise get a threshold right at the mean
+        std = np.maximum(std, 0.1 * mean)
+        threshold = mean + self.sigma * std
+        threshold[count < self.min_samples] = np.nan
+        self.id_threshold = threshold.astype(np.float32)
+
+    def id_state(self):
+        """Per-ID loss statistics as NumPy arrays (for checkpoints)"""
+        n = len(self.ids)
+        return {
+            "id_table": self.ids.to_array().astype(np.int64),
+            "id_count": self.id_count[:n].copy(),
+            "id_mean": self.id_mean[:n].copy(),
+            "id_m2": self.id_m2[:n].copy(),
+        }
+
+    def load_id_state(self, state):
+        self._reset_id_stats()
+        if state.get("id_table") is not None:
+            self.ids = IdTable(np.asarray(state["id_table"]).tolist())
+            self.id_count = np.array(state["id_count"], dtype=np.int64)
+            self.id_mean = np.array(state["id_mean"], dtype=np.float64)
+            self.id_m2 = np.array(state["id_m2"], dtype=np.float64)
+        self._refresh_id_thresholds()
+
+    def threshold_for(self, arb_id):
+        if self.per_id_thresholds:
+            slot = self.ids.get(arb_id)
+            if slot >= 0:
+                threshold = self.id_threshold[slot]
+                if threshold == threshold:  # not NaN
+                    return float(threshold)
+        return self.threshold
+
+    def thresholds_for(self, ids):
+        """Vectorised threshold_for() for an array of arbitration IDs"""
+        thresholds = np.full(len(ids), self.threshold, dtype=np.float32)
+        if self.per_id_thresholds and len(self.ids):
+            slots = self.ids.get_batch(ids)
+            known = slots >= 0
+            per_id = self.id_threshold[slots[known]]
+            thresholds[known] = np.where(np.isnan(per_id), self.threshold, per_id)
+        return thresholds
@@ -0,0 +1,128 @@
+import json
+import os
+
+
+def frame_record(msg, result):
+    return {
+        "timestamp": msg.timestamp,
+        "channel": None if msg.channel is None else str(msg.channel),
+        "id": msg.arbitration_id,
+        "dlc": msg.dlc,
+        "data": msg.data.hex(" ").upper(),
+        "ai": result.ai,
+        "loss": result.loss,
+        "heur": "; ".join(result.heur),
+    }
+
+
+def event_record(timestamp, findings):
+    """Findings without a frame, e.g. IDs that went silent"""
+    return {"timestamp": timestamp, "channel": None, "id": None, "dlc": None, "data": None,
+            "ai": False, "loss": 0.0, "heur": "; ".join(findings)}
+
+
+def incident_record(incident):
+    """fusion.Incident; written once per drain in which it changed"""
+    return {
+        "incident": incident.number,
+        "id": incident.arb_id,
+        "rule": incident.rule,
+        "first_seen": incident.first_seen,
+        "last_seen": incident.last_seen,
+        "count": incident.count,
+        "risk": incident.risk,
+        "reason": incident.reason,
+        "closed": incident.closed,
+    }
+
+
+class JsonlSink:
+    """One JSON object per line; records are buffered and written in chunks"""
+
+    def __init__(self, path, buffer_rows=1024):
+        self.path = path
+        self.buffer_rows = buffer_rows
+        self.rows = []
+        self.written = 0
+        self.file = open(path, "w", encoding="utf-8", buffering=1 << 20)
+
+    def write(self, record):
+        self.rows.append(json.dumps(record, ensure_ascii=False))
+        if len(self.rows) >= self.buffer_rows:
+            self._write_rows()
+
+    def _write_rows(self):
+        if self.rows:
+            self.file.write("\n".join(self.rows) + "\n")
+            self.written += len(self.rows)
+            self.rows = []
+
+    def flush(self):
+        self._write_rows()
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class ParquetSink:
+    """Records are collected in columns and written as one Parquet row group per `row_group` rows"""
+
+    COLUMNS = ("timestamp", "channel", "id", "dlc", "data", "ai", "loss", "heur")
+    INCIDENT_COLUMNS = ("incident", "id", "rule", "first_seen", "last_seen", "count", "risk", "reason", "closed")
+
+    def __init__(self, path, row_group=65536, incidents=False):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Zapis do Parquet wymaga pakietu pyarrow (pip install pyarrow).") from None
+        self.pa = pa
+        self.path = path
+        self.row_group = row_group
+        if incidents:
+            self.names = self.INCIDENT_COLUMNS
+            self.schema = pa.schema([
+                ("incident", pa.int64()), ("id", pa.uint32()), ("rule", pa.uint8()), ("first_seen", pa.float64()),
+                ("last_seen", pa.float64()), ("count", pa.int64()), ("risk", pa.float64()),
+                ("reason", pa.string()), ("closed", pa.bool_()),
+            ])
+        else:
+            self.names = self.COLUMNS
+            self.schema = pa.schema([
+                ("timestamp", pa.float64()), ("channel", pa.string()), ("id", pa.uint32()),
+                ("dlc", pa.uint8()), ("data", pa.string()), ("ai", pa.bool_()),
+                ("loss", pa.float32()), ("heur", pa.string()),
+            ])
+        self.writer = pq.ParquetWriter(path, self.schema)
+        self.columns = {name: [] for name in self.names}
+        self.pending = 0
+        self.written = 0
+
+    def write(self, record):
+        for name, values in self.columns.items():
+            values.append(record[name])
+        self.pending += 1
+        if self.pending >= self.row_group:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        self.writer.write_table(self.pa.table(self.columns, schema=self.schema))
+        self.written += self.pending
+        self.pending = 0
+        self.columns = {name: [] for name in self.names}
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+def open_sink(path, fmt=None, incidents=False):
+    """JSONL or Parquet sink, chosen by `fmt` or by the file extension; `incidents` selects incident records"""
+    fmt = fmt or ("parquet" if os.path.splitext(path)[1].lower() in (".parquet", ".pq") else "jsonl")
+    if fmt == "parquet":
+        return ParquetSink(path, incidents=incidents)
+    return JsonlSink(path)
@@ -0,0 +1,57 @@
+import can
+import numpy as np
+import pytest
+
+from anomaly_engine import AnomalyEngine
+
+
+def traffic(count=300, seed=0):
+    rng = np.random.default_rng(seed)
+    return [can.Message(timestamp=i * 0.05, arbitration_id=int(rng.choice([0x100, 0x18FECA00, 0x18FEF100])),
+                        is_extended_id=True, data=rng.integers(0, 256, 8, dtype=np.uint8).tobytes())
+            for i in range(count)]
+
+
+def test_evaluate_feeds_fusion_like_evaluate_batch():
+    messages = traffic()
+    single = AnomalyEngine(use_ai=False)
+    batch = AnomalyEngine(use_ai=False)
+    single.enable_fusion()
+    batch.enable_fusion()
+
+    risk = [single.evaluate(msg).risk for msg in messages]
+    expected = [result.risk for result in batch.evaluate_batch(messages)]
+
+    assert max(risk) > 0.0
+    assert risk == pytest.approx(expected)
+    assert single.fusion.stats() == batch.fusion.stats()
+
+
+def cyclic(count, start=0.0, seed=0):
+    """Clean cyclic traffic: three IDs every 10 ms with a slow signal and a noisy one (bit rises on most frames)"""
+    noise = np.random.default_rng(seed).integers(0, 256, count).tolist()
+    return [can.Message(timestamp=start + i * 0.01 / 3, arbitration_id=0x18FEF100 + i % 3, is_extended_id=True,
+                        data=bytes([(i // 300) % 256, 0x10 * (i % 3), noise[i], 0, 0xFF, 0xFF, 0xFF, 0xFF]))
+            for i in range(count)]
+
+
+def test_online_learning_updates_on_clean_traffic():
+    pytest.importorskip("torch")
+    engine = AnomalyEngine()
+    engine.ai.train(cyclic(6000), epochs=2)
+    engine.heuristic.learn_stream(cyclic(6000))
+    online = engine.enable_online(interval=3600.0, min_frames=5000)
+    try:
+        messages = cyclic(10000, start=20.0)
+        for i in range(0, len(messages), 1000):
+            engine.evaluate_batch(messages[i:i + 1000])
+        assert online.update()
+        assert online.stats()["updates"] == 1
+    finally:
+        engine.disable_online()
+
+
+def test_online_learning_needs_a_trained_model():
+    pytest.importorskip("torch")
+    with pytest.raises(RuntimeError):
+        AnomalyEngine(scorer="numpy").enable_online()
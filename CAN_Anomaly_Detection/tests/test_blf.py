@@ -0,0 +1,95 @@
+import gzip
+
+import can
+import numpy as np
+import pytest
+
+import blf
+from frames import FrameBlock
+
+
+def fields(msg):
+    return (msg.timestamp, msg.arbitration_id, msg.is_extended_id, msg.is_remote_frame, msg.is_error_frame,
+            msg.is_fd, msg.bitrate_switch, msg.error_state_indicator, msg.is_rx, msg.channel, msg.dlc,
+            bytes(msg.data))
+
+
+def traffic(count=30000, seed=0):
+    """Classic, remote, CAN FD and error frames on two channels, enough for many containers"""
+    rng = np.random.default_rng(seed)
+    messages = []
+    for i in range(count):
+        timestamp = 1.7e9 + i * 0.0005
+        kind = i % 50
+        if kind == 7:
+            messages.append(can.Message(timestamp=timestamp, arbitration_id=0x123, is_extended_id=False,
+                                        is_remote_frame=True, dlc=8, channel=1))
+        elif kind == 13:
+            messages.append(can.Message(timestamp=timestamp, arbitration_id=0x18DA00F1, is_fd=True,
+                                        bitrate_switch=True, data=rng.integers(0, 256, 32, dtype=np.uint8).tobytes(),
+                                        channel=2))
+        elif kind == 29:
+            messages.append(can.Message(timestamp=timestamp, is_error_frame=True, channel=1))
+        else:
+            length = int(rng.integers(0, 9))
+            messages.append(can.Message(timestamp=timestamp, arbitration_id=int(rng.integers(0, 0x1FFFFFFF)),
+                                        data=rng.integers(0, 256, length, dtype=np.uint8).tobytes(),
+                                        is_rx=bool(i % 3), channel=1 + i % 2))
+    return messages
+
+
+@pytest.fixture(scope="module", params=[-1, 0], ids=["zlib", "uncompressed"])
+def log(request, tmp_path_factory):
+    path = tmp_path_factory.mktemp("blf") / "log.blf"
+    with can.BLFWriter(str(path), compression_level=request.param) as writer:
+        for msg in traffic():
+            writer.on_message_received(msg)
+    return str(path)
+
+
+def reference(path):
+    with can.BLFReader(path) as reader:
+        return [fields(msg) for msg in reader]
+
+
+def test_read_messages_matches_python_can(log):
+    expected = reference(log)
+    assert len(expected) == 30000
+    assert [fields(msg) for msg in blf.read_messages(log)] == expected
+
+
+def test_read_messages_in_processes_matches_python_can(log):
+    assert [fields(msg) for msg in blf.read_messages(log, processes=2)] == reference(log)
+
+
+def test_read_batches_cover_the_log(log):
+    batches = list(blf.read_batches(log))
+    assert len(batches) > 1
+    assert [fields(msg) for batch in batches for msg in batch] == reference(log)
+
+
+def test_gzip_stream_is_read_without_seeking(log, tmp_path):
+    compressed = tmp_path / "log.blf.gz"
+    with open(log, "rb") as f:
+        compressed.write_bytes(gzip.compress(f.read()))
+    messages = blf.read_messages(str(compressed), opener=lambda path: gzip.open(path, "rb"))
+    assert [fields(msg) for msg in messages] == reference(log)
+
+
+@pytest.mark.parametrize("size", [1000, 65536])
+def test_read_blocks_match_messages(log, size):
+    with can.BLFReader(log) as reader:
+        messages = list(reader)
+    blocks = list(blf.read_blocks(log, size))
+    assert all(len(block) <= size for block in blocks)
+    expected = FrameBlock.from_messages(messages)
+    for name in FrameBlock.__slots__:
+        assert np.array_equal(np.concatenate([getattr(block, name) for block in blocks]), getattr(expected, name))
+
+
+def test_read_range_of_containers(log):
+    containers = blf.scan_containers(log)
+    assert len(containers) > 2
+    whole = [fields(msg) for msg in blf.read_range(log, 0, len(containers), containers)]
+    parts = [fields(msg) for k in range(len(containers)) for msg in blf.read_range(log, k, k + 1, containers)]
+    assert parts == whole == reference(log)
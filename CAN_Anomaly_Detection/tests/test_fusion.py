@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+
+from findings import RULE_BIT_RISE, RULE_PERIOD_FAST, RULE_TIMEOUT
+from fusion import IncidentTable, RiskScore
+
+
+def reference_risk(timestamps, ids, contributions, half_life):
+    """r(t_i) = Σ c_j 2^(-(t_i - t_j) / half_life) over the earlier frames j of the same ID, frame by frame"""
+    state = {}
+    risk = []
+    for t, arb_id, c in zip(timestamps.tolist(), ids.tolist(), contributions.tolist()):
+        r, last = state.get(arb_id, (0.0, t))
+        r = r * 2 ** (-(t - last) / half_life) + c
+        state[arb_id] = (r, t)
+        risk.append(r)
+    return np.array(risk), state
+
+
+@pytest.mark.parametrize("block_size", [1, 7, 1000])
+def test_risk_matches_the_definition(block_size):
+    rng = np.random.default_rng(0)
+    n = 1000
+    timestamps = 1.7e9 + np.cumsum(rng.exponential(0.5, n))
+    ids = rng.integers(0, 5, n).astype(np.uint32)
+    contributions = np.where(rng.random(n) < 0.3, rng.uniform(0.0, 3.0, n), 0.0)
+    score = RiskScore(half_life=10.0)
+    risk = np.concatenate([score.update(timestamps[i:i + block_size], ids[i:i + block_size],
+                                        contributions[i:i + block_size]) for i in range(0, n, block_size)])
+    expected, state = reference_risk(timestamps, ids, contributions, 10.0)
+    np.testing.assert_allclose(risk, expected, rtol=1e-9, atol=1e-12)
+
+    now = timestamps[-1] + 10.0
+    current_ids, current = score.current(now)
+    for arb_id, value in zip(current_ids.tolist(), current.tolist()):
+        r, last = state[arb_id]
+        assert value == pytest.approx(r * 2 ** (-(now - last) / 10.0), rel=1e-9, abs=1e-12)
+
+
+def test_risk_halves_every_half_life():
+    score = RiskScore(half_life=2.0)
+    score.update(np.array([100.0]), np.array([7], dtype=np.uint32), np.array([4.0]))
+    assert score.current(102.0)[1][0] == pytest.approx(2.0)
+    assert score.current(104.0)[1][0] == pytest.approx(1.0)
+
+
+def test_risk_survives_long_gaps():
+    score = RiskScore(half_life=1.0)
+    timestamps = np.array([0.0, 5000.0, 5000.5])
+    risk = score.update(timestamps, np.zeros(3, dtype=np.uint32), np.array([1.0, 1.0, 1.0]))
+    np.testing.assert_allclose(risk, [1.0, 1.0, 1.0 + 2 ** -0.5])
+
+
+def add(table, times, arb_id=0x100, rule=RULE_BIT_RISE, risk=1.0):
+    times = np.asarray(times, dtype=np.float64)
+    n = len(times)
+    table.add(times, np.full(n, arb_id, dtype=np.uint32), np.full(n, rule, dtype=np.uint8),
+              np.zeros(n, dtype=np.int8), np.ones(n, dtype=np.uint8), np.zeros(n), np.full(n, risk))
+
+
+def test_findings_within_the_gap_are_one_incident():
+    table = IncidentTable(gap=5.0)
+    add(table, [0.0, 1.0, 2.0])
+    add(table, [4.0, 6.0], risk=3.0)
+    (incident,) = table.drain()
+    assert (incident.first_seen, incident.last_seen, incident.count, incident.risk, incident.closed) == \
+        (0.0, 6.0, 5, 3.0, False)
+    assert table.drain() == []
+
+
+def test_a_gap_closes_the_incident_and_opens_a_new_one():
+    table = IncidentTable(gap=5.0)
+    add(table, [0.0, 1.0, 20.0, 21.0])
+    first, second = table.drain()
+    assert first.closed and (first.first_seen, first.last_seen, first.count) == (0.0, 1.0, 2)
+    assert not second.closed and (second.first_seen, second.count) == (20.0, 2)
+    assert second.number > first.number
+
+
+def test_keys_are_separate_and_close_reports_once():
+    table = IncidentTable(gap=5.0)
+    add(table, [0.0], rule=RULE_TIMEOUT)
+    add(table, [0.0], rule=RULE_PERIOD_FAST, risk=2.0)
+    add(table, [1.0], arb_id=0x200)
+    assert len(table.drain()) == 3
+    assert [incident.rule for incident in table.active()][0] == RULE_PERIOD_FAST
+    table.close(10.0)
+    drained = table.drain()
+    assert len(drained) == 3 and all(incident.closed for incident in drained)
+    assert table.active() == [] and table.drain() == []
+
+
+def test_full_table_overwrites_closed_incidents_first():
+    table = IncidentTable(capacity=2, gap=1.0)
+    add(table, [0.0], arb_id=1)
+    table.close(5.0)
+    table.drain()
+    add(table, [6.0], arb_id=2)
+    add(table, [7.0], arb_id=3)
+    assert table.evicted == 1
+    assert sorted(incident.arb_id for incident in table.active()) == [2, 3]
+    add(table, [8.0], arb_id=4)
+    # No closed incident left: the open one seen least recently goes
+    assert sorted(incident.arb_id for incident in table.active()) == [3, 4]
+    assert len(table) == 2
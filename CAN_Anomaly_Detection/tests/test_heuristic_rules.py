@@ -0,0 +1,78 @@
+import can
+import numpy as np
+import pytest
+
+from frames import FrameBlock, payload_lengths
+from heuristic_rules import MAX_PAYLOAD, HeuristicEngine
+
+
+def frame(timestamp, data=b"", arb_id=0x18FEF100, **kwargs):
+    return can.Message(timestamp=timestamp, arbitration_id=arb_id, is_extended_id=True, data=data, **kwargs)
+
+
+def per_frame(messages):
+    engine = HeuristicEngine()
+    return [engine.check(msg).records() for msg in messages]
+
+
+def batched(messages, block_size):
+    engine = HeuristicEngine()
+    results = []
+    for i in range(0, len(messages), block_size):
+        chunk = messages[i:i + block_size]
+        block = FrameBlock.from_messages(chunk, MAX_PAYLOAD)
+        results.extend(findings.records() for findings in engine.check_batch(block, payload_lengths(chunk)))
+    return results
+
+
+REMOTE = [frame(0.0, b"\x00" * 8), frame(0.1, is_remote_frame=True, dlc=8), frame(0.2, b"\xff" * 8)]
+
+MIXED_DLC = [frame(0.1 * i, bytes([i * 37 % 256] * (i % 3 * 3 + 2)), 0x100 + i % 2) for i in range(12)]
+
+FD = [frame(0.0, b"\x00" * 64, is_fd=True), frame(0.1, b"\x00" * 8 + b"\x0f" * 56, is_fd=True),
+      frame(0.2, b"\x01" * 12, is_fd=True), frame(0.3, b"\xff" * 12, is_fd=True)]
+
+
+def random_traffic(seed=0, count=400):
+    rng = np.random.default_rng(seed)
+    messages = []
+    for i in range(count):
+        arb_id = int(rng.choice([0x18FEF100, 0x18FECA00, 0x0CF00400, 0x123]))
+        kind = rng.integers(0, 4)
+        timestamp = i * 0.01 + float(rng.uniform(0, 0.5))
+        if kind == 0:
+            messages.append(frame(timestamp, arb_id=arb_id, is_remote_frame=True, dlc=int(rng.integers(0, 9))))
+        elif kind == 1:
+            length = int(rng.choice([12, 16, 20, 24, 32, 48, 64]))
+            messages.append(frame(timestamp, rng.integers(0, 256, length, dtype=np.uint8).tobytes(), arb_id,
+                                  is_fd=True))
+        else:
+            length = int(rng.integers(0, 9))
+            messages.append(frame(timestamp, rng.integers(0, 256, length, dtype=np.uint8).tobytes(), arb_id))
+    messages.sort(key=lambda msg: msg.timestamp)
+    return messages
+
+
+@pytest.mark.parametrize("messages", [REMOTE, MIXED_DLC, FD, random_traffic()], ids=["remote", "mixed-dlc", "fd",
+                                                                                     "random"])
+@pytest.mark.parametrize("block_size", [1, 3, 64])
+def test_check_batch_matches_check(messages, block_size):
+    assert batched(messages, block_size) == per_frame(messages)
+
+
+def test_remote_frame_does_not_raise_bit_rise():
+    assert [len(records) for records in per_frame(REMOTE)] == [0, 0, 0]
+
+
+def test_fd_rises_past_byte_eight_are_found():
+    assert len(batched(FD, 4)[1]) == 56
+
+
+def test_evaluate_batch_matches_evaluate():
+    from anomaly_engine import AnomalyEngine
+
+    messages = random_traffic(seed=1)
+    single = AnomalyEngine(use_ai=False)
+    batch = AnomalyEngine(use_ai=False)
+    expected = [single.evaluate(msg).heur.records() for msg in messages]
+    assert [result.heur.records() for result in batch.evaluate_batch(messages)] == expected
@@ -0,0 +1,22 @@
+import can
+import numpy as np
+
+from anomaly_engine import AnomalyEngine
+from history import FrameHistory
+
+
+def test_reasons_are_formatted_from_stored_columns():
+    rng = np.random.default_rng(0)
+    messages = [can.Message(timestamp=i * 0.01, arbitration_id=0x18FECA00 if i % 50 == 0 else 0x100 + i % 5,
+                            is_extended_id=True, data=rng.integers(0, 256, 8, dtype=np.uint8).tobytes())
+                for i in range(1000)]
+    engine = AnomalyEngine(use_ai=False)
+    history = FrameHistory()
+    expected = []
+    for i in range(0, len(messages), 256):
+        results = engine.evaluate_batch(messages[i:i + 256])
+        expected += ["; ".join(result.heur) for result in results]
+        history.append_batch(messages[i:i + 256], results)
+
+    assert [history.reasons(row) for row in range(len(history))] == expected
+    assert [history.row_values(row)[-1] for row in range(len(history))] == expected
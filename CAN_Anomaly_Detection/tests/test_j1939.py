@@ -0,0 +1,80 @@
+from heuristic_rules import HeuristicEngine
+from j1939 import DM1_PGN, TP_ABORT, TP_BAM, TP_RTS, TransportReassembler, dm1_dtcs
+
+SOURCE = 0x21
+BAM_CM = 0x1CECFF00 | SOURCE
+BAM_DT = 0x1CEBFF00 | SOURCE
+
+
+def announce(size, control=TP_BAM, pgn=DM1_PGN):
+    packets = (size + 6) // 7
+    return bytes([control, size & 0xFF, size >> 8, packets, 0xFF, pgn & 0xFF, (pgn >> 8) & 0xFF, pgn >> 16])
+
+
+def packets(payload):
+    padded = payload + b"\xff" * (-len(payload) % 7)
+    return [bytes([seq]) + padded[7 * (seq - 1):7 * seq] for seq in range(1, len(padded) // 7 + 1)]
+
+
+DM1_PAYLOAD = bytes([0x00, 0xFF, 0x64, 0x00, 0x03, 0x01, 0xBE, 0x00, 0x04, 0x02, 0xFF, 0xFF])
+
+
+def test_bam_reassembly():
+    transport = TransportReassembler()
+    assert transport.feed(BAM_CM, announce(len(DM1_PAYLOAD)), 0.0) is None
+    results = [transport.feed(BAM_DT, chunk, 0.05 * (i + 1)) for i, chunk in enumerate(packets(DM1_PAYLOAD))]
+    assert results[:-1] == [None]
+    assert results[-1] == (DM1_PGN, SOURCE, DM1_PAYLOAD)
+    assert dm1_dtcs(results[-1][2]) == [(100, 3, 1), (190, 4, 2)]
+    assert (transport.completed, transport.errors, transport.sessions) == (1, 0, {})
+
+
+def test_rts_cts_session_is_keyed_by_destination():
+    transport = TransportReassembler()
+    destination = 0x00
+    transport.feed(0x1CEC0000 | (destination << 8) | SOURCE, announce(len(DM1_PAYLOAD), TP_RTS), 0.0)
+    results = [transport.feed(0x1CEB0000 | (destination << 8) | SOURCE, chunk, 0.01)
+               for chunk in packets(DM1_PAYLOAD)]
+    assert results[-1] == (DM1_PGN, SOURCE, DM1_PAYLOAD)
+
+
+def test_sequence_error_and_abort_count_as_errors():
+    transport = TransportReassembler()
+    transport.feed(BAM_CM, announce(len(DM1_PAYLOAD)), 0.0)
+    assert transport.feed(BAM_DT, packets(DM1_PAYLOAD)[1], 0.01) is None
+    assert transport.errors == 1 and not transport.sessions
+
+    transport.feed(BAM_CM, announce(len(DM1_PAYLOAD)), 1.0)
+    transport.feed(0x1CECFF00 | SOURCE, bytes([TP_ABORT]) + b"\xff" * 7, 1.01)
+    assert transport.errors == 2 and not transport.sessions
+
+
+def test_late_packet_times_out():
+    transport = TransportReassembler(timeout_s=0.75)
+    transport.feed(BAM_CM, announce(len(DM1_PAYLOAD)), 0.0)
+    assert transport.feed(BAM_DT, packets(DM1_PAYLOAD)[0], 1.0) is None
+    assert transport.errors == 1 and not transport.sessions
+
+
+def test_expire_drops_abandoned_sessions():
+    transport = TransportReassembler(timeout_s=0.75)
+    transport.feed(BAM_CM, announce(len(DM1_PAYLOAD)), 0.0)
+    transport.feed(BAM_DT, packets(DM1_PAYLOAD)[0], 0.1)
+    assert transport.expire(0.5) == 0
+    assert transport.expire(1.0) == 1
+    assert transport.errors == 1 and not transport.sessions and transport.keys.count(None) == len(transport.keys)
+
+
+def test_heuristic_poll_expires_transport_sessions():
+    engine = HeuristicEngine()
+    engine.transport.feed(BAM_CM, announce(len(DM1_PAYLOAD)), 0.0)
+    engine.poll(10.0)
+    assert engine.transport.errors == 1 and not engine.transport.sessions
+
+
+def test_full_pool_evicts_the_least_recently_active_session():
+    transport = TransportReassembler(max_sessions=2)
+    for source in range(3):
+        transport.feed(0x1CECFF00 | source, announce(len(DM1_PAYLOAD)), float(source))
+    assert set(transport.sessions) == {(1, 0xFF), (2, 0xFF)}
+    assert transport.errors == 1
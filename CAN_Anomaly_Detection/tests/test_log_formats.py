@@ -0,0 +1,119 @@
+import gzip
+import shutil
+
+import can
+import numpy as np
+import pytest
+
+import log_formats
+from can_input import CANReader
+
+MESSAGES = [can.Message(timestamp=1.7e9 + i * 0.01, arbitration_id=0x18FEF100 + i % 3, is_extended_id=True,
+                        data=bytes([i % 256] * 8), channel=0) for i in range(3000)]
+
+# extension → format written by can.Logger
+LOGGER_FORMATS = {"blf": "blf", "asc": "asc", "trc": "trc", "log": "candump", "csv": "csv"}
+
+
+def same_frames(messages, relative=False):
+    """Frames equal to MESSAGES (ASC keeps times relative to the start of the log)"""
+    offset = MESSAGES[0].timestamp if relative else 0.0
+    return len(messages) == len(MESSAGES) and all(
+        got.arbitration_id == msg.arbitration_id and bytes(got.data) == bytes(msg.data)
+        and abs(got.timestamp - (msg.timestamp - offset)) < 1e-3 for got, msg in zip(messages, MESSAGES))
+
+
+@pytest.fixture(scope="module", params=sorted(LOGGER_FORMATS))
+def logs(request, tmp_path_factory):
+    """The same log as plain file, .gz and compressed without a telling extension"""
+    ext = request.param
+    directory = tmp_path_factory.mktemp(ext)
+    plain = directory / f"log.{ext}"
+    with can.Logger(str(plain)) as logger:
+        for msg in MESSAGES:
+            logger.on_message_received(msg)
+    compressed = directory / f"log.{ext}.gz"
+    with open(plain, "rb") as f, gzip.open(compressed, "wb") as g:
+        shutil.copyfileobj(f, g)
+    anonymous = directory / "log.bin"
+    shutil.copy(compressed, anonymous)
+    return LOGGER_FORMATS[ext], [str(plain), str(compressed), str(anonymous)]
+
+
+def test_format_is_detected_by_content(logs):
+    fmt, paths = logs
+    assert [log_formats.detect_format(path) for path in paths] == [fmt] * 3
+
+
+def test_every_variant_reads_the_same_frames(logs):
+    fmt, paths = logs
+    for path in paths:
+        assert same_frames(list(CANReader(source="file", filepath=path).read()), relative=fmt == "asc")
+
+
+def test_batches_and_blocks_cover_the_log(logs):
+    fmt, paths = logs
+    for path in paths:
+        reader = CANReader(source="file", filepath=path)
+        batches = list(reader.batches(700))
+        assert [len(batch) for batch in batches] == [700, 700, 700, 700, 200]
+        blocks = list(CANReader(source="file", filepath=path).blocks(1000))
+        assert sum(len(block) for block in blocks) == len(MESSAGES)
+        assert np.array_equal(np.concatenate([block.arbitration_id for block in blocks]),
+                              [msg.arbitration_id for msg in MESSAGES])
+
+
+@pytest.mark.parametrize("name, text, fmt, expected", [
+    ("dump.txt", "  can0  18FEF100   [8]  01 02 03 04 05 06 07 08\n  can0  123   [2]  AA BB\n", "candump-text",
+     [(0.0, 0x18FEF100, True, b"\x01\x02\x03\x04\x05\x06\x07\x08"), (1.0, 0x123, False, b"\xaa\xbb")]),
+    ("dumpt.txt", " (1700000000.100000)  can0  18FEF100   [8]  01 02 03 04 05 06 07 08\n", "candump-text",
+     [(1700000000.1, 0x18FEF100, True, b"\x01\x02\x03\x04\x05\x06\x07\x08")]),
+    ("logger.csv", "Timestamp,ID,Data\n1.5,0x18fef100,0102030405060708\n", "logger-csv",
+     [(1.5, 0x18FEF100, True, b"\x01\x02\x03\x04\x05\x06\x07\x08")]),
+    ("ids.csv", "0x18fef100\n0x123\n", "id-csv", [(0.0, 0x18FEF100, True, b""), (1.0, 0x123, False, b"")]),
+])
+def test_own_text_formats(tmp_path, name, text, fmt, expected):
+    path = tmp_path / name
+    path.write_text(text)
+    assert log_formats.detect_format(str(path)) == fmt
+    messages = list(log_formats.read_messages(str(path)))
+    assert [(msg.timestamp, msg.arbitration_id, msg.is_extended_id, bytes(msg.data)) for msg in messages] == expected
+
+
+def test_remote_request_in_candump_text(tmp_path):
+    path = tmp_path / "dump.txt"
+    path.write_text("  can0  123   [4]  remote request\n")
+    (msg,) = log_formats.read_messages(str(path))
+    assert msg.is_remote_frame and msg.dlc == 4 and not msg.data
+
+
+def test_sniff_binary_headers():
+    assert log_formats.sniff(b"LOGG" + b"\x00" * 140) == "blf"
+    assert log_formats.sniff(b"MDF     4.10    ") == "mf4"
+    assert log_formats.sniff(b"UnFinMF 4.10    ") == "mf4"
+    assert log_formats.sniff(b"") is None
+
+
+def test_extension_is_the_fallback(tmp_path):
+    path = tmp_path / "empty.log.gz"
+    path.write_bytes(gzip.compress(b""))
+    assert log_formats.detect_format(str(path)) == "candump"
+
+
+def test_unknown_format(tmp_path):
+    path = tmp_path / "junk.xyz"
+    path.write_text("hello\n")
+    with pytest.raises(ValueError):
+        CANReader(source="file", filepath=str(path))
+
+
+def test_compression_by_magic_bytes(tmp_path):
+    plain = tmp_path / "a"
+    plain.write_bytes(b"abc")
+    packed = tmp_path / "b"
+    packed.write_bytes(gzip.compress(b"abc"))
+    zstd = tmp_path / "c"
+    zstd.write_bytes(log_formats.ZSTD_MAGIC + b"\x00" * 8)
+    assert [log_formats.compression_of(str(path)) for path in (plain, packed, zstd)] == [None, "gzip", "zstd"]
+    with log_formats.open_binary(str(packed)) as f:
+        assert f.read() == b"abc"
@@ -0,0 +1,105 @@
+import numpy as np
+
+from id_table import grow, merge_moments
+
+MIN_SAMPLES = 20      # intervals needed before an ID's period is trusted
+SIGMA = 5.0           # allowed deviation in standard deviations of the jitter
+MIN_JITTER = 0.05     # jitter floor as a fraction of the period (simulated buses have none)
+MAX_CV = 0.5          # std/mean above this → event driven ID, not checked
+MAX_PERIOD = 10.0     # seconds; longer gaps (pauses in the log) are not learned
+
+
+class CycleTimeModel:
+    """Learned nominal period and jitter of each arbitration ID.
+
+    Statistics are running moments of the inter-arrival time, kept in flat arrays
+    indexed by the slots of a shared IdTable (O(1) memory per ID). From them every
+    cyclic ID gets a late limit (messages missing) and a fast limit (too short an
+    interval: flooding or a spoofed sender interleaved with the real one).
+    """
+
+    def __init__(self, ids, sigma=SIGMA, min_samples=MIN_SAMPLES):
+        self.ids = ids
+        self.sigma = sigma
+        self.min_samples = min_samples
+        self._reset()
+
+    def _reset(self):
+        self.count = np.zeros(0, dtype=np.int64)
+        self.mean = np.zeros(0, dtype=np.float64)
+        self.m2 = np.zeros(0, dtype=np.float64)
+        self.last = np.zeros(0, dtype=np.float64)  # last timestamp seen while learning
+        self.late = np.zeros(0, dtype=np.float64)  # NaN = ID not checked
+        self.fast = np.zeros(0, dtype=np.float64)
+
+    def ensure_capacity(self, size):
+        if size <= len(self.count):
+            return
+        self.count = grow(self.count, size)
+        capacity = len(self.count)
+        self.mean = grow(self.mean, capacity)
+        self.m2 = grow(self.m2, capacity)
+        self.last = grow(self.last, capacity, fill=np.nan)
+        self.late = grow(self.late, capacity, fill=np.nan)
+        self.fast = grow(self.fast, capacity, fill=np.nan)
+
+    def learn(self, timestamp, slot):
+        """Per-frame learning (Welford update of one ID)"""
+        if slot >= len(self.count):
+            self.ensure_capacity(slot + 1)
+        last = self.last[slot]
+        self.last[slot] = timestamp
+        delta = timestamp - last
+        if not 0.0 < delta <= MAX_PERIOD:  # also False for NaN (first frame)
+            return
+        count = self.count[slot] + 1
+        diff = delta - self.mean[slot]
+        self.mean[slot] += diff / count
+        self.m2[slot] += diff * (delta - self.mean[slot])
+        self.count[slot] = count
+        self._refresh(slice(slot, slot + 1))
+
+    def learn_batch(self, timestamps, slots, order, sorted_slots, first, last):
+        """Vectorised learn() for a block already grouped by ID (see group_by_slot())"""
+        self.ensure_capacity(len(self.ids))
+        prev = np.empty(len(timestamps), dtype=np.float64)
+        prev[order[first]] = self.last[sorted_slots[first]]
+        inner = order[~first]
+        prev[inner] = timestamps[order[np.flatnonzero(~first) - 1]]
+        self.last[sorted_slots[last]] = timestamps[order[last]]
+
+        delta = timestamps - prev
+        with np.errstate(invalid="ignore"):
+            valid = (delta > 0.0) & (delta <= MAX_PERIOD)
+        merge_moments(self.count, self.mean, self.m2, slots[valid], delta[valid])
+        self._refresh(slice(0, len(self.ids)))
+
+    def _refresh(self, window):
+        count = self.count[window]
+        mean = self.mean[window]
+        std = np.sqrt(self.m2[window] / np.maximum(count - 1, 1))
+        checked = (count >= self.min_samples) & (std <= MAX_CV * mean)
+        margin = self.sigma * np.maximum(std, MIN_JITTER * mean)
+        self.late[window] = np.where(checked, mean + margin, np.nan)
+        self.fast[window] = np.where(checked, np.maximum(mean - margin, 0.0), np.nan)
+
+    def period(self, arb_id):
+        """(nominal period, jitter std) of an ID, None if it has no learned period"""
+        slot = self.ids.get(arb_id)
+        if slot < 0 or slot >= len(self.late) or self.late[slot] != self.late[slot]:
+            return None
+        count = self.count[slot]
+        return float(self.mean[slot]), float(np.sqrt(self.m2[slot] / max(count - 1, 1)))
+
+    def state(self):
+        n = len(self.ids)
+        return {"count": self.count[:n], "mean": self.mean[:n], "m2": self.m2[:n]}
+
+    def load_state(self, count, mean, m2):
+        n = len(count)
+        self._reset()
+        self.ensure_capacity(max(n, len(self.ids)))
+        self.count[:n] = count
+        self.mean[:n] = mean
+        self.m2[:n] = m2
+        self._refresh(slice(0, n))
@@ -0,0 +1,151 @@
+# Synthetic J1939 traffic built from the frame definitions (def_CAN_Bus.py), with optional
+# labelled attacks, for benchmarks and detection tests that need known ground truth.
+import can
+import numpy as np
+
+from frames import FrameBlock
+
+# Attack labels (0 = normal frame)
+NORMAL = 0
+INJECTION = 1   # extra frames of an existing ID at a multiple of its rate, random payload
+FUZZING = 2     # payloads of an existing ID replaced by random bytes
+SUSPENSION = 3  # an ID stops transmitting; the first frame after the gap is labelled
+FLOOD = 4       # high-priority frames of an ID that never occurs in normal traffic
+ATTACKS = {"injection": INJECTION, "fuzzing": FUZZING, "suspension": SUSPENSION, "flood": FLOOD}
+
+# Cycle times by J1939 priority: control messages are fast, status messages slow
+FAST_PERIODS = (0.01, 0.02, 0.05)
+SLOW_PERIODS = (0.1, 0.25, 0.5, 1.0)
+FLOOD_ID = 0x00EF00F9  # priority 0, proprietary A PGN, source address not used on the bus
+FLOOD_RATE = 2000      # frames/s, about half of a 500 kbit/s bus
+
+
+class Traffic:
+    """Frames as columns (time ordered) plus the attack label of every frame"""
+
+    def __init__(self, timestamp, arbitration_id, data, label, periods):
+        self.timestamp = timestamp            # float64[n], whole microseconds
+        self.arbitration_id = arbitration_id  # uint32[n]
+        self.data = data                      # uint8[n, 8]
+        self.label = label                    # uint8[n], see ATTACKS
+        self.periods = periods                # {ID: cycle time} of the normal traffic
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def _replace(self, timestamp, arbitration_id, data, label):
+        order = np.argsort(timestamp, kind="stable")
+        return Traffic(timestamp[order], arbitration_id[order], data[order], label[order], self.periods)
+
+    def part(self, start=0, stop=None):
+        """Frames [start, stop) as a Traffic of their own"""
+        rows = slice(start, stop)
+        return Traffic(self.timestamp[rows], self.arbitration_id[rows], self.data[rows], self.label[rows],
+                       self.periods)
+
+    def block(self, start=0, stop=None):
+        rows = slice(start, stop)
+        return FrameBlock(self.timestamp[rows], self.arbitration_id[rows],
+                          np.full(len(self.timestamp[rows]), 8, dtype=np.uint8), self.data[rows])
+
+    def messages(self, start=0, stop=None):
+        data = self.data[start:stop].tobytes()
+        for i, (timestamp, arb_id) in enumerate(zip(self.timestamp[start:stop].tolist(),
+                                                    self.arbitration_id[start:stop].tolist())):
+            yield can.Message(timestamp=timestamp, arbitration_id=arb_id, data=data[8 * i:8 * i + 8],
+                              is_extended_id=True)
+
+    def save(self, path):
+        """Write a log (.blf/.asc/... whatever can.Logger supports)"""
+        with can.Logger(path) as logger:
+            for msg in self.messages():
+                logger.on_message_received(msg)
+
+
+def _encode(signals, times, rng):
+    """Payloads (uint8[n, 8]) with every signal a slow sine plus noise; unused bits are 1 (J1939 'not available')"""
+    payload = np.full(len(times), np.uint64(0xFFFFFFFFFFFFFFFF), dtype=np.uint64)
+    for signal in signals:
+        if signal.start_bit + signal.length > 64:
+            continue
+        top = float((1 << signal.length) - 1)
+        centre = rng.uniform(0.2, 0.8) * top
+        amplitude = rng.uniform(0.05, 0.2) * top
+        value = centre + amplitude * np.sin(2 * np.pi * times / rng.uniform(5.0, 60.0) + rng.uniform(0, 2 * np.pi))
+        value += rng.normal(0.0, max(top * 0.002, 0.3), len(times))
+        raw = np.clip(np.rint(value), 0, top).astype(np.uint64)
+        mask = np.uint64(((1 << signal.length) - 1) << signal.start_bit)
+        payload = (payload & ~mask) | (raw << np.uint64(signal.start_bit))
+    return payload.astype("<u8").view(np.uint8).reshape(-1, 8)
+
+
+def generate(definitions, duration=10.0, ids=40, seed=0, start=0.0, jitter=0.02):
+    """Cyclic traffic of `ids` frame definitions (an int picks that many at random, or a list of IDs).
+
+    Every ID gets a cycle time chosen by its J1939 priority, a random phase and
+    `jitter` (relative) noise on every interval.
+    """
+    rng = np.random.default_rng(seed)
+    if isinstance(ids, int):
+        candidates = sorted(arb_id for arb_id, definition in definitions.items() if definition.signals)
+        ids = rng.choice(candidates, size=min(ids, len(candidates)), replace=False).tolist()
+    periods = {}
+    columns = []
+    for arb_id in ids:
+        fast = (arb_id >> 26) & 0x7 <= 3
+        period = float(rng.choice(FAST_PERIODS if fast else SLOW_PERIODS))
+        periods[arb_id] = period
+        count = int(duration / period)
+        intervals = period * (1.0 + jitter * rng.standard_normal(count))
+        times = start + rng.uniform(0, period) + np.concatenate(([0.0], np.cumsum(intervals[1:])))
+        times = times[times < start + duration]
+        columns.append((times, np.full(len(times), arb_id, dtype=np.uint32),
+                        _encode(definitions[arb_id].signals, times, rng)))
+
+    timestamp = np.round(np.concatenate([c[0] for c in columns]), 6)
+    arbitration_id = np.concatenate([c[1] for c in columns])
+    data = np.concatenate([c[2] for c in columns])
+    order = np.argsort(timestamp, kind="stable")
+    return Traffic(timestamp[order], arbitration_id[order], data[order], np.zeros(len(order), dtype=np.uint8), periods)
+
+
+def add_attack(traffic, kind, start, duration, target=None, rate=10.0, seed=0):
+    """Traffic with one attack of `kind` (see ATTACKS) during [start, start + duration).
+
+    `target` is the attacked ID (random ID of the traffic if None); injection
+    sends `rate` times as many frames as the target normally does, flood sends
+    FLOOD_RATE frames per second.
+    """
+    rng = np.random.default_rng(seed)
+    code = ATTACKS[kind]
+    if target is None:
+        target = int(rng.choice(sorted(traffic.periods)))
+    timestamp, arbitration_id, data, label = (traffic.timestamp.copy(), traffic.arbitration_id.copy(),
+                                              traffic.data.copy(), traffic.label.copy())
+    window = (timestamp >= start) & (timestamp < start + duration)
+    rows = np.flatnonzero(window & (arbitration_id == target))
+
+    if code in (INJECTION, FLOOD):
+        if code == INJECTION:
+            count = int(duration / traffic.periods[target] * rate)
+            arb_id = target
+        else:
+            count = int(duration * FLOOD_RATE)
+            arb_id = FLOOD_ID
+        # Whole microseconds, like the rest of the traffic
+        times = np.round(np.sort(rng.uniform(start, start + duration, count)), 6)
+        timestamp = np.concatenate((timestamp, times))
+        arbitration_id = np.concatenate((arbitration_id, np.full(count, arb_id, dtype=np.uint32)))
+        data = np.concatenate((data, rng.integers(0, 256, (count, 8), dtype=np.uint8)))
+        label = np.concatenate((label, np.full(count, code, dtype=np.uint8)))
+    elif code == FUZZING:
+        data[rows] = rng.integers(0, 256, (len(rows), 8), dtype=np.uint8)
+        label[rows] = code
+    elif code == SUSPENSION:
+        after = np.flatnonzero((timestamp >= start + duration) & (arbitration_id == target))
+        if len(after):
+            label[after[0]] = code
+        keep = np.ones(len(timestamp), dtype=bool)
+        keep[rows] = False
+        timestamp, arbitration_id, data, label = timestamp[keep], arbitration_id[keep], data[keep], label[keep]
+    return traffic._replace(timestamp, arbitration_id, data, label)